@@ -0,0 +1,184 @@
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional
+
+import pydest
+from aiohttp import web
+
+
+# 벤치마크용 가짜 활동 hash (manifest 없이 ActivityTable 에 바로 넣어서 사용)
+ACTIVITIES = {
+    1000 + i: (f"유형 {i % 5}", f"활동 {i}") for i in range(50)
+}
+ACTIVITIES[999] = ("", "")     # 궤도
+MODES = {2000 + i: f"모드 {i}" for i in range(10)}
+
+
+class FakeBungie:
+    """ClanUtil 이 사용하는 번지 API 엔드포인트를 흉내내는 로컬 aiohttp 서버
+
+    clans: {group_id: 클랜원 수}
+    latency: 응답 지연 (초), jitter 만큼 무작위로 더함
+    throttle_rate: 요청 제한 오류(ErrorCode 36) 응답 비율
+    error_rate: error_code 오류 응답 비율
+    """
+    def __init__(self, clans: Dict[int, int], latency: float = 0.0, jitter: float = 0.0, throttle_rate: float = 0.0,
+                 error_rate: float = 0.0, error_code: int = 5, online_ratio: float = 0.2, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.online_ratio = online_ratio
+        self.random = random.Random(seed)
+        self.requests: Dict[str, int] = {}
+        self._next_id = 4611686018400000000
+        self.members: Dict[int, List[dict]] = {gid: [self._new_member() for _ in range(size)] for gid, size in clans.items()}
+        self._urls = None
+        self._runner: Optional[web.AppRunner] = None
+        self.base_url = ""
+
+    # 가짜 데이터
+    def _new_member(self) -> dict:
+        self._next_id += 1
+        membership_id = str(self._next_id)
+        name = f"Guardian{self._next_id % 1000000}"
+        return {
+            "memberType": self.random.choice((1, 2, 2, 2, 3)),
+            "isOnline": self.random.random() < self.online_ratio,
+            "lastOnlineStatusChange": str(int(time.time()) - self.random.randint(0, 90 * 86400)),
+            "groupId": "0",
+            "destinyUserInfo": {
+                "membershipId": membership_id,
+                "membershipType": 3,
+                "crossSaveOverride": 0,
+                "LastSeenDisplayName": name,
+                "bungieGlobalDisplayName": name,
+                "bungieGlobalDisplayNameCode": self.random.randint(0, 9999),
+            },
+            "bungieNetUserInfo": {
+                "membershipId": str(self._next_id + 10 ** 17),
+                "membershipType": 254,
+                "displayName": name,
+            },
+        }
+
+    def churn(self, group_id: int, joined: int = 0, left: int = 0, renamed: int = 0, online_flip: int = 0):
+        """클랜원 가입/탈퇴/이름 변경/접속 상태 변경"""
+        members = self.members[group_id]
+        for _ in range(min(left, len(members))):
+            members.pop(self.random.randrange(len(members)))
+        members.extend(self._new_member() for _ in range(joined))
+        for n in self.random.sample(members, min(renamed, len(members))):
+            n["destinyUserInfo"]["bungieGlobalDisplayNameCode"] = (n["destinyUserInfo"]["bungieGlobalDisplayNameCode"] + 1) % 10000
+        for n in self.random.sample(members, min(online_flip, len(members))):
+            n["isOnline"] = not n["isOnline"]
+            n["lastOnlineStatusChange"] = str(int(time.time()))
+
+    def find(self, membership_id: str) -> Optional[dict]:
+        for members in self.members.values():
+            for n in members:
+                if n["destinyUserInfo"]["membershipId"] == membership_id:
+                    return n
+        return None
+
+    # 응답
+    async def _respond(self, endpoint: str, body) -> web.Response:
+        self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+        delay = self.latency + (self.random.random() * self.jitter if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+        r = self.random.random()
+        if r < self.throttle_rate:
+            return web.json_response({"ErrorCode": 36, "ErrorStatus": "ThrottleLimitExceededMomentarily", "ThrottleSeconds": 0})
+        if r < self.throttle_rate + self.error_rate:
+            return web.json_response({"ErrorCode": self.error_code, "ErrorStatus": "Injected", "ThrottleSeconds": 0})
+        if body is None:
+            return web.json_response({"ErrorCode": 217, "ErrorStatus": "UserCannotBeFound", "ThrottleSeconds": 0})
+        return web.json_response({"Response": body, "ErrorCode": 1, "ErrorStatus": "Success", "ThrottleSeconds": 0})
+
+    async def get_members_of_group(self, request: web.Request) -> web.Response:
+        members = self.members.get(int(request.match_info["group_id"]))
+        body = None if members is None else {"results": members, "totalResults": len(members), "hasMore": False}
+        return await self._respond("GetMembersOfGroup", body)
+
+    async def get_profile(self, request: web.Request) -> web.Response:
+        member = self.find(request.match_info["membership_id"])
+        components = request.query.get("components", "").split(",")
+        body = None
+        if member is not None and "100" in components:
+            # 클랜 목록의 접속 상태 변경 시각보다 조금 앞선 실제 마지막 플레이 시각
+            last_played = int(member["lastOnlineStatusChange"]) - self.random.randint(0, 7 * 86400)
+            body = {"profile": {"data": {"dateLastPlayed": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(last_played))}}}
+        elif member is not None:
+            characters = {}
+            if member["isOnline"]:
+                activity = self.random.choice(list(ACTIVITIES))
+                characters[str(int(member["destinyUserInfo"]["membershipId"]) * 10 + 1)] = {
+                    "dateActivityStarted": "2024-01-01T00:00:00Z",
+                    "currentActivityHash": activity,
+                    "currentActivityModeHash": self.random.choice(list(MODES)),
+                }
+            body = {"characterActivities": {"data": characters}}
+        return await self._respond("GetProfile", body)
+
+    async def search_destiny_player(self, request: web.Request) -> web.Response:
+        name, _, code = request.match_info["name"].rpartition("#")
+        for members in self.members.values():
+            for n in members:
+                info = n["destinyUserInfo"]
+                if info["bungieGlobalDisplayName"] == name and code.isdigit() and info["bungieGlobalDisplayNameCode"] == int(code):
+                    return await self._respond("SearchDestinyPlayer", [dict(info)])
+        # 클랜원이 아닌 유저도 찾을 수 있도록 이름으로 가짜 유저 생성
+        return await self._respond("SearchDestinyPlayer", [{
+            "membershipId": str(abs(hash(name)) % 10 ** 17 + 4611686018000000000), "membershipType": 3,
+            "bungieGlobalDisplayName": name, "bungieGlobalDisplayNameCode": int(code) if code.isdigit() else 0,
+        }])
+
+    async def get_membership_from_hard_linked_credential(self, request: web.Request) -> web.Response:
+        credential = request.match_info["credential"]
+        return await self._respond("GetMembershipFromHardLinkedCredential", {
+            "membershipId": str(int(credential) % 10 ** 17 + 4611686018000000000), "membershipType": 3,
+        })
+
+    async def get_membership_data_by_id(self, request: web.Request) -> web.Response:
+        membership_id = request.match_info["membership_id"]
+        return await self._respond("GetMembershipDataById", {"destinyMemberships": [{
+            "membershipId": membership_id, "membershipType": 3,
+            "bungieGlobalDisplayName": f"Steam{membership_id[-6:]}", "bungieGlobalDisplayNameCode": 1,
+        }]})
+
+    # 서버
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_get("/Platform/GroupV2/{group_id}/Members/", self.get_members_of_group)
+        app.router.add_get("/Platform/Destiny2/SearchDestinyPlayer/{membership_type}/{name}/", self.search_destiny_player)
+        app.router.add_get("/Platform/Destiny2/{membership_type}/Profile/{membership_id}/", self.get_profile)
+        app.router.add_get("/Platform/User/GetMembershipFromHardLinkedCredential/{cr_type}/{credential}/", self.get_membership_from_hard_linked_credential)
+        app.router.add_get("/Platform/User/GetMembershipsById/{membership_id}/{membership_type}/", self.get_membership_data_by_id)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://{host}:{port}/Platform/"
+        self.install()
+
+    def install(self):
+        # pydest 는 요청할 때마다 모듈 상수로 URL 을 만들므로 상수만 바꾸면 됨
+        self._urls = (pydest.api.DESTINY2_URL, pydest.api.USER_URL, pydest.api.GROUP_URL)
+        pydest.api.DESTINY2_URL = self.base_url + "Destiny2/"
+        pydest.api.USER_URL = self.base_url + "User/"
+        pydest.api.GROUP_URL = self.base_url + "GroupV2/"
+
+    def uninstall(self):
+        if self._urls is not None:
+            pydest.api.DESTINY2_URL, pydest.api.USER_URL, pydest.api.GROUP_URL = self._urls
+            self._urls = None
+
+    async def close(self):
+        self.uninstall()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
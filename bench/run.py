@@ -0,0 +1,267 @@
+"""번지 API 대신 로컬 가짜 서버로 주요 기능의 처리 시간과 메모리 할당량 측정
+
+    python -m bench.run --members 100 --churn 5 --latency 0.05 --throttle-rate 0.02
+"""
+import argparse
+import asyncio
+import datetime as dt
+import inspect
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from typing import Awaitable, Callable, List, Optional
+
+import discord
+
+import blocklist
+import bot
+import clans
+import metrics
+from bench.fake_bungie import ACTIVITIES, MODES, FakeBungie
+
+
+logger = logging.getLogger("bench")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="BIG DRIFTER 2 offline benchmark")
+    parser.add_argument("--clans", type=int, default=1, help="클랜 수")
+    parser.add_argument("--members", type=int, default=100, help="클랜당 클랜원 수")
+    parser.add_argument("--churn", type=int, default=3, help="변동 확인 1회당 가입/탈퇴 인원")
+    parser.add_argument("--online-ratio", type=float, default=0.2, help="접속중인 클랜원 비율")
+    parser.add_argument("--latency", type=float, default=0.0, help="가짜 서버 응답 지연 (초)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="응답 지연에 더할 최대 무작위 시간 (초)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="요청 제한 오류 응답 비율")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="오류 응답 비율")
+    parser.add_argument("--error-code", type=int, default=5, help="오류 응답의 ErrorCode (기본값 SystemDisabled)")
+    parser.add_argument("--repeat", type=int, default=10, help="항목별 반복 횟수")
+    parser.add_argument("--profile-concurrency", type=int, default=8)
+    parser.add_argument("--profile-rate", type=float, default=1000, help="초당 프로필 요청 수 (실제 설정값으로 측정하려면 10)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default="", help="결과를 저장할 json 파일 경로")
+    return parser.parse_args(argv)
+
+
+class Result:
+    def __init__(self, name: str, times: List[float], peak: int, allocated: int, errors: int = 0):
+        self.name = name
+        self.times = times
+        self.errors = errors
+        self.peak = peak
+        self.allocated = allocated
+
+    def row(self) -> dict:
+        times = sorted(self.times)
+        return {
+            "name": self.name,
+            "n": len(times),
+            "errors": self.errors,
+            "min_ms": times[0] * 1000,
+            "median_ms": statistics.median(times) * 1000,
+            "p95_ms": times[min(len(times) - 1, int(len(times) * 0.95))] * 1000,
+            "max_ms": times[-1] * 1000,
+            "peak_kib": self.peak / 1024,
+            "alloc_kib": self.allocated / 1024,
+        }
+
+
+async def _setup(setup: Optional[Callable], i: int):
+    # setup 은 일반 함수, coroutine 함수 모두 가능 (측정 시간에 포함하지 않음)
+    if setup is not None:
+        ret = setup(i)
+        if inspect.isawaitable(ret):
+            await ret
+
+
+async def measure(name: str, func: Callable[[int], Awaitable], repeat: int, setup: Callable[[int], None] = None) -> Result:
+    # 시간은 tracemalloc 없이 측정하고, 할당량은 마지막에 한 번 더 실행해서 측정
+    # 오류 응답을 섞은 경우 실패한 횟수만 세고 계속 진행
+    times = []
+    errors = 0
+    for i in range(repeat):
+        await _setup(setup, i)
+        st = time.perf_counter()
+        try:
+            await func(i)
+        except Exception as e:
+            errors += 1
+            logger.debug(f"{name} failed: {e!r}")
+        times.append(time.perf_counter() - st)
+    await _setup(setup, repeat)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+        await func(repeat)
+    except Exception as e:
+        errors += 1
+        logger.debug(f"{name} failed: {e!r}")
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return Result(name, times, peak - before, current - before, errors)
+
+
+async def run(args: argparse.Namespace) -> List[Result]:
+    group_ids = list(range(1, args.clans + 1))
+    fake = FakeBungie({gid: args.members for gid in group_ids}, latency=args.latency, jitter=args.jitter,
+                      throttle_rate=args.throttle_rate, error_rate=args.error_rate, error_code=args.error_code,
+                      online_ratio=args.online_ratio, seed=args.seed)
+    await fake.start()
+
+    client = bot.DestinyBot(intents=discord.Intents.default(), bungie_api_key="bench", group_id=group_ids[0],
+                            profile_concurrency=args.profile_concurrency, profile_rate=args.profile_rate)
+    client.clans = clans.ClanRegistry(
+        "bench", client._dir_data, client.store, client.persist, default_group_id=group_ids[0],
+        # 주기 작업처럼 매번 클랜원 목록을 새로 받도록 캐시 사용 안 함
+        roster_ttl=0, profile_concurrency=args.profile_concurrency, profile_rate=args.profile_rate
+    )
+    # manifest 대신 가짜 활동 이름 표 사용
+    client.clans.activity_table.activities = dict(ACTIVITIES)
+    client.clans.activity_table.modes = dict(MODES)
+    client.clans.activity_table.version = "bench"
+    for gid in group_ids[1:]:
+        client.clans.register(gid, gid)
+    d2util = client.get_clan(0)
+    gid = d2util.group_id
+
+    results = []
+    try:
+        results.append(await measure("roster fetch", lambda i: d2util.roster.get(force=True), args.repeat))
+
+        await d2util.member_diff()
+        results.append(await measure(
+            "member_diff", lambda i: d2util.member_diff(), args.repeat,
+            setup=lambda i: fake.churn(gid, joined=args.churn, left=args.churn, renamed=args.churn // 2 + 1, online_flip=args.churn)
+        ))
+        results.append(await measure(
+            "poll all clans", lambda i: client.clans.poll(lambda c: c.member_diff(), spread=0), args.repeat,
+            setup=lambda i: [fake.churn(n, joined=args.churn, left=args.churn) for n in group_ids]
+        ))
+
+        results.append(await measure(
+            "get_clan_online_detail (cold)", lambda i: client.get_clan_online_detail(d2util), args.repeat,
+            setup=lambda i: d2util.profile_fetcher._cache.clear()
+        ))
+        results.append(await measure("get_clan_online_detail (warm)", lambda i: client.get_clan_online_detail(d2util), args.repeat))
+
+        results.append(await measure("get_long_offline", lambda i: client.get_long_offline(d2util, 14), args.repeat))
+
+        def expire_inactivity(i: int):
+            for n in client.inactivity.entries.values():
+                n["checked"] = 0
+            d2util.profile_fetcher._cache.clear()
+        results.append(await measure("inactivity scan (full)", lambda i: client.inactivity.scan(d2util), args.repeat, setup=expire_inactivity))
+
+        async def churn_online(i: int):
+            # scan 은 1시간 이내의 클랜원 목록을 재사용하므로 바뀐 목록을 미리 받아둠
+            fake.churn(gid, online_flip=args.churn)
+            await d2util.roster.get(force=True)
+
+        scanned = []
+
+        async def incremental_scan(i: int):
+            scanned.append(await client.inactivity.scan(d2util))
+        results.append(await measure("inactivity scan (incremental)", incremental_scan, args.repeat, setup=churn_online))
+        if not (args.error_rate or args.throttle_rate):
+            # 접속 상태가 바뀐 클랜원만 다시 확인해야 함
+            assert all(0 < n <= args.churn for n in scanned), f"incremental scan updated {scanned}, expected ~{args.churn}"
+        results.append(await measure("get_long_offline accurate", lambda i: client.get_long_offline(d2util, 14, accurate=True), args.repeat))
+
+        members = d2util.members_snapshot.members
+        sample = members[:max(args.churn, 1)]
+        results.append(await measure(
+            "msg_members_diff", lambda i: client.msg_members_diff(d2util, sample, members[-len(sample):]), args.repeat
+        ))
+
+        async def block_flow(i: int):
+            name = f"Blocked{i}#{i % 10000:04d}"
+            await client.register_block(d2util, bungie_name=name, msg_url="https://example.com", description="bench")
+            await client.msg_block_list(-1)
+            await client.msg_block_list_verify(sample)
+            await client.deregister_block(d2util, bungie_name=name)
+            steam_id = str(76561198000000000 + i)
+            await client.register_block(d2util, steam_id=steam_id, description="bench")
+            await client.deregister_block(d2util, steam_id=steam_id)
+        results.append(await measure("block register/list/deregister", block_flow, args.repeat))
+
+        # 번지 이름, SteamID 를 섞은 목록을 가져온 다음 내보내기 (조회 캐시는 매번 비움)
+        import_text = "\n".join(
+            f"Imported{k}#{k % 10000:04d} https://example.com bench" if k % 2 else str(76561198100000000 + k)
+            for k in range(args.members)
+        )
+
+        def reset_import(i: int):
+            client.resolver._cache.clear()
+            client.block.clear()
+
+        def reset_identities(i: int):
+            reset_import(i)
+            client.identities.entries.clear()
+            client.identities.by_name.clear()
+            client.identities.by_steam.clear()
+
+        async def import_flow(i: int):
+            entries, _ = blocklist.parse_lines(import_text)
+            await client.import_block(d2util, entries)
+            blocklist.export_bytes(client.block)
+        results.append(await measure(f"block import ({args.members}, cold)", import_flow, args.repeat, setup=reset_identities))
+        # 저장된 번지 이름, SteamID 대응 관계만 남긴 상태 (재시작 후와 같음)
+        results.append(await measure(f"block import ({args.members}, identity)", import_flow, args.repeat, setup=reset_import))
+
+        end_time = dt.datetime.now() + dt.timedelta(days=30)
+
+        async def rest_flow(i: int):
+            member = members[i % len(members)]
+            await client.register_rest(d2util, member, end_time, "", "bench")
+            await client.msg_rest_list(d2util)
+            await client.deregister_rest(member.membership_id)
+        results.append(await measure("rest register/list/deregister", rest_flow, args.repeat))
+
+        results.append(await measure("persist flush", lambda i: client.persist.flush(), args.repeat,
+                                     setup=lambda i: d2util._save_roster()))
+    finally:
+        await client.persist.close()
+        await client.clans.close()
+        client.store.close()
+        await fake.close()
+
+    print_report(results, fake)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": [n.row() for n in results], "requests": fake.requests}, f, indent=2)
+    return results
+
+
+def print_report(results: List[Result], fake: FakeBungie):
+    header = f"{'name':<34}{'n':>4}{'err':>5}{'min':>10}{'median':>10}{'p95':>10}{'max':>10}{'peak KiB':>11}{'alloc KiB':>11}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        r = result.row()
+        print(f"{r['name']:<34}{r['n']:>4}{r['errors']:>5}{r['min_ms']:>10.2f}{r['median_ms']:>10.2f}{r['p95_ms']:>10.2f}{r['max_ms']:>10.2f}"
+              f"{r['peak_kib']:>11.1f}{r['alloc_kib']:>11.1f}")
+    print()
+    print("fake server requests: " + ", ".join(f"{k}={v}" for k, v in sorted(fake.requests.items())))
+    for row in metrics.REGISTRY.summary("bungie_request", "endpoint"):
+        print(row.replace("`", ""))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.json = os.path.abspath(args.json) if args.json else ""
+    logging.basicConfig(level=logging.WARNING)
+    # data 폴더를 만들지 않도록 임시 폴더에서 실행
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            asyncio.run(run(args))
+        finally:
+            os.chdir(cwd)
+
+
+if __name__ == "__main__":
+    main()
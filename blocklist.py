@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import breaker
+import destiny2
+import identity
+import metrics
+import roster
+
+
+logger = logging.getLogger("blocklist")
+
+# 한 줄에 한 명: (번지 이름|SteamID64) [URL] [설명]
+LINE_PATTERN = re.compile(r"^\s*(?:(.+?#\d{3,4})|(\d{17}))(?:\s+(https?://\S+))?(?:\s+(.+?))?\s*$")
+EXPORT_VERSION = 1
+
+
+class BlockEntry(NamedTuple):
+    """가져올 차단 항목 하나 (membership_id 가 있으면 조회 없이 그대로 사용)"""
+    query: str
+    bungie_name: str = ""
+    steam_id: str = ""
+    membership_id: str = ""
+    membership_type: int = 0
+    msg_url: str = ""
+    description: str = ""
+    time: int = 0
+
+
+def parse_lines(text: str) -> Tuple[List[BlockEntry], List[Tuple[str, str]]]:
+    """여러 줄 입력을 (항목, (줄, 실패 사유)) 로 나눔"""
+    entries = []
+    failed = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        m = LINE_PATTERN.match(line)
+        if not m:
+            failed.append((line.strip(), "형식 오류"))
+            continue
+        bungie_name, steam_id, msg_url, description = m.groups()
+        entries.append(BlockEntry(query=(bungie_name or steam_id).strip(), bungie_name=(bungie_name or "").strip(),
+                                  steam_id=steam_id or "", msg_url=msg_url or "", description=description or ""))
+    return entries, failed
+
+
+def parse_file(content: bytes) -> Tuple[List[BlockEntry], List[Tuple[str, str]]]:
+    """내보내기로 만든 json 파일 또는 한 줄에 한 명씩 적은 텍스트 파일"""
+    text = content.decode("utf-8-sig")
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return parse_lines(text)
+    # 예전 block_list.json 형식 ({membership_id: 항목}) 도 허용
+    items = data.get("block", data) if isinstance(data, dict) else data
+    if isinstance(items, dict):
+        items = list(items.values())
+    entries = []
+    failed = []
+    for n in items if isinstance(items, list) else []:
+        if not isinstance(n, dict):
+            failed.append((str(n)[:100], "형식 오류"))
+            continue
+        query = str(n.get("bungie_name") or n.get("steam_id") or n.get("membership_id") or "")
+        if not query:
+            failed.append((json.dumps(n, ensure_ascii=False)[:100], "번지 이름, SteamID, 멤버쉽 ID 없음"))
+            continue
+        entries.append(BlockEntry(query=query, bungie_name=str(n.get("bungie_name") or ""), steam_id=str(n.get("steam_id") or ""),
+                                  membership_id=str(n.get("membership_id") or ""), membership_type=int(n.get("membership_type") or 0),
+                                  msg_url=str(n.get("msg_url") or ""), description=str(n.get("description") or ""),
+                                  time=int(n.get("time") or 0)))
+    return entries, failed
+
+
+def export_bytes(block: Dict[str, dict]) -> bytes:
+    """다른 클랜에 공유할 수 있는 차단 목록 파일 (parse_file 로 다시 읽을 수 있음)"""
+    items = sorted(block.values(), key=lambda v: v.get("time", 0))
+    data = {"version": EXPORT_VERSION, "exported": int(time.time()), "block": items}
+    return json.dumps(data, ensure_ascii=False, indent=2).encode("utf-8")
+
+
+class PlayerResolver:
+    """번지 이름, SteamID 로 유저 정보를 찾는 작업 풀
+
+    클랜원 목록, 저장된 대응 관계(identities)에서 먼저 찾고, 없을 때만 번지 API 에 요청한다.
+    동시에 concurrency 개까지만 요청하고, 같은 대상을 동시에 찾으면 하나의 요청 결과를 같이 사용한다.
+    찾은 결과는 ttl 초, 찾지 못한 결과는 negative_ttl 초 동안 재사용한다.
+    """
+    def __init__(self, concurrency: int = 4, ttl: float = 86400, negative_ttl: float = 600,
+                 identities: identity.IdentityCache = None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.identities = identities
+        self._sem = asyncio.Semaphore(concurrency)
+        self._cache: Dict[str, Tuple[float, dict]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _key(bungie_name: str = "", steam_id: str = "", membership_id: str = "") -> str:
+        if steam_id:
+            return f"steam:{steam_id}"
+        return roster.normalize_bungie_name(bungie_name) if bungie_name else f"id:{membership_id}"
+
+    def _cache_get(self, key: str) -> Optional[dict]:
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        if cached[0] < time.time() - (self.ttl if cached[1] else self.negative_ttl):
+            self._cache.pop(key, None)
+            return None
+        return cached[1]
+
+    async def resolve(self, d2util: destiny2.ClanUtil, bungie_name: str = "", steam_id: str = "", membership_id: str = "") -> dict:
+        if not (bungie_name or steam_id or membership_id):
+            return {}
+        key = self._key(bungie_name, steam_id, membership_id)
+        cached = self._lookup_local(d2util, key, bungie_name, steam_id, membership_id)
+        metrics.cache("player", cached is not None)
+        if cached is not None:
+            return cached
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._inflight[key] = asyncio.ensure_future(self._fetch(d2util, key, bungie_name, steam_id, membership_id))
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def _lookup_local(self, d2util: destiny2.ClanUtil, key: str, bungie_name: str, steam_id: str,
+                      membership_id: str = "") -> Optional[dict]:
+        # 지금 클랜원이면 클랜원 목록에서 바로 찾음 (SteamID 는 클랜원 목록에 없음)
+        if not steam_id:
+            member = d2util.find_member_from_cache(bungie_name=bungie_name or None, membership_id=membership_id or None)
+            if member is not None and (member.bungie_name or not bungie_name):
+                return identity.member_info(member)
+        cached = self._cache_get(key)
+        if cached is None and self.identities is not None:
+            cached = self.identities.lookup(bungie_name=bungie_name, steam_id=steam_id, membership_id=membership_id)
+        return cached
+
+    async def _fetch(self, d2util: destiny2.ClanUtil, key: str, bungie_name: str, steam_id: str, membership_id: str = "") -> dict:
+        async with self._sem:
+            if steam_id:
+                user_info = await d2util.get_player_from_steam_id(steam_id=steam_id)
+            elif bungie_name:
+                user_info = await d2util.search_player(bungie_name=bungie_name)
+            else:
+                user_info = await d2util.get_player_from_membership_id(membership_id)
+        self._cache[key] = (time.time(), user_info)
+        if self.identities is not None:
+            self.identities.observe(user_info, steam_id=steam_id)
+        return user_info
+
+    async def resolve_many(self, d2util: destiny2.ClanUtil, entries: Iterable[BlockEntry]) -> List[Tuple[BlockEntry, dict, str]]:
+        """(항목, 유저 정보, 실패 사유) list, 입력 순서 유지"""
+        async def _one(entry: BlockEntry) -> Tuple[BlockEntry, dict, str]:
+            if entry.membership_id and entry.membership_type:
+                return entry, {"membershipId": entry.membership_id, "membershipType": entry.membership_type}, ""
+            try:
+                # 번지 이름, SteamID 가 없고 membership_type 만 빠진 항목은 멤버쉽 ID 로 조회
+                user_info = await self.resolve(d2util, entry.bungie_name, entry.steam_id,
+                                               "" if entry.bungie_name or entry.steam_id else entry.membership_id)
+            except breaker.CircuitOpenError:
+                return entry, {}, "번지 서버 응답 없음"
+            except Exception as e:
+                logger.warning(f"Failed to resolve {entry.query}: {e}")
+                return entry, {}, "조회 오류"
+            return entry, user_info, "" if user_info else "유저를 찾을 수 없음"
+        return list(await asyncio.gather(*[_one(n) for n in entries]))
@@ -1,42 +1,54 @@
 import asyncio
 import datetime as dt
-import json
+import io
 import logging
-import re
 import time
 import os
-from typing import List, Optional
+import signal
+from typing import Dict, List, Optional, Tuple
 
 import discord
 from discord.ext import tasks
 
+import blocklist
+import breaker
+import clans
 import destiny2
+import dispatch
+import embeds
+import identity
+import inactivity
+import metrics
+import online
+import persist
+import restlist
+import roster
+import storage
+import timeseries
 
 
 logger = logging.getLogger("bot")
 
 
-def escape_markdown(s: str) -> str:
-    return re.sub(r"([-_~`*])", "\\\\\\1", s)
+escape_markdown = roster.escape_markdown
 
 
-def bnet_user_format(d: dict, bold=True, skip_bnet_name=True) -> str:
-    if bold:
-        name = f"**{escape_markdown(d['destinyUserInfo']['bungieGlobalDisplayName'])}**#{d['destinyUserInfo']['bungieGlobalDisplayNameCode']:04d}" if d['destinyUserInfo'].get("bungieGlobalDisplayName") else f"**{d['destinyUserInfo']['LastSeenDisplayName']}**"
-    else:
-        name = f"{escape_markdown(d['destinyUserInfo']['bungieGlobalDisplayName'])}#{d['destinyUserInfo']['bungieGlobalDisplayNameCode']:04d}" if d['destinyUserInfo'].get("bungieGlobalDisplayName") else f"{d['destinyUserInfo']['LastSeenDisplayName']}"
-    url = f"https://www.bungie.net/7/ko/User/Profile/{d['bungieNetUserInfo']['membershipType']}/{d['bungieNetUserInfo']['membershipId']}" if d.get("bungieNetUserInfo") else f"https://www.bungie.net/7/ko/User/Profile/{d['destinyUserInfo']['membershipType']}/{d['destinyUserInfo']['membershipId']}"
+def hours_format(seconds: float) -> str:
+    return f"{seconds / 3600:.1f}시간"
 
-    if not d.get('bungieNetUserInfo', {}).get('displayName', ''):
-        bnet_name = ""
-    elif skip_bnet_name and d['destinyUserInfo'].get("bungieGlobalDisplayName"):
-        bnet_name = f" ({escape_markdown(d['bungieNetUserInfo']['displayName'])})" if d["destinyUserInfo"]["bungieGlobalDisplayName"] != d["bungieNetUserInfo"]["displayName"] else ""
-    elif skip_bnet_name:
-        bnet_name = f" ({escape_markdown(d['bungieNetUserInfo']['displayName'])})" if d['destinyUserInfo']['LastSeenDisplayName'] != d["bungieNetUserInfo"]["displayName"] else ""
-    else:
-        bnet_name = f" ({escape_markdown(d['bungieNetUserInfo']['displayName'])})"
-    result = f"[{name}]({url}){bnet_name}"
-    return result
+
+def hour_bars(values: List[float]) -> str:
+    # 0시 ~ 23시 접속 인원을 막대 문자로 표시
+    blocks = "▁▂▃▄▅▆▇█"
+    peak = max(values) or 1
+    return "".join(blocks[min(int(n / peak * (len(blocks) - 1) + 0.5), len(blocks) - 1)] for n in values)
+
+
+def bnet_user_format(member: roster.Member, bold=True, skip_bnet_name=True) -> str:
+    # 기본 형식은 클랜원 목록을 받을 때 미리 만들어 둔 문자열 사용
+    if bold and skip_bnet_name:
+        return member.display
+    return member.format(bold, skip_bnet_name)
 
 
 def bnet_user_format2(bungie_name: str, membership_id: int, membership_type: int = -1, bold=True, add_url=True) -> str:
@@ -53,7 +65,8 @@ class DestinyBot(discord.Client):
         self._api_key = options.pop("bungie_api_key")
         self._group_id = options.pop("group_id")
         self._dir_data = "data"
-        self._path_members_list = os.path.join(self._dir_data, "members.json")
+        self._path_db = os.path.join(self._dir_data, "bot.db")
+        # 예전 버전에서 사용하던 json 파일들 (DB 로 한 번만 옮겨옴)
         self._path_push_list = os.path.join(self._dir_data, "push_list.json")
         self._path_rest_list = os.path.join(self._dir_data, "rest_list.json")
         self._path_block_list = os.path.join(self._dir_data, "block_list.json")
@@ -61,55 +74,101 @@ class DestinyBot(discord.Client):
         self.st = dt.datetime.now()
         self.offline_cut = options.pop("offline_cut", 14)
         self.online_command_preview = options.pop("online_command_preview", False)
+        self.online_command_stream = options.pop("online_command_stream", False)
+        self.online_poll = options.pop("online_poll", False)
+        self.online_states: Dict[int, online.OnlineState] = {}
+        # 0 이면 접속 기록을 남기지 않음
+        self.timeseries_interval = options.pop("timeseries_interval", 0)
+        # 0 이면 `$미접 (일수) 정확` 명령어를 사용할 때만 백그라운드에서 확인
+        self.inactivity_scan_interval = options.pop("inactivity_scan_interval", 0)
+        self.inactivity_ttl = options.pop("inactivity_ttl", 86400)
+        self.clan_poll_spread = options.pop("clan_poll_spread", 600)
+        self.clan_poll_concurrency = options.pop("clan_poll_concurrency", 4)
+        self.roster_ttl = options.pop("roster_ttl", 60)
+        self.profile_concurrency = options.pop("profile_concurrency", 8)
+        self.profile_rate = options.pop("profile_rate", 10)
+        self.profile_cache_ttl = options.pop("profile_cache_ttl", 60)
+        self.identity_ttl = options.pop("identity_ttl", 7 * 86400)
+        self.breaker_threshold = options.pop("breaker_threshold", 5)
+        self.breaker_cooldown = options.pop("breaker_cooldown", 30)
+        self.clans: Optional[clans.ClanRegistry] = None
+        # METRICS_PORT 가 0 이면 /metrics 서버를 열지 않음 (수집은 항상 진행)
+        metrics_host = options.pop("metrics_host", "127.0.0.1")
+        metrics_port = options.pop("metrics_port", 0)
+        self.metrics_server = metrics.MetricsServer(metrics_host, metrics_port) if metrics_port else None
+        self.dispatcher = dispatch.AlertDispatcher(on_unreachable=self.drop_alert_target)
         self.last_tasks_run = None
-        self._cache = {}
-        self.rest = {}
         self.block = {}
+        self.block_version = 0
+        self._block_items = []
+        self._block_items_version = -1
+        # 클랜을 나간 클랜원의 휴가를 지금 클랜원 목록과 한 번 비교해서 정리한 클랜
+        self._rest_reconciled = set()
 
         if not os.path.exists(self._dir_data):
             os.makedirs(self._dir_data)
-        if not os.path.exists(self._path_push_list):
-            with open(self._path_push_list, "w", encoding="utf-8") as f:
-                f.write("{}")
-        if not os.path.exists(self._path_rest_list):
-            with open(self._path_rest_list, "w", encoding="utf-8") as f:
-                f.write("{}")
-        if not os.path.exists(self._path_block_list):
-            with open(self._path_block_list, "w", encoding="utf-8") as f:
-                f.write("{}")
-
-        with open(self._path_push_list, "r", encoding="utf-8") as f:
-            self.alert_target: list = json.load(f).pop("alert_target", [])
-        with open(self._path_rest_list, "r", encoding="utf-8") as f:
-            self.rest = json.load(f)
-            # sorting
-            self.rest = dict(sorted(self.rest.items(), key=lambda x: x[1]["end_time"]))
-        with open(self._path_block_list, "r", encoding="utf-8") as f:
-            self.block = json.load(f)
+        self.store = storage.Storage(self._path_db)
+        self.store.migrate_lists(self._path_push_list, self._path_rest_list, self._path_block_list)
+        # 변경 사항은 모아서 worker thread 에서 기록
+        self.persist = persist.WriteBehind()
+        self._block_sync = persist.DictSync(self.persist, "block", lambda: self.block, self.store.upsert_block, self.store.delete_block)
+        self.inactivity = inactivity.InactivityScanner(self.store, self.persist, ttl=self.inactivity_ttl)
+        # 번지 이름, SteamID 조회 결과 (클랜원 목록, DB 에 저장된 대응 관계를 먼저 확인)
+        self.identities = identity.IdentityCache(self.store, self.persist, ttl=self.identity_ttl)
+        self.resolver = blocklist.PlayerResolver(identities=self.identities)
+        # 접속 기록 파일은 기록할 때마다 전체를 다시 쓰므로 10분에 한 번만 기록
+        self._series_writer = persist.WriteBehind(debounce=600)
+        self.timeseries = timeseries.Recorder(self._dir_data, self._series_writer, self.timeseries_interval) if self.timeseries_interval else None
+
+        self.alert_target: list = self.store.load_alert_target()
+        # 만료 시각 순으로 색인된 휴가 목록, 만료된 휴가는 _rest_purge 가 제거
+        self.rest = restlist.RestList(self.store, self.persist, default_group_id=self._group_id)
+        self._rest_purge: Optional[asyncio.Task] = None
+        self._close_task: Optional[asyncio.Task] = None
+        self.block = self.store.load_block()
 
         if not self.alert_target:
             logger.warning("Empty alert target list!!")
 
-    def get_cache(self, key, t=10):
-        if key in self._cache and self._cache[key][0] > time.time() - t:
-            return self._cache[key][1]
-        else:
-            return None
-
-    def set_cache(self, key, value):
-        self._cache[key] = (time.time(), value)
+    @property
+    def d2util(self) -> Optional[destiny2.ClanUtil]:
+        # 기본 클랜 (GROUP_ID)
+        return self.clans.get() if self.clans else None
+
+    def get_clan(self, guild_id: int = 0) -> Optional[destiny2.ClanUtil]:
+        return self.clans.get(guild_id) if self.clans else None
+
+    def alert_channels(self, group_id: int) -> list:
+        # 해당 클랜이 등록된 서버의 알림 채널만 선택, 클랜을 따로 등록하지 않은 서버는 기본 클랜 알림을 받음
+        guilds = self.clans.guilds_of(group_id)
+        channels = []
+        for n in self.alert_target:
+            channel = self.get_channel(n)
+            if channel is None:
+                logger.warning(f"Alert channel {n} not found")
+                continue
+            guild = getattr(channel, "guild", None)
+            guild_id = guild.id if guild else 0
+            if guild_id in guilds or (guild_id not in self.clans.guilds and group_id == self.clans.default_group_id):
+                channels.append(channel)
+        return channels
 
     async def reload_alert_target(self):
-        with open(self._path_push_list, "r", encoding="utf-8") as f:
-            self.alert_target = json.load(f).pop("alert_target", [])
+        self.alert_target = self.store.load_alert_target()
         return len(self.alert_target)
 
-    async def update_alert_target(self):
-        with open(self._path_push_list, "r", encoding="utf-8") as f:
-            push_list = json.load(f)
-        push_list["alert_target"] = self.alert_target
-        with open(self._path_push_list, "w", encoding="utf-8") as f:
-            json.dump(push_list, f, indent=2)
+    def _save_alert_target(self):
+        def snapshot():
+            targets = list(self.alert_target)
+            return lambda: self.store.replace_alert_target(targets)
+        self.persist.mark("alert_target", snapshot)
+
+    def drop_alert_target(self, channel_id: int):
+        # 삭제되었거나 권한이 없어진 채널은 알림 목록에서 제거
+        if channel_id in self.alert_target:
+            self.alert_target.remove(channel_id)
+            self._save_alert_target()
+            logger.warning(f"Removed unreachable alert channel {channel_id}")
 
     async def toggle_alert_target(self, channel_id: int) -> bool:
         if channel_id in self.alert_target:
@@ -118,273 +177,430 @@ class DestinyBot(discord.Client):
         else:
             self.alert_target.append(channel_id)
             ret = True
-        await self.update_alert_target()
+        self._save_alert_target()
         return ret
 
     async def get_uptime(self) -> str:
         return str(dt.datetime.now() - self.st)
 
-    async def get_clan_online(self) -> discord.Embed:
-        online = list(await self.d2util.online_members())
-        self.set_cache("online", online)
-        data = [{'dp_name': n['destinyUserInfo']['LastSeenDisplayName'],
-                 'membership_id': n['destinyUserInfo']['membershipId'],
-                 'bungie_name': n.get('bungieNetUserInfo', {}).get('displayName', "")}
+    def msg_metrics(self) -> List[discord.Embed]:
+        # $정보 에 붙는 성능 요약
+        builder = embeds.EmbedBuilder("성능 통계")
+        builder.add_rows_field("번지 API", metrics.REGISTRY.summary("bungie_request", "endpoint") or ["기록 없음"])
+        builder.add_rows_field("명령어", metrics.REGISTRY.summary("command", "command") or ["기록 없음"])
+        builder.add_rows_field("작업", metrics.REGISTRY.summary("task", "task") or ["기록 없음"])
+        builder.add_rows_field("디스코드 전송", metrics.REGISTRY.summary("discord_send", "kind") or ["기록 없음"])
+        ratios = []
+        for name in ("roster", "profile"):
+            ratio = metrics.REGISTRY.cache_ratio(name)
+            ratios.append(f"`{name}` {ratio * 100:.1f}%" if ratio is not None else f"`{name}` -")
+        builder.add_field("캐시 적중률", " / ".join(ratios))
+        if self.clans is not None:
+            circuit = self.clans.breaker
+            state = "정상" if circuit.closed else f"차단 중 ({circuit.last_reason}, {circuit.retry_after:.0f}초 후 재시도)"
+            builder.add_field("번지 API 상태", state)
+        return builder.build()
+
+    async def get_clan_online(self, d2util: destiny2.ClanUtil) -> List[discord.Embed]:
+        online = await d2util.online_members()
+        data = [{'dp_name': n.display_name,
+                 'membership_id': n.membership_id,
+                 'bungie_name': n.bnet_display_name}
                 for n in online]
 
-        msg_embed = discord.Embed(title="접속중인 클랜원 목록", timestamp=dt.datetime.now(), color=0x00ac00)
-        msg_embed.add_field(
-            name=f"온라인 ({len(data)})",
-            value="\n".join(escape_markdown(f"{n['dp_name']}") for n in data),
-            inline=False
-        )
-        return msg_embed
+        builder = embeds.EmbedBuilder("접속중인 클랜원 목록", description=self.stale_notice(d2util))
+        builder.add_rows_field(f"온라인 ({len(data)})", (escape_markdown(f"{n['dp_name']}") for n in data))
+        return builder.build()
 
-    async def get_clan_online_detail(self):
-        online = self.get_cache("online")
-        if online is None:
-            online = await self.d2util.online_members()
-        data = [{'dp_name': n['destinyUserInfo']['LastSeenDisplayName'],
-                 'membership_type': n['destinyUserInfo']['membershipType'],
-                 'membership_id': n['destinyUserInfo']['membershipId']}
+    async def get_clan_online_detail(self, d2util: destiny2.ClanUtil) -> List[discord.Embed]:
+        # 미리보기에서 받은 클랜원 목록이 캐시에 남아있으면 재사용
+        online = await d2util.online_members()
+        data = [{'dp_name': n.display_name,
+                 'membership_type': n.membership_type,
+                 'membership_id': n.membership_id}
                 for n in online]
 
-        res = await asyncio.gather(*[self.d2util.user_activity(member["membership_type"], member["membership_id"]) for member in data])
+        res = await asyncio.gather(*[d2util.user_activity(member["membership_type"], member["membership_id"]) for member in data])
         for i, act in enumerate(res):
             data[i]["activity"] = act
+        return self.render_online_detail(data, notice=self.stale_notice(d2util))
 
+    def get_online_state(self, d2util: destiny2.ClanUtil) -> Optional[online.OnlineState]:
+        # 백그라운드에서 갱신중인 접속 상태가 있으면 반환, 번지 API 장애 중에는 오래된 상태라도 반환
+        state = self.online_states.get(d2util.group_id)
+        if state is None or not state.updated_at:
+            return None
+        return state if state.is_warm() or d2util.outage else None
+
+    @staticmethod
+    def stale_notice(d2util: destiny2.ClanUtil) -> str:
+        # 번지 API 장애 중에 마지막으로 받은 정보를 보여줄 때 붙이는 안내
+        if not d2util.degraded:
+            return ""
+        snapshot = d2util.roster.snapshot
+        since = f" (<t:{int(snapshot.fetched_at)}:R> 기준)" if snapshot is not None else ""
+        return f":warning: 번지 서버 응답이 없어 마지막으로 받은 정보를 표시합니다.{since}"
+
+    @staticmethod
+    def render_online_detail(data: list, updated_at: float = None, notice: str = "") -> List[discord.Embed]:
+        # 활동 정보를 아직 받지 못한 클랜원은 마지막 "확인 중" 항목에 표시
         data_by_type = {}
+        pending = []
         for n in data:
-            if data_by_type.get(n["activity"][0]):
+            if n.get("activity") is None:
+                pending.append(n)
+            elif data_by_type.get(n["activity"][0]):
                 data_by_type[n["activity"][0]].append(n)
             else:
                 data_by_type[n["activity"][0]] = [n]
 
-        msg_embed = discord.Embed(title=f"접속중인 클랜원 목록 ({len(data)})", timestamp=dt.datetime.now(), color=0x00ac00)
+        builder = embeds.EmbedBuilder(f"접속중인 클랜원 목록 ({len(data)})", description=notice,
+                                      timestamp=dt.datetime.fromtimestamp(updated_at) if updated_at else None)
+        if updated_at:
+            builder.embeds[0].set_footer(text="마지막 갱신")
         for act_type, members in data_by_type.items():
-            msg_embed.add_field(
-                name=f"{act_type} ({len(members)})",
-                value="\n".join(
-                    f"{escape_markdown(n['dp_name'])}{' - ' + ': '.join(n['activity'][1:]) if len(n['activity']) > 1 else ''}"
-                    for n in members
-                ),
-                inline=False
+            builder.add_rows_field(
+                f"{act_type} ({len(members)})",
+                (f"{escape_markdown(n['dp_name'])}{' - ' + ': '.join(n['activity'][1:]) if len(n['activity']) > 1 else ''}"
+                 for n in members)
             )
-        return msg_embed
+        if pending:
+            builder.add_rows_field(f"확인 중 ({len(pending)})", (escape_markdown(n['dp_name']) for n in pending))
+        return builder.build()
+
+    async def stream_clan_online_detail(self, d2util: destiny2.ClanUtil, resp_msg: discord.Message, edit_interval: float = 1.0):
+        # 활동 정보가 도착하는 대로 메시지 수정, 디스코드 수정 제한을 넘지 않도록 edit_interval 초에 한 번만 수정
+        online = await d2util.online_members()
+        data = [{'dp_name': n.display_name,
+                 'membership_type': n.membership_type,
+                 'membership_id': n.membership_id,
+                 'activity': None}
+                for n in online]
 
-    async def get_long_offline(self, offline_cut=0) -> discord.Embed:
-        cut = offline_cut if offline_cut else self.offline_cut
-        # target: 유저 정보 담긴 dict 객체들의 list
-        target = await self.d2util.members_offline_time(cut)
-        await self.update_rest()
-        data = [{'name': bnet_user_format(n),
-                 'membership_id': n['destinyUserInfo']['membershipId'],
-                 'last_online': dt.timedelta(seconds=int(dt.datetime.now().timestamp()) - int(n['lastOnlineStatusChange'])),
-                 'is_in_rest': n['destinyUserInfo']['membershipId'] in self.rest}
-                for n in target]
-        msg_embed = discord.Embed(title=f"{cut}일 이상 미접속자 목록", timestamp=dt.datetime.now(), color=0x00ac00)
-        msg_embed.description = "\n".join((f"~~{n['name']}~~" if n['is_in_rest'] else n["name"]) + f": `{n['last_online']}`" for n in data)
-        return msg_embed
+        async def _fetch(member: dict):
+            member["activity"] = await d2util.user_activity(member["membership_type"], member["membership_id"])
+
+        last_edit = time.monotonic()
+        for fut in asyncio.as_completed([_fetch(n) for n in data]):
+            await fut
+            if time.monotonic() - last_edit >= edit_interval:
+                # 중간 결과는 첫 메시지에 담을 수 있는 만큼만 표시
+                await resp_msg.edit(embeds=embeds.split_messages(self.render_online_detail(data))[0])
+                last_edit = time.monotonic()
+        await self.edit_embeds(resp_msg, self.render_online_detail(data, notice=self.stale_notice(d2util)))
 
-    async def msg_members_diff(self, joined: list, left: list) -> List[discord.Embed]:
+    async def get_long_offline(self, d2util: destiny2.ClanUtil, offline_cut=0, accurate: bool = False) -> List[discord.Embed]:
+        cut = offline_cut if offline_cut else self.offline_cut
+        if accurate:
+            # 프로필로 확인한 마지막 플레이 시각 사용, 오래된 값은 백그라운드에서 갱신
+            snapshot = await d2util.roster.get(max_age=3600)
+            target = self.inactivity.offline_before(snapshot, dt.datetime.now().timestamp() - cut * 86400)
+            if not self.inactivity_scan_interval:
+                self.inactivity.scan_background(d2util)
+        else:
+            # target: (클랜원, 마지막 접속 시각, 확인 여부) list
+            target = [(n, n.last_online, True) for n in await d2util.members_offline_time(cut)]
+        self.rest.purge()
+        now = int(dt.datetime.now().timestamp())
+        rows = [(f"~~{bnet_user_format(n)}~~" if n.membership_id in self.rest else bnet_user_format(n))
+                + f": `{dt.timedelta(seconds=now - last)}" + ("`" if checked else " (확인 전)`")
+                for n, last, checked in target]
+        builder = embeds.EmbedBuilder(f"{cut}일 이상 미접속자 목록" + (" (마지막 플레이 기준)" if accurate else ""))
+        notice = self.stale_notice(d2util)
+        builder.add_description_rows([notice, *rows] if notice else rows)
+        return builder.build()
+
+    async def msg_members_diff(self, d2util: destiny2.ClanUtil, joined: list, left: list) -> List[discord.Embed]:
         list_joined = [bnet_user_format(n) for n in joined]
         list_left = [bnet_user_format(n) for n in left]
-        clan_m_cnt = len(self.d2util.members_data_cache)
+        clan_m_cnt = len(d2util.members_data_cache)
         clan_m_cnt_old = clan_m_cnt - len(joined) + len(left)
 
-        msg_joined = []
-        msg_left = []
-        for m in list_joined:
-            if msg_joined and len(msg_joined[-1]) + len(m) < 1024:
-                msg_joined[-1] += m + "\n"
-            else:
-                msg_joined.append(m + "\n")
-        for m in list_left:
-            if msg_left and len(msg_left[-1]) + len(m) < 1024:
-                msg_left[-1] += m + "\n"
-            else:
-                msg_left.append(m + "\n")
-
-        msg_embed = discord.Embed(
-            title="클랜원 목록 변동 안내",
-            description=f"{clan_m_cnt_old}명 -> {clan_m_cnt}명 ({len(joined) - len(left):+})\n<t:{int(time.time())}>",
-            timestamp=dt.datetime.now(),
-            color=0x00ac00
+        builder = embeds.EmbedBuilder(
+            "클랜원 목록 변동 안내",
+            description=f"{clan_m_cnt_old}명 -> {clan_m_cnt}명 ({len(joined) - len(left):+})\n<t:{int(time.time())}>"
         )
-        embeds = [msg_embed]
-        field_cnt = 0
-        while True:
-            if field_cnt >= 5:
-                embeds.append(discord.Embed(description="클랜원 목록 변동 안내 (+)", timestamp=dt.datetime.now(), color=0x00ac00))
-                field_cnt = 0
-
-            if msg_joined:
-                embeds[-1].add_field(name=":blue_circle: Joined", value=msg_joined.pop(0), inline=False)
-                field_cnt += 1
-            elif msg_left:
-                embeds[-1].add_field(name=":red_circle: Left", value=msg_left.pop(0), inline=False)
-                field_cnt += 1
-            else:
-                break
-        return embeds
+        builder.add_rows_field(":blue_circle: Joined", list_joined)
+        builder.add_rows_field(":red_circle: Left", list_left)
+        return builder.build()
+
+    async def msg_member_history(self, d2util: destiny2.ClanUtil, bungie_name: str) -> discord.Embed:
+        # 지금 클랜에 있으면 클랜원 목록에서, 없으면 변동 기록에 남은 이름으로 찾기
+        member = d2util.find_member_from_cache(bungie_name=bungie_name)
+        membership_ids = set(await asyncio.to_thread(d2util.store.find_logged_members, d2util.group_id, bungie_name))
+        if member:
+            membership_ids.add(member.membership_id)
+        rows = await asyncio.to_thread(d2util.store.load_changes, d2util.group_id, membership_ids)
+
+        kinds = {"join": "가입", "leave": "탈퇴", "rename": "이름 변경", "rank": "등급 변경", "platform": "플랫폼 변경"}
+        msg_embed = discord.Embed(title=f"{bungie_name} 클랜원 변동 기록", timestamp=dt.datetime.now(), color=0x00ac00)
+        if not rows:
+            msg_embed.description = "기록이 없습니다."
+        else:
+            msg_embed.description = "\n".join(
+                f"<t:{t}:f> {kinds.get(kind, kind)}" + (f": `{old}` -> `{new}`" if old and new else f": `{old or new}`")
+                for _, t, kind, old, new in rows[-30:]
+            )
+        return msg_embed
 
-    async def register_rest(self, group_member: dict, end_time: dt.datetime, msg_url: str, description: str):
-        membership_id = group_member["destinyUserInfo"]["membershipId"]
+    async def msg_clan_stats(self, d2util: destiny2.ClanUtil, days: int = 7) -> List[discord.Embed]:
+        builder = embeds.EmbedBuilder(f"최근 {days}일 클랜 접속 통계")
+        if self.timeseries is None:
+            builder.add_description_rows(["접속 기록을 남기지 않도록 설정되어 있습니다. (`TIMESERIES_INTERVAL`)"])
+            return builder.build()
+        series = self.timeseries.get(d2util.group_id)
+        since = time.time() - days * 86400
+        if series.first_sample is None:
+            builder.add_description_rows(["기록이 없습니다."])
+            return builder.build()
+        members = d2util.members_snapshot.by_id
+        builder.add_field("기록 시작", f"<t:{max(series.first_sample, int(since))}:f>")
+        builder.add_field("전체 접속 시간", hours_format(series.clan_playtime(since)))
+        hours = series.peak_hours(since)
+        peak = sorted(range(24), key=lambda h: -hours[h])[:3]
+        builder.add_field("시간대별 평균 접속 인원 (0~23시)", f"`{hour_bars(hours)}`\n" + ", ".join(f"{h}시 {hours[h]:.1f}명" for h in peak))
+        builder.add_rows_field("접속 시간 순위", (
+            f"{i}. {bnet_user_format(members[m]) if m in members else f'(탈퇴) `{m}`'}: {hours_format(t)}"
+            for i, (m, t) in enumerate(series.top_members(since, limit=20), 1)
+        ))
+        return builder.build()
+
+    async def msg_member_stats(self, d2util: destiny2.ClanUtil, bungie_name: str, days: int = 7) -> List[discord.Embed]:
+        builder = embeds.EmbedBuilder(f"{bungie_name} 최근 {days}일 접속 통계")
+        member = d2util.find_member_from_cache(bungie_name=bungie_name)
+        if self.timeseries is None or not member:
+            builder.add_description_rows(["접속 기록을 남기지 않도록 설정되어 있습니다. (`TIMESERIES_INTERVAL`)" if self.timeseries is None else "해당 유저를 찾을 수 없습니다."])
+            return builder.build()
+        series = self.timeseries.get(d2util.group_id)
+        membership_id = member.membership_id
+        since = time.time() - days * 86400
+        hours = series.peak_hours(since, membership_id)
+        peak = [h for h in sorted(range(24), key=lambda h: -hours[h])[:3] if hours[h] > 0]
+        builder.add_field("접속 시간", hours_format(series.member_playtime(membership_id, since)))
+        builder.add_field("주 접속 시간대 (0~23시)", f"`{hour_bars(hours)}`\n" + (", ".join(f"{h}시 {hours[h] * 100:.0f}%" for h in peak) or "기록 없음"))
+        return builder.build()
+
+    async def record_timeseries(self, d2util: destiny2.ClanUtil):
+        online_members = await d2util.online_members()
+        self.timeseries.record(d2util.group_id, (n.membership_id for n in online_members))
+
+    async def register_rest(self, d2util: destiny2.ClanUtil, group_member: roster.Member, end_time: dt.datetime, msg_url: str, description: str):
+        membership_id = group_member.membership_id
         if len(description) > 500:
             description = description[:500]
-        self.rest[membership_id] = {
-            "bungie_name": destiny2.get_bungie_name(group_member),
-            "display_name": group_member["destinyUserInfo"]["LastSeenDisplayName"],
+        self.rest.add(membership_id, {
+            "bungie_name": group_member.bungie_name,
+            "display_name": group_member.display_name,
             "end_time": end_time.strftime("%Y-%m-%d"),
             "msg_url": msg_url,
-            "description": description
-        }
-        self.rest = dict(sorted(self.rest.items(), key=lambda x: x[1]["end_time"]))
-        with open(self._path_rest_list, "w", encoding="utf-8") as f:
-            json.dump(self.rest, f, ensure_ascii=False, indent=2)
+            "description": description,
+            "group_id": d2util.group_id
+        })
 
     async def deregister_rest(self, membership_id: int):
-        self.rest.pop(membership_id, None)
-        with open(self._path_rest_list, "w", encoding="utf-8") as f:
-            json.dump(self.rest, f, ensure_ascii=False, indent=2)
-
-    async def update_rest(self):
-        # 휴가 목록 갱신: 날짜 만료된 클랜원, 클랜을 나간 클랜원 제거
-        # 추가로 닉네임 정보 없으면 넣기
-        today = dt.datetime.today()
-        members = {n["destinyUserInfo"]["membershipId"]: n for n in self.d2util.members_data_cache}
-        rest_new = {}
-        for k, v in self.rest.items():
-            if dt.datetime.strptime(v["end_time"], "%Y-%m-%d") < today or k not in members:
-                continue
-            if not v.get("bungie_name"):
-                v["bungie_name"] = destiny2.get_bungie_name(members[k]) if destiny2.get_bungie_name(members[k]) else ""
-            if not v.get("display_name"):
-                v["display_name"] = members[k]["destinyUserInfo"]["LastSeenDisplayName"]
-            rest_new[k] = v
-
-        self.rest = {k: v for k, v in self.rest.items() if dt.datetime.strptime(v["end_time"], "%Y-%m-%d") > today and k in members.keys()}
-        with open(self._path_rest_list, "w", encoding="utf-8") as f:
-            json.dump(self.rest, f, ensure_ascii=False, indent=2)
-
-    async def msg_rest_list(self):
-        await self.update_rest()
-        msg_embed = discord.Embed(title="휴가중인 클랜원 목록 조회", timestamp=dt.datetime.now(), color=0x00ac00)
-        if self.rest:
-            msg_embed.description = "\n".join(
-                f"{bnet_user_format(self.d2util.find_member_from_cache(bungie_name=v['bungie_name'], membership_id=k))} `~{v['end_time']}`\n> "
-                + v["description"].replace("\n", "\n> ")
-                + (f" [(링크)]({v['msg_url']})" if v.get("msg_url") else "")
-                for k, v in self.rest.items()
-            )
-        return msg_embed
+        self.rest.remove(membership_id)
+
+    def update_rest(self, d2util: destiny2.ClanUtil, left: List[roster.Member]):
+        # 클랜원 변동 확인 결과로 휴가 목록 갱신: 클랜을 나간 클랜원 제거, 닉네임 정보 없으면 넣기
+        # 다른 클랜의 휴가 정보는 건드리지 않음
+        group_left = [n.membership_id for n in left if n.membership_id in self.rest
+                      and self.rest.group_id_of(self.rest.items[n.membership_id]) == d2util.group_id]
+        if d2util.group_id not in self._rest_reconciled and d2util.members_snapshot.by_id:
+            # 변동 기록이 없던 첫 확인에서는 지금 클랜원 목록과 한 번 비교
+            self._rest_reconciled.add(d2util.group_id)
+            group_left += self.rest.reconcile(d2util.group_id, d2util.members_snapshot.by_id)
+        removed = self.rest.remove(*group_left)
+        if removed:
+            logger.info(f"Removed {len(removed)} rest entries of members who left ({d2util.group_id})")
+        self.rest.fill_names(d2util.group_id, d2util.members_snapshot.by_id)
+
+    async def msg_rest_list(self, d2util: destiny2.ClanUtil) -> List[discord.Embed]:
+        self.rest.purge()
+        builder = embeds.EmbedBuilder("휴가중인 클랜원 목록 조회")
+        rows = []
+        for k, v in self.rest.group_items(d2util.group_id):
+            member = d2util.find_member_from_cache(bungie_name=v.get('bungie_name', ''), membership_id=k)
+            name = bnet_user_format(member) if member else f"**{escape_markdown(v.get('bungie_name') or v.get('display_name') or k)}**"
+            rows.append(f"{name} `~{v['end_time']}`\n> " + v["description"].replace("\n", "\n> ")
+                        + (f" [(링크)]({v['msg_url']})" if v.get("msg_url") else ""))
+        builder.add_description_rows(rows)
+        return builder.build()
+
+    @staticmethod
+    def _block_item(user_info: dict, msg_url: str, description: str, t: int = 0, bungie_name: str = "") -> dict:
+        if user_info.get("bungieGlobalDisplayName"):
+            bungie_name = "{bungieGlobalDisplayName}#{bungieGlobalDisplayNameCode:04d}".format(**user_info)
+        return {
+            "bungie_name": bungie_name or str(user_info["membershipId"]),
+            "membership_id": user_info["membershipId"],
+            "membership_type": user_info["membershipType"],
+            "time": t or int(time.time()),
+            "msg_url": msg_url,
+            "description": description
+        }
 
-    async def register_block(self, bungie_name: str = "", steam_id: str = "", msg_url: str = "", description: str = "") -> bool:
-        if bungie_name:
-            user_info = await self.d2util.search_player(bungie_name=bungie_name)
-        elif steam_id:
-            user_info = await self.d2util.get_player_from_steam_id(steam_id=steam_id)
-        else:
+    async def register_block(self, d2util: destiny2.ClanUtil, bungie_name: str = "", steam_id: str = "", msg_url: str = "", description: str = "") -> bool:
+        if not (bungie_name or steam_id):
             return False
+        user_info = await self.resolver.resolve(d2util, bungie_name=bungie_name, steam_id=steam_id)
         if not user_info:
             return False
         mem_id = user_info["membershipId"]
-        self.block[mem_id] = {
-            "bungie_name": "{bungieGlobalDisplayName}#{bungieGlobalDisplayNameCode:04d}".format(**user_info),
-            "membership_id": mem_id,
-            "membership_type": user_info["membershipType"],
-            "time": int(time.time()),
-            "msg_url": msg_url,
-            "description": description
-        }
-        with open(self._path_block_list, "w", encoding="utf-8") as f:
-            json.dump(self.block, f, ensure_ascii=False, indent=2)
+        self.block[mem_id] = self._block_item(user_info, msg_url, description)
+        self.block_version += 1
+        self._block_sync.touch(mem_id)
         return True
 
-    async def deregister_block(self, bungie_name: str = "", steam_id: str = "") -> bool:
-        if bungie_name:
-            user_info = await self.d2util.search_player(bungie_name=bungie_name)
-        elif steam_id:
-            user_info = await self.d2util.get_player_from_steam_id(steam_id=steam_id)
+    async def import_block(self, d2util: destiny2.ClanUtil, entries: List[blocklist.BlockEntry], msg_url: str = "") -> Tuple[List[dict], List[Tuple[str, str]]]:
+        """여러 명을 한 번에 차단 등록, (등록한 항목, (입력, 실패 사유)) 반환
+
+        조회는 PlayerResolver 에서 동시에 처리하고, DB 기록은 모든 항목을 모아서 한 번에 한다.
+        """
+        added = []
+        failed = []
+        for entry, user_info, reason in await self.resolver.resolve_many(d2util, entries):
+            if not user_info:
+                failed.append((entry.query, reason))
+                continue
+            item = self._block_item(user_info, entry.msg_url or msg_url, entry.description or "(사유 없음)", entry.time, entry.bungie_name)
+            self.block[item["membership_id"]] = item
+            added.append(item)
+        if added:
+            self.block_version += 1
+            self._block_sync.touch(*(n["membership_id"] for n in added))
+        return added, failed
+
+    def msg_block_import(self, added: List[dict], failed: List[Tuple[str, str]]) -> List[discord.Embed]:
+        builder = embeds.EmbedBuilder(f"차단 목록 가져오기 결과 (성공 {len(added)} / 실패 {len(failed)})")
+        builder.add_rows_field(f"등록 ({len(added)})", (f"`{n['bungie_name']}`" for n in added))
+        builder.add_rows_field(f"실패 ({len(failed)})", (f"`{embeds.truncate(q, 100)}`: {reason}" for q, reason in failed))
+        return builder.build()
+
+    def export_block(self) -> discord.File:
+        return discord.File(io.BytesIO(blocklist.export_bytes(self.block)), filename="block_list.json")
+
+    async def deregister_block(self, d2util: destiny2.ClanUtil, bungie_name: str = "", steam_id: str = "") -> bool:
+        if bungie_name or steam_id:
+            user_info = await self.resolver.resolve(d2util, bungie_name=bungie_name, steam_id=steam_id)
         else:
             return False
         if not user_info:
             return False
         self.block.pop(user_info["membershipId"], None)
-        with open(self._path_block_list, "w", encoding="utf-8") as f:
-            json.dump(self.block, f, ensure_ascii=False, indent=2)
+        self.block_version += 1
+        self._block_sync.touch(user_info["membershipId"])
         return True
 
-    async def msg_block_list(self, page=1):
-        block_cnt = len(self.block)
-        max_page = (block_cnt - 1) // 10 + 1
-        if page >= 0:
-            current_page = page if 0 < page <= max_page else 1
-        else:
-            current_page = max_page + 1 + page
-            current_page = 1 if current_page <= 0 else current_page
-        block_list = [n for i, n in enumerate(self.block.values()) if (i // 10 + 1) == current_page]
-        msg_embed = discord.Embed(title=f"차단된 유저 목록 조회 ({current_page}/{max_page})", timestamp=dt.datetime.now(), color=0x00ac00)
-        if not block_list:
-            msg_embed.description = "차단된 유저가 없습니다."
-        for v in block_list:
-            msg_embed.add_field(
-                name=v['bungie_name'],
-                value=f"차단 일시: <t:{v['time']}>\n[번지넷 프로필](https://www.bungie.net/7/ko/User/Profile/{v['membership_type']}/{v['membership_id']})" +
-                      (f" / [참조 링크]({v['msg_url']})" if v.get("msg_url") else "") +
-                      f"\n```\n{v['description']}\n```",
-                inline=False
-            )
-        return msg_embed
-
-    async def msg_block_list_verify(self, joined_list: list) -> Optional[discord.Embed]:
-        blocked = [self.block[n["destinyUserInfo"]["membershipId"]] for n in joined_list if n["destinyUserInfo"]["membershipId"] in self.block]
+    @staticmethod
+    def _block_field_value(v: dict) -> str:
+        # 가져온 차단 목록의 긴 링크가 설명 자리를 모두 차지하지 않도록 먼저 줄임
+        msg_url = embeds.truncate(v.get("msg_url") or "", 512)
+        value = f"차단 일시: <t:{v['time']}>\n[번지넷 프로필](https://www.bungie.net/7/ko/User/Profile/{v['membership_type']}/{v['membership_id']})" + \
+                (f" / [참조 링크]({msg_url})" if msg_url else "")
+        # 코드 블럭이 잘리지 않도록 설명만 줄여서 필드 제한에 맞춤
+        description = embeds.truncate(v['description'], max(embeds.FIELD_VALUE_LIMIT - len(value) - 10, 0))
+        return value + f"\n```\n{description}\n```"
+
+    def _block_pager(self) -> embeds.Pager:
+        # 차단 목록이 바뀐 경우에만 페이지를 새로 나눔 (한 페이지에 10명, embed 하나에 담을 수 있는 만큼)
+        if self._block_items_version != self.block_version:
+            fields = [(embeds.truncate(v['bungie_name'], embeds.FIELD_NAME_LIMIT), self._block_field_value(v)) for v in self.block.values()]
+            self._block_items = embeds.pack_fields(fields, embeds.EMBED_TOTAL_LIMIT - embeds.TITLE_LIMIT, count=10)
+            self._block_items_version = self.block_version
+        return embeds.Pager(self._block_items, per_page=1)
+
+    async def msg_block_list(self, page=1) -> List[discord.Embed]:
+        pager = self._block_pager()
+        current_page = pager.resolve(page)
+        block_list = pager.page(current_page)[0] if pager.items else []
+        builder = embeds.EmbedBuilder(f"차단된 유저 목록 조회 ({current_page}/{pager.max_page})",
+                                      description="" if block_list else "차단된 유저가 없습니다.")
+        for name, value in block_list:
+            builder.add_field(name, value)
+        return builder.build()
+
+    async def msg_block_list_verify(self, joined_list: list) -> List[discord.Embed]:
+        blocked = [self.block[n.membership_id] for n in joined_list if n.membership_id in self.block]
         if not blocked:
-            return None
-        else:
-            msg_embed = discord.Embed(title=f":no_entry_sign: 차단된 유저의 클랜 가입 확인!!", timestamp=dt.datetime.now(), color=0x00ac00)
-            for v in blocked:
-                msg_embed.add_field(
-                    name=v['bungie_name'],
-                    value=f"차단 일시: <t:{v['time']}>\n[번지넷 프로필](https://www.bungie.net/7/ko/User/Profile/{v['membership_type']}/{v['membership_id']})" +
-                          (f" / [참조 링크]({v['msg_url']})" if v.get("msg_url") else "") +
-                          f"\n```\n{v['description']}\n```",
-                    inline=False
-                )
-            return msg_embed
-
-    async def alert(self):
-        logger.debug("Alert Task start!")
-        alert_target = [self.get_channel(n) for n in self.alert_target]
+            return []
+        builder = embeds.EmbedBuilder(":no_entry_sign: 차단된 유저의 클랜 가입 확인!!")
+        for v in blocked:
+            builder.add_field(v['bungie_name'], self._block_field_value(v))
+        return builder.build()
+
+    async def send_embeds(self, channel: discord.abc.Messageable, msg_embeds: List[discord.Embed]):
+        # 메시지당 embed 10개, 6000자 제한에 맞춰 나눠서 전송
+        for chunk in embeds.split_messages(msg_embeds):
+            with metrics.timer("discord_send", kind="reply"):
+                await channel.send(embeds=chunk)
+
+    async def edit_embeds(self, resp_msg: discord.Message, msg_embeds: List[discord.Embed]):
+        # 첫 메시지는 기존 메시지를 수정하고, 나머지는 이어서 전송
+        chunks = embeds.split_messages(msg_embeds)
+        await resp_msg.edit(embeds=chunks[0])
+        for chunk in chunks[1:]:
+            with metrics.timer("discord_send", kind="reply"):
+                await resp_msg.channel.send(embeds=chunk)
+
+    async def alert(self, d2util: destiny2.ClanUtil):
+        with metrics.timer("task", task="alert"):
+            await self._alert(d2util)
+
+    async def _alert(self, d2util: destiny2.ClanUtil):
+        logger.debug(f"Alert Task start! ({d2util.group_id})")
+        alert_target = self.alert_channels(d2util.group_id)
         # 클랜원 변화 목록 파싱
         try:
-            joined, left = await self.d2util.member_diff()
+            joined, left = await d2util.member_diff()
+        except breaker.CircuitOpenError as e:
+            # 번지 API 장애 중에는 다음 확인 주기까지 대기
+            logger.debug(f"Skip member diff ({d2util.group_id}): {e}")
+            return
         except Exception as e:
-            logger.error(f"Error occurred while getting member diff: {e}")
+            logger.error(f"Error occurred while getting member diff ({d2util.group_id}): {e}")
             return
+        self.update_rest(d2util, left)
         # 단순 출력
         if joined or left:
-            logger.info(f"Alert detected: {len(joined)}, {len(left)}")
-            msg_embed = await self.msg_members_diff(joined, left)
-            msg_blocked = await self.msg_block_list_verify(joined)
-            if msg_blocked:
-                msg_embed.append(msg_blocked)
-
-            # 대충 메시지 보내는 부분
-            for target in alert_target:
-                if target is not None:
-                    for msg in msg_embed:
-                        await target.send(embed=msg)
+            logger.info(f"Alert detected ({d2util.group_id}): {len(joined)}, {len(left)}")
+            msg_embed = await self.msg_members_diff(d2util, joined, left)
+            msg_embed.extend(await self.msg_block_list_verify(joined))
+
+            # 모든 채널에 동시에 전송, 전송이 끝날 때까지 기다리지 않음
+            self.dispatcher.submit(alert_target, msg_embed)
         else:
             pass
         logger.debug("Alert Task end")
         return
 
     async def setup_hook(self) -> None:
-        self.d2util = destiny2.ClanUtil(self._api_key, self._group_id, members_data_path=self._path_members_list)
-        await self.d2util.destiny.update_manifest("ko")
+        st = time.perf_counter()
+        self.clans = clans.ClanRegistry(
+            self._api_key, self._dir_data, self.store, self.persist, default_group_id=self._group_id, roster_ttl=self.roster_ttl,
+            profile_concurrency=self.profile_concurrency, profile_rate=self.profile_rate, profile_cache_ttl=self.profile_cache_ttl,
+            breaker_threshold=self.breaker_threshold, breaker_cooldown=self.breaker_cooldown, identities=self.identities
+        )
+        # 모든 클랜이 같은 pydest 인스턴스를 공유하므로 manifest 는 한 번만 불러옴
+        await self.clans.load_manifest("ko")
+        if self.metrics_server:
+            await self.metrics_server.start()
+        logger.info(f"Setup finished in {time.perf_counter() - st:.2f}s")
         logger.info(f"Loop task start")
         self.loop_tasks.start()
+        if self.online_poll:
+            self.online_tasks.start()
+        if self.timeseries:
+            self.timeseries_tasks.change_interval(seconds=self.timeseries_interval)
+            self.timeseries_tasks.start()
+        if self.inactivity_scan_interval:
+            self.inactivity_tasks.change_interval(seconds=self.inactivity_scan_interval)
+            self.inactivity_tasks.start()
+        self._rest_purge = asyncio.ensure_future(self.rest.run_purge())
+        # 봇 생성 중에 정리한 항목 기록
+        self.identities.persist_dropped()
+        self.rest.persist_dropped()
+        self.persist.start()
+        self._install_signal_handlers()
 
     @tasks.loop(seconds=3600)
     async def loop_tasks(self):
@@ -393,15 +609,107 @@ class DestinyBot(discord.Client):
             logger.warning(f"Discord bot client closed!!")
             return
         logger.debug("Creating tasks")
-        await self.alert()
+        # 게임 업데이트로 manifest 가 바뀌었는지 백그라운드에서 확인
+        self.clans.manifest.refresh_background("ko")
+        with metrics.timer("task", task="clan_poll"):
+            await self.clans.poll(self.alert, spread=self.clan_poll_spread, concurrency=self.clan_poll_concurrency)
         logger.debug("Creating tasks end. sleep 60 secs...")
         # 봇에서 가동중임을 확인하기 위해 최근 가동시간을 저장
         self.last_tasks_run = time.time()
+        metrics.gauge("last_tasks_run_timestamp", self.last_tasks_run)
     
     @loop_tasks.before_loop
     async def before_task(self):
         await self.wait_until_ready()
 
+    async def refresh_online_state(self, d2util: destiny2.ClanUtil):
+        state = self.online_states.get(d2util.group_id)
+        if state is None or state.d2util is not d2util:
+            state = self.online_states[d2util.group_id] = online.OnlineState(d2util)
+        if state.is_due():
+            await state.refresh()
+
+    @tasks.loop(seconds=30)
+    async def online_tasks(self):
+        # 클랜마다 접속자 수에 따라 갱신 간격이 다르므로 짧게 돌면서 갱신할 때가 된 클랜만 갱신
+        if self.is_closed():
+            return
+        with metrics.timer("task", task="online_poll"):
+            await self.clans.poll(self.refresh_online_state, spread=0, concurrency=self.clan_poll_concurrency)
+
+    @online_tasks.before_loop
+    async def before_online_task(self):
+        await self.wait_until_ready()
+
+    @tasks.loop(seconds=600)
+    async def timeseries_tasks(self):
+        # 접속중인 클랜원 목록을 기록 (클랜원 목록 캐시를 같이 사용)
+        if self.is_closed():
+            return
+        with metrics.timer("task", task="timeseries"):
+            await self.clans.poll(self.record_timeseries, spread=0, concurrency=self.clan_poll_concurrency)
+
+    @timeseries_tasks.before_loop
+    async def before_timeseries_task(self):
+        await self.wait_until_ready()
+
+    @tasks.loop(seconds=3600)
+    async def inactivity_tasks(self):
+        # 접속 상태가 바뀌었거나 오래전에 확인한 클랜원의 마지막 플레이 시각 확인
+        if self.is_closed():
+            return
+        await self.clans.poll(self.inactivity.scan, spread=0, concurrency=self.clan_poll_concurrency)
+
+    @inactivity_tasks.before_loop
+    async def before_inactivity_task(self):
+        await self.wait_until_ready()
+
+    def _install_signal_handlers(self):
+        # docker stop 의 SIGTERM 에서도 close 를 거쳐 남은 변경 사항을 기록하고 종료
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, lambda s=sig: self._on_signal(s))
+            except (NotImplementedError, RuntimeError):
+                # Windows 등 지원하지 않는 환경
+                pass
+
+    def _on_signal(self, sig: signal.Signals):
+        logger.info(f"Received {sig.name}, shutting down")
+        asyncio.ensure_future(self.close())
+
+    async def __aexit__(self, *args) -> None:
+        # 종료 신호로 시작된 close 가 끝날 때까지 기다림 (discord.py 는 자체 종료 작업만 기다림)
+        await self.close()
+
+    async def close(self) -> None:
+        # 여러 번 호출되어도 한 번만 종료
+        if self._close_task is None:
+            self._close_task = asyncio.ensure_future(self._close())
+        await asyncio.shield(self._close_task)
+
+    async def _close(self) -> None:
+        # 반복 작업을 먼저 멈춰서 DB 를 닫은 다음 새로 기록하는 일이 없도록 함
+        loops = [self.loop_tasks, self.online_tasks, self.timeseries_tasks, self.inactivity_tasks]
+        running = [n.get_task() for n in loops if n.is_running()]
+        for n in loops:
+            n.cancel()
+        if self._rest_purge is not None:
+            self._rest_purge.cancel()
+            running.append(self._rest_purge)
+        await asyncio.gather(*running, return_exceptions=True)
+        await self.dispatcher.close()
+        await super(DestinyBot, self).close()
+        await self.inactivity.close()
+        if self.clans:
+            await self.clans.close()
+        # 남은 변경 사항을 모두 기록한 다음 DB 닫기
+        await self._series_writer.close()
+        await self.persist.close()
+        self.store.close()
+        if self.metrics_server:
+            await self.metrics_server.close()
+
     def run(self, *args, **kwargs):
         # super 실행
         super(DestinyBot, self).run(*args, **kwargs)
@@ -0,0 +1,131 @@
+import logging
+import time
+from typing import Optional
+
+import pydest
+
+import metrics
+
+
+logger = logging.getLogger("breaker")
+
+# 번지 서버 점검 (SystemDisabled), 바로 차단
+OUTAGE_ERROR_CODES = {5}
+# 번지 API 요청 제한 관련 ErrorCode (ThrottleLimitExceeded, PerEndpointRequestThrottleExceeded 등)
+THROTTLE_ERROR_CODES = {35, 36, 37, 38, 51, 52, 53, 54, 55}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(pydest.PydestException):
+    """차단 중이라 요청을 보내지 않음 (기존 pydest 예외 처리에서 같이 처리됨)"""
+    def __init__(self, retry_after: float):
+        super().__init__(f"Bungie API circuit open, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """번지 API 장애 감지
+
+    점검 응답(ErrorCode 5)을 받으면 바로, 요청 제한 응답이나 시간 초과, 연결 오류가 threshold 번 연속되면
+    cooldown 초 동안 요청을 보내지 않고 바로 CircuitOpenError 를 낸다.
+    cooldown 이 지나면 요청 하나만 시험으로 보내서(half open) 성공하면 정상 상태로 돌아가고,
+    실패하면 cooldown 을 두 배로 늘려서(최대 max_cooldown) 다시 차단한다.
+    slow 초 이상 기다리다 취소된 요청도 시간 초과로 취급한다.
+    """
+    def __init__(self, threshold: int = 5, cooldown: float = 30, max_cooldown: float = 300, slow: float = 5):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.slow = slow
+        self.state = CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_at: Optional[float] = None
+        self.last_reason = ""
+        self._probing = False
+        metrics.gauge("bungie_circuit_open", 0)
+
+    @property
+    def closed(self) -> bool:
+        return self.state == CLOSED
+
+    @property
+    def blocked(self) -> bool:
+        # allow() 와 달리 상태를 바꾸지 않고 지금 요청이 거절될지만 확인
+        if self.state == OPEN:
+            return self.retry_after > 0
+        return self.state == HALF_OPEN and self._probing
+
+    @property
+    def retry_after(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.cooldown - time.monotonic())
+
+    def _set_state(self, state: str):
+        if state == self.state:
+            return
+        logger.warning(f"Bungie API circuit {self.state} -> {state}" + (f" ({self.last_reason})" if state == OPEN else ""))
+        self.state = state
+        metrics.inc("bungie_circuit_transitions_total", state=state)
+        metrics.gauge("bungie_circuit_open", 0 if state == CLOSED else 1)
+
+    def allow(self) -> bool:
+        """요청을 보내도 되는지 확인, half open 상태에서는 시험 요청 하나만 허용"""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and self.retry_after <= 0:
+            self._set_state(HALF_OPEN)
+        if self.state == HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        metrics.inc("bungie_circuit_rejected_total")
+        return False
+
+    def check(self):
+        if not self.allow():
+            raise CircuitOpenError(self.retry_after)
+
+    def success(self):
+        self.failures = 0
+        self._probing = False
+        if self.state != CLOSED:
+            self.cooldown = self.base_cooldown
+            self.opened_at = None
+            self._set_state(CLOSED)
+
+    def failure(self, reason: str, trip: bool = False):
+        self.failures += 1
+        self.last_reason = reason
+        metrics.inc("bungie_circuit_failures_total", reason=reason)
+        if self.state == HALF_OPEN:
+            # 시험 요청 실패, 더 길게 차단
+            self._probing = False
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._open()
+        elif self.state == CLOSED and (trip or self.failures >= self.threshold):
+            self._open()
+
+    def release(self, elapsed: float = 0.0):
+        """결과 없이 취소된 요청, 오래 기다린 요청은 시간 초과로 취급"""
+        if elapsed >= self.slow:
+            self.failure("timeout")
+        elif self._probing:
+            self._probing = False
+
+    def record(self, resp: dict):
+        # 번지 API 응답의 ErrorCode 로 판단 (유저를 찾을 수 없음 같은 일반 오류는 정상 응답으로 취급)
+        code = resp.get("ErrorCode") if isinstance(resp, dict) else None
+        if code in OUTAGE_ERROR_CODES:
+            self.failure(resp.get("ErrorStatus") or f"error {code}", trip=True)
+        elif code in THROTTLE_ERROR_CODES:
+            self.failure("throttled")
+        else:
+            self.success()
+
+    def _open(self):
+        self.opened_at = time.monotonic()
+        self._set_state(OPEN)
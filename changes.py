@@ -0,0 +1,81 @@
+from typing import Dict, List, NamedTuple, Optional
+
+import roster
+
+
+# 클랜 등급 (GroupV2 RuntimeGroupMemberType)
+MEMBER_TYPES = {0: "없음", 1: "입문자", 2: "멤버", 3: "관리자", 4: "대리 창립자", 5: "창립자"}
+
+
+class Fingerprint(NamedTuple):
+    """클랜원 변동 확인에 필요한 필드만 모은 값 (알림 메시지 출력에 필요한 정보 포함)"""
+    bungie_name: str
+    bungie_name_code: Optional[int]
+    display_name: str
+    membership_type: int
+    cross_save_override: int
+    member_type: int
+    bnet_membership_type: Optional[int]
+    bnet_membership_id: Optional[str]
+    bnet_display_name: str
+
+    @property
+    def full_bungie_name(self) -> str:
+        if self.bungie_name and self.bungie_name_code is not None:
+            return f"{self.bungie_name}#{self.bungie_name_code:04d}"
+        return self.display_name
+
+    def to_member(self, membership_id: str) -> roster.Member:
+        # 클랜을 나간 클랜원을 출력할 때 사용 (접속 정보는 없음)
+        return roster.Member(membership_id, membership_type=self.membership_type, cross_save_override=self.cross_save_override,
+                             display_name=self.display_name, global_name=self.bungie_name, global_code=self.bungie_name_code,
+                             member_type=self.member_type, bnet_membership_id=self.bnet_membership_id,
+                             bnet_membership_type=self.bnet_membership_type, bnet_display_name=self.bnet_display_name)
+
+
+class MemberChange(NamedTuple):
+    kind: str           # join, leave, rename, rank, platform
+    membership_id: str
+    old: str
+    new: str
+
+
+def fingerprint(member: roster.Member) -> Fingerprint:
+    return Fingerprint(
+        bungie_name=member.global_name,
+        bungie_name_code=member.global_code,
+        display_name=member.display_name,
+        membership_type=member.membership_type,
+        cross_save_override=member.cross_save_override,
+        member_type=member.member_type,
+        bnet_membership_type=member.bnet_membership_type,
+        bnet_membership_id=member.bnet_membership_id,
+        bnet_display_name=member.bnet_display_name,
+    )
+
+
+def fingerprints(members: List[roster.Member]) -> Dict[str, Fingerprint]:
+    return {n.membership_id: fingerprint(n) for n in members}
+
+
+def diff(old: Dict[str, Fingerprint], new: Dict[str, Fingerprint]) -> List[MemberChange]:
+    """가입, 탈퇴, 번지 이름 변경, 등급 변경, 플랫폼 변경을 한 번에 확인"""
+    result = []
+    for k, fp in new.items():
+        before = old.get(k)
+        if before is None:
+            result.append(MemberChange("join", k, "", fp.full_bungie_name))
+            continue
+        if before == fp:
+            continue
+        if before.full_bungie_name != fp.full_bungie_name:
+            result.append(MemberChange("rename", k, before.full_bungie_name, fp.full_bungie_name))
+        if before.member_type != fp.member_type:
+            result.append(MemberChange("rank", k, MEMBER_TYPES.get(before.member_type, str(before.member_type)),
+                                       MEMBER_TYPES.get(fp.member_type, str(fp.member_type))))
+        if (before.membership_type, before.cross_save_override) != (fp.membership_type, fp.cross_save_override):
+            result.append(MemberChange("platform", k, f"{before.membership_type}/{before.cross_save_override}",
+                                       f"{fp.membership_type}/{fp.cross_save_override}"))
+    for k in old.keys() - new.keys():
+        result.append(MemberChange("leave", k, old[k].full_bungie_name, ""))
+    return result
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import breaker
+import destiny2
+import fetcher
+import identity
+import manifest
+import persist
+import storage
+import transport
+
+
+logger = logging.getLogger("clans")
+
+
+class ClanRegistry:
+    """디스코드 서버(guild)별 클랜 목록 관리
+
+    모든 ClanUtil 이 하나의 pydest 인스턴스(HTTP 세션, manifest)를 공유한다.
+    HTTP 세션은 연결 재사용, DNS 캐시, gzip, 엔드포인트별 시간 제한이 설정된 공용 세션을 사용하고,
+    번지 API 장애 감지(circuit breaker)도 모든 클랜이 공유한다.
+    guild_id 0 은 별도로 등록되지 않은 서버들이 사용하는 기본 클랜.
+    """
+    def __init__(self, api_key: str, dir_data: str, store: storage.Storage, writer: persist.WriteBehind, default_group_id: int = 0, registry_path: str = "clan_list.json", roster_ttl: float = 60,
+                 profile_concurrency: int = 8, profile_rate: float = 10, profile_cache_ttl: float = 60,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30, identities: identity.IdentityCache = None):
+        self.session = transport.create_session()
+        self.breaker = breaker.CircuitBreaker(threshold=breaker_threshold, cooldown=breaker_cooldown)
+        self.destiny = transport.create_destiny(api_key, self.session, self.breaker)
+        self.activity_table = manifest.ActivityTable()
+        self.manifest = manifest.ManifestManager(self.destiny, os.path.join(dir_data, "manifest"), self.activity_table)
+        # 모든 클랜의 GetProfile 요청은 하나의 풀을 거쳐 요청 제한을 공유
+        self.profile_fetcher = fetcher.ProfileFetcher(self.destiny, concurrency=profile_concurrency, rate=profile_rate, cache_ttl=profile_cache_ttl)
+        self._api_key = api_key
+        self._dir_data = dir_data
+        self.store = store
+        self.writer = writer
+        self._path_registry = os.path.join(dir_data, registry_path)
+        self.default_group_id = default_group_id
+        self.roster_ttl = roster_ttl
+        self.identities = identities
+        self.guilds: Dict[int, int] = {}                    # guild_id -> group_id
+        self.clans: Dict[int, destiny2.ClanUtil] = {}       # group_id -> ClanUtil
+
+        if not os.path.exists(self._path_registry):
+            with open(self._path_registry, "w", encoding="utf-8") as f:
+                f.write("{}")
+        with open(self._path_registry, "r", encoding="utf-8") as f:
+            self.guilds = {int(k): int(v) for k, v in json.load(f).items()}
+
+        if default_group_id:
+            self._get_or_create(default_group_id)
+        for group_id in self.guilds.values():
+            self._get_or_create(group_id)
+
+    def members_data_path(self, group_id: int) -> str:
+        # 예전 버전에서 사용하던 클랜원 목록 json 파일 (DB 로 옮겨오기 위해 사용)
+        if group_id == self.default_group_id:
+            return os.path.join(self._dir_data, "members.json")
+        return os.path.join(self._dir_data, f"members_{group_id}.json")
+
+    def _get_or_create(self, group_id: int) -> destiny2.ClanUtil:
+        if group_id not in self.clans:
+            self.store.migrate_roster(group_id, self.members_data_path(group_id))
+            self.clans[group_id] = destiny2.ClanUtil(self._api_key, group_id, store=self.store, writer=self.writer,
+                                                       destiny=self.destiny, roster_ttl=self.roster_ttl,
+                                                       activity_table=self.activity_table, profile_fetcher=self.profile_fetcher,
+                                                       identities=self.identities)
+        return self.clans[group_id]
+
+    def _save(self):
+        def snapshot():
+            data = {str(k): v for k, v in self.guilds.items()}
+            return lambda: persist.atomic_write_json(self._path_registry, data, indent=2)
+        self.writer.mark("clan_list", snapshot)
+
+    def get(self, guild_id: int = 0) -> Optional[destiny2.ClanUtil]:
+        group_id = self.guilds.get(guild_id, self.default_group_id)
+        return self.clans.get(group_id)
+
+    def guilds_of(self, group_id: int) -> List[int]:
+        return [k for k, v in self.guilds.items() if v == group_id]
+
+    def register(self, guild_id: int, group_id: int) -> destiny2.ClanUtil:
+        self.guilds[guild_id] = group_id
+        self._save()
+        return self._get_or_create(group_id)
+
+    def unregister(self, guild_id: int) -> bool:
+        group_id = self.guilds.pop(guild_id, None)
+        if group_id is None:
+            return False
+        self._save()
+        # 더 이상 아무 서버도 사용하지 않는 클랜은 폴링 대상에서 제외
+        if group_id != self.default_group_id and group_id not in self.guilds.values():
+            self.clans.pop(group_id, None)
+        return True
+
+    async def load_manifest(self, language: str = "ko"):
+        # 프로세스당 한 번만 불러오고, manifest 파일이 바뀐 경우에만 활동 이름 표를 새로 만듦
+        await self.manifest.load(language)
+
+    async def poll(self, func: Callable[[destiny2.ClanUtil], Awaitable], spread: float = 600, concurrency: int = 4):
+        """등록된 모든 클랜에 대해 func 실행
+
+        매 시간 정각에 요청이 몰리지 않도록 spread 초에 걸쳐 시작 시간을 나누고,
+        동시에 실행되는 요청 수는 concurrency 개로 제한한다.
+        """
+        clans = list(self.clans.values())
+        if not clans:
+            return
+        step = spread / len(clans)
+        sem = asyncio.Semaphore(concurrency)
+
+        async def _run(i: int, clan: destiny2.ClanUtil):
+            await asyncio.sleep(i * step)
+            async with sem:
+                try:
+                    await func(clan)
+                except Exception as e:
+                    logger.error(f"Error occurred while polling clan {clan.group_id}: {e}")
+
+        await asyncio.gather(*[_run(i, clan) for i, clan in enumerate(clans)])
+
+    async def close(self):
+        await transport.close_session(self.session)
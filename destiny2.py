@@ -1,11 +1,20 @@
 import asyncio
 import datetime as dt
-import json
-import os
 import logging
+from typing import List, Optional
 
 import pydest
 
+import changes
+import fetcher
+import identity
+import manifest
+import metrics
+import persist
+import roster
+import storage
+import transport
+
 
 logger = logging.getLogger("d2util")
 
@@ -14,87 +23,118 @@ def str_to_datetime(date_time: str):
     return dt.datetime.fromisoformat(date_time)
 
 
-def get_bungie_name(group_member: dict) -> str:
-    if group_member["destinyUserInfo"]["bungieGlobalDisplayName"] and group_member["destinyUserInfo"].get("bungieGlobalDisplayNameCode") is not None:
-        return f"{group_member['destinyUserInfo']['bungieGlobalDisplayName']}#{group_member['destinyUserInfo']['bungieGlobalDisplayNameCode']}"
-    else:
-        pass
-
-
 class ClanUtil:
-    def __init__(self, api_key: str, group_id: int, members_data_path="members.json"):
-        self.destiny = pydest.Pydest(api_key)
+    def __init__(self, api_key: str, group_id: int, store: storage.Storage = None, writer: persist.WriteBehind = None, destiny: pydest.Pydest = None, roster_ttl: float = 60,
+                 activity_table: manifest.ActivityTable = None, profile_fetcher: fetcher.ProfileFetcher = None,
+                 identities: identity.IdentityCache = None):
+        # 여러 클랜이 하나의 pydest 인스턴스(HTTP 세션, manifest)를 공유할 수 있음
+        self.destiny = destiny if destiny is not None else transport.create_destiny(api_key, transport.create_session())
+        self.activity_table = activity_table if activity_table is not None else manifest.ActivityTable()
+        self.profile_fetcher = profile_fetcher if profile_fetcher is not None else fetcher.ProfileFetcher(self.destiny)
         self.group_id = group_id
-        self.members_data_path = members_data_path
-        self.members_data_cache = []
-        if not os.path.exists(members_data_path):
-            with open(members_data_path, "w", encoding="utf-8") as f:
-                f.write("[]")
-
-    def find_member_from_cache(self, bungie_name: str = None, membership_id: int = None) -> dict:
-        for n in self.members_data_cache:
-            if bungie_name and bungie_name == get_bungie_name(n):
-                return n
-            elif membership_id and membership_id == n["destinyUserInfo"]["membershipId"]:
-                return n
-        else:
-            return {}
+        self.store = store if store is not None else storage.Storage(":memory:")
+        self.writer = writer if writer is not None else persist.WriteBehind()
+        # 클랜원 목록을 받을 때마다 번지 이름 -> membershipId 대응 관계 갱신
+        self.identities = identities
+        # 마지막으로 변동 확인을 마친 클랜원 목록 (색인 포함)
+        self.members_snapshot = roster.RosterSnapshot(0, [])
+        # 다음 변동 확인에 사용할 클랜원별 fingerprint (이전 목록 전체는 보관하지 않음)
+        self.fingerprints = {}
+        self.last_changes = []
+        self._unsaved_changes = []
+        # 미접, 온라인, 클랜원 변동 확인 모두 같은 클랜원 목록 캐시를 사용
+        self.roster = roster.RosterCache(self._fetch_members, ttl=roster_ttl)
+
+    @property
+    def outage(self) -> bool:
+        # 번지 API 장애로 요청을 차단 중인지 (시험 요청 중 포함)
+        circuit = getattr(self.destiny.api, "breaker", None)
+        return circuit is not None and not circuit.closed
+
+    @property
+    def degraded(self) -> bool:
+        # 장애 중이거나 마지막 클랜원 목록 갱신에 실패해서 예전 목록을 사용 중인지
+        return self.outage or self.roster.stale
+
+    @property
+    def members_data_cache(self) -> list:
+        return self.members_snapshot.members
+
+    def find_member_from_cache(self, bungie_name: str = None, membership_id: int = None) -> Optional[roster.Member]:
+        # 변동 확인 전이라도 가장 최근에 받은 클랜원 목록에서 찾음
+        snapshot = self.roster.snapshot if self.roster.snapshot is not None else self.members_snapshot
+        return snapshot.find(bungie_name=bungie_name, membership_id=membership_id)
+
+    async def _fetch_members(self) -> List[roster.Member]:
+        # 번지 API 서버 요청
+        with metrics.timer("bungie_request", endpoint="GetMembersOfGroup") as t:
+            resp = await self.destiny.api.get_members_of_group(self.group_id)
+            t.result = fetcher.response_result(resp)
+        # 응답은 여기서 한 번만 읽고 필요한 필드만 남김
+        members = [roster.Member.from_dict(n) for n in resp["Response"]["results"]]
+        if self.identities is not None:
+            self.identities.observe_members(members)
+        return members
 
     async def member_diff(self):
-        # 번지 API 서버 요청
-        resp = await self.destiny.api.get_members_of_group(self.group_id)
-        raw_new: list = resp["Response"]["results"]
-        if self.members_data_cache:
-            raw_old: list = self.members_data_cache
-        else:
-            with open(self.members_data_path, "r", encoding="utf-8") as f:
-                raw_old: list = json.load(f)
-            # 파일도 비어있는 경우 새로 저장한 다음 바로 비어있는 리스트 반환
-            if not raw_old:
-                with open(self.members_data_path, "w", encoding="utf-8") as f:
-                    json.dump(raw_new, f, ensure_ascii=False, indent=2)
+        # 예전 목록과 비교하면 변동이 없는 것으로 보이므로 갱신에 실패하면 그대로 예외 발생
+        snapshot = await self.roster.get(allow_stale=False)
+        raw_new: list = snapshot.members
+        fp_new = changes.fingerprints(raw_new)
+        if not self.fingerprints:
+            saved = await asyncio.to_thread(self.store.load_roster, self.group_id)
+            self.fingerprints = changes.fingerprints([roster.Member.from_dict(n) for n in saved])
+            # DB 도 비어있는 경우 새로 저장한 다음 바로 비어있는 리스트 반환
+            if not self.fingerprints:
+                self.members_snapshot = snapshot
+                self.fingerprints = fp_new
+                self._save_roster()
                 return [], []
 
-        # 집합 변환 후 변화 감지
-        set_new = set(n["destinyUserInfo"]["membershipId"] for n in raw_new)
-        set_old = set(n["destinyUserInfo"]["membershipId"] for n in raw_old)
-        set_joined = set_new - set_old
-        set_leaved = set_old - set_new
+        # 가입, 탈퇴, 이름/등급/플랫폼 변경 확인 후 기록
+        self.last_changes = changes.diff(self.fingerprints, fp_new)
+        self._unsaved_changes.extend(self.last_changes)
 
-        # 대상자들 데이터 별도 list 화
-        list_joined = [n for n in raw_new if n["destinyUserInfo"]["membershipId"] in set_joined]
-        list_leaved = [n for n in raw_old if n["destinyUserInfo"]["membershipId"] in set_leaved]
+        # 대상자들 데이터 별도 list 화, 탈퇴한 클랜원은 fingerprint 에서 복원
+        list_joined = [snapshot.by_id[n.membership_id] for n in self.last_changes if n.kind == "join"]
+        list_leaved = [self.fingerprints[n.membership_id].to_member(n.membership_id) for n in self.last_changes if n.kind == "leave"]
 
-        # 파일, 메모리에 저장
-        self.members_data_cache = raw_new
-        with open(self.members_data_path, "w", encoding="utf-8") as f:
-            json.dump(raw_new, f, ensure_ascii=False, indent=2)
+        # DB, 메모리에 저장 (바뀐 클랜원만 기록)
+        self.members_snapshot = snapshot
+        self.fingerprints = fp_new
+        self._save_roster()
 
         # 감지한 사람들 return
         return list_joined, list_leaved
 
-    async def members_offline_time(self, cut_day=21) -> list:
-        # 클랜원 목록 불러오기
-        resp = await self.destiny.api.get_members_of_group(self.group_id)
-        members: list = resp["Response"]["results"]
+    def _save_roster(self):
+        def snapshot():
+            members = self.members_snapshot.members
+            items, self._unsaved_changes = self._unsaved_changes, []
+
+            def write():
+                if items:
+                    self.store.append_changes(self.group_id, items)
+                self.store.save_roster(self.group_id, [n.to_dict() for n in members])
+            return write
+        self.writer.mark(f"roster_{self.group_id}", snapshot)
 
-        # 커트라인 제작
+    async def members_offline_time(self, cut_day=21, max_age: float = 3600) -> list:
+        # 클랜원 목록 불러오기, 일 단위 커트라인이므로 max_age 초 이내의 목록이면 재사용
+        snapshot = await self.roster.get(max_age=max_age)
+
+        # 커트라인 제작, 목록이 이미 마지막 접속 시간 순으로 정렬되어 있음
         today = dt.datetime.now().timestamp()
         cut_line = today - cut_day * 86400
-        target = [n for n in members
-                  if int(n["lastOnlineStatusChange"]) < cut_line]
-        target.sort(key=lambda x: x["lastOnlineStatusChange"])      # 보기 쉽게 정렬
-        return target
+        return snapshot.offline_before(cut_line)
 
-    async def online_members(self):
-        resp = await self.destiny.api.get_members_of_group(self.group_id)
-        members: list = resp["Response"]["results"]
-        online = filter(lambda x: x.get("isOnline"), members)
-        return online
+    async def online_members(self) -> list:
+        snapshot = await self.roster.get()
+        return [n for n in snapshot.members if n.is_online]
 
     async def user_activity(self, membership_type: int, membership_id: int) -> tuple:
         try:
-            resp = await asyncio.wait_for(self.destiny.api.get_profile(membership_type, membership_id, [204]), timeout=10)
+            resp = await self.profile_fetcher.get_profile(membership_type, membership_id, [204], timeout=10)
         except asyncio.TimeoutError:
             logger.warning(f"{membership_id} / Request Timeout")
             return "온라인(시간 초과)",
@@ -107,6 +147,11 @@ class ClanUtil:
         recent = sorted(resp['Response']['characterActivities']['data'].values(), key=lambda x: x["dateActivityStarted"])[-1]
         if not recent["currentActivityHash"]:
             return "온라인",
+        # 미리 만들어둔 활동 이름 표에서 찾기
+        if self.activity_table:
+            decoded = self.activity_table.decode(recent["currentActivityHash"], recent["currentActivityModeHash"])
+            if decoded is not None:
+                return decoded
         activity = await self.destiny.decode_hash(recent["currentActivityHash"], "DestinyActivityDefinition", language="ko")
         if not activity["displayProperties"]["name"]:
             # 궤도상에 있는 경우
@@ -117,25 +162,19 @@ class ClanUtil:
             activity_mode = await self.destiny.decode_hash(activity["activityTypeHash"], "DestinyActivityTypeDefinition", language="ko")
         return activity_mode["displayProperties"]["name"], activity["displayProperties"]["name"]
 
-    async def is_member_in_clan(self, bungie_name: str, membership_id: int = 0) -> dict:
+    async def is_member_in_clan(self, bungie_name: str, membership_id: int = 0) -> Optional[roster.Member]:
         if bungie_name:
-            bungie_name_list = [n for n in self.members_data_cache if get_bungie_name(n) == bungie_name]
-            if bungie_name_list:
-                return bungie_name_list[0]
-            else:
-                return {}
+            return self.find_member_from_cache(bungie_name=bungie_name)
         elif membership_id:
-            bungie_id_list = [n for n in self.members_data_cache if int(n["destinyUserInfo"]["membershipId"]) == membership_id]
-            if membership_id in bungie_id_list:
-                return bungie_id_list[0]
-            else:
-                return {}
+            return self.find_member_from_cache(membership_id=membership_id)
         else:
-            return {}
+            return None
 
     async def search_player(self, bungie_name: str) -> dict:
         try:
-            resp = await self.destiny.api.search_destiny_player(-1, bungie_name)
+            with metrics.timer("bungie_request", endpoint="SearchDestinyPlayer") as t:
+                resp = await self.destiny.api.search_destiny_player(-1, bungie_name)
+                t.result = fetcher.response_result(resp)
         except asyncio.TimeoutError:
             return {}
 
@@ -145,9 +184,25 @@ class ClanUtil:
         else:
             return resp["Response"][0]
 
+    async def get_player_from_membership_id(self, membership_id: str) -> dict:
+        # 멤버쉽 ID 로 플랫폼 계정 정보 조회 (membership_type 을 모르는 경우)
+        with metrics.timer("bungie_request", endpoint="GetMembershipDataById") as t:
+            resp = await self.destiny.api.get_membership_data_by_id(membership_id)
+            t.result = fetcher.response_result(resp)
+        if not resp.get("Response") or resp.get("ErrorCode") != 1:
+            return {}
+        memberships = resp["Response"].get("destinyMemberships") or []
+        for n in memberships:
+            if str(n.get("membershipId")) == str(membership_id):
+                return n
+        return memberships[0] if memberships else {}
+
     async def _get_membership_from_hard_linked_credential(self, credential: str, cr_type: int = 12):
         url = pydest.api.USER_URL + f"GetMembershipFromHardLinkedCredential/{cr_type}/{credential}/"
-        return await self.destiny.api._get_request(url)
+        with metrics.timer("bungie_request", endpoint="GetMembershipFromHardLinkedCredential") as t:
+            resp = await self.destiny.api._get_request(url)
+            t.result = fetcher.response_result(resp)
+        return resp
 
     async def get_player_from_steam_id(self, steam_id: str) -> dict:
         resp = await self._get_membership_from_hard_linked_credential(steam_id)
@@ -155,5 +210,7 @@ class ClanUtil:
             # 결과가 비어있거나 (해당 유저가 없거나), 오류 발생한 경우
             return {}
         d = resp["Response"]
-        resp2 = await self.destiny.api.get_membership_data_by_id(d["membershipId"], d["membershipType"])
+        with metrics.timer("bungie_request", endpoint="GetMembershipDataById") as t:
+            resp2 = await self.destiny.api.get_membership_data_by_id(d["membershipId"], d["membershipType"])
+            t.result = fetcher.response_result(resp2)
         return resp2["Response"]["destinyMemberships"][0]
@@ -0,0 +1,74 @@
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Sequence, Set
+
+import discord
+
+import embeds
+import metrics
+
+
+logger = logging.getLogger("dispatch")
+
+
+class AlertDispatcher:
+    """알림 메시지를 여러 채널에 동시에 전송
+
+    embed 는 메시지당 최대 10개씩 묶어서 보내고, 같은 채널에는 순서대로 하나씩 보낸다.
+    일시적인 오류는 재시도하고, 권한이 없거나 삭제된 채널은 on_unreachable 로 알린다.
+    """
+    def __init__(self, retries: int = 3, on_unreachable: Callable[[int], None] = None):
+        self.retries = retries
+        self.on_unreachable = on_unreachable
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def submit(self, channels: Sequence[discord.abc.Messageable], msg_embeds: List[discord.Embed]) -> Optional[asyncio.Task]:
+        """전송을 백그라운드에서 시작하고 바로 반환"""
+        if not channels or not msg_embeds:
+            return None
+        task = asyncio.ensure_future(self.send(channels, msg_embeds))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def send(self, channels: Sequence[discord.abc.Messageable], msg_embeds: List[discord.Embed]):
+        messages = embeds.split_messages(msg_embeds)
+        await asyncio.gather(*[self._send_channel(channel, messages) for channel in channels])
+
+    async def _send_channel(self, channel: discord.abc.Messageable, messages: List[List[discord.Embed]]):
+        lock = self._locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            for chunk in messages:
+                if not await self._send_retry(channel, chunk):
+                    return
+
+    async def _send_retry(self, channel: discord.abc.Messageable, chunk: List[discord.Embed]) -> bool:
+        for attempt in range(self.retries + 1):
+            try:
+                with metrics.timer("discord_send", kind="alert"):
+                    await channel.send(embeds=chunk)
+                return True
+            except (discord.Forbidden, discord.NotFound) as e:
+                logger.warning(f"Alert channel {channel.id} is unreachable: {e}")
+                if self.on_unreachable is not None:
+                    self.on_unreachable(channel.id)
+                return False
+            except discord.HTTPException as e:
+                if attempt == self.retries or (e.status < 500 and e.status != 429):
+                    logger.error(f"Failed to send alert to {channel.id}: {e}")
+                    return False
+                delay = getattr(e, "retry_after", None) or 2 ** attempt
+                logger.info(f"Retry sending alert to {channel.id} after {delay}s ({e.status})")
+                await asyncio.sleep(delay)
+            except (asyncio.TimeoutError, OSError) as e:
+                if attempt == self.retries:
+                    logger.error(f"Failed to send alert to {channel.id}: {e}")
+                    return False
+                await asyncio.sleep(2 ** attempt)
+        return False
+
+    async def close(self):
+        # 전송중인 알림은 끝까지 보냄
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,131 @@
+import datetime as dt
+from typing import Iterable, List, Sequence, Tuple
+
+import discord
+
+
+# 디스코드 embed 제한
+TITLE_LIMIT = 256
+DESCRIPTION_LIMIT = 4096
+FIELD_NAME_LIMIT = 256
+FIELD_VALUE_LIMIT = 1024
+FIELD_COUNT_LIMIT = 25
+EMBED_TOTAL_LIMIT = 6000
+EMBEDS_PER_MESSAGE = 10
+
+
+def truncate(s: str, limit: int) -> str:
+    if limit <= 0:
+        return ""
+    return s if len(s) <= limit else s[:limit - 1] + "…"
+
+
+def pack_rows(rows: Iterable[str], limit: int, sep: str = "\n") -> List[str]:
+    """줄 단위로 limit 글자를 넘지 않게 묶음 (한 줄이 limit 보다 길면 잘라냄)"""
+    chunks = []
+    current = []
+    size = 0
+    for row in rows:
+        row = truncate(row, limit)
+        if current and size + len(sep) + len(row) > limit:
+            chunks.append(sep.join(current))
+            current = []
+            size = 0
+        size += len(row) + (len(sep) if current else 0)
+        current.append(row)
+    if current:
+        chunks.append(sep.join(current))
+    return chunks
+
+
+def pack_fields(fields: Iterable[Tuple[str, str]], limit: int, count: int = FIELD_COUNT_LIMIT) -> List[List[Tuple[str, str]]]:
+    """(이름, 값) 필드를 한 묶음에 count 개, 합계 limit 글자를 넘지 않게 묶음"""
+    chunks = []
+    current = []
+    size = 0
+    for name, value in fields:
+        if current and (len(current) >= count or size + len(name) + len(value) > limit):
+            chunks.append(current)
+            current = []
+            size = 0
+        size += len(name) + len(value)
+        current.append((name, value))
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class EmbedBuilder:
+    """디스코드 제한(필드 1024자, 설명 4096자, 필드 25개, embed 당 6000자)에 맞춰 여러 embed 로 나눠 담음"""
+    def __init__(self, title: str, description: str = "", color: int = 0x00ac00, timestamp: dt.datetime = None):
+        self.title = truncate(title, TITLE_LIMIT)
+        self.color = color
+        self.timestamp = timestamp if timestamp is not None else dt.datetime.now()
+        self.embeds: List[discord.Embed] = []
+        self._new(self.title, description)
+
+    def _new(self, title: str = None, description: str = "") -> discord.Embed:
+        embed = discord.Embed(title=title or truncate(f"{self.title} (+)", TITLE_LIMIT),
+                              description=description or None, timestamp=self.timestamp, color=self.color)
+        self.embeds.append(embed)
+        return embed
+
+    def add_field(self, name: str, value: str, inline: bool = False):
+        name = truncate(name, FIELD_NAME_LIMIT)
+        value = truncate(value, FIELD_VALUE_LIMIT)
+        embed = self.embeds[-1]
+        if len(embed.fields) >= FIELD_COUNT_LIMIT or len(embed) + len(name) + len(value) > EMBED_TOTAL_LIMIT:
+            embed = self._new()
+        embed.add_field(name=name, value=value, inline=inline)
+
+    def add_rows_field(self, name: str, rows: Iterable[str], inline: bool = False):
+        for i, chunk in enumerate(pack_rows(rows, FIELD_VALUE_LIMIT)):
+            self.add_field(name if i == 0 else f"{name} (+)", chunk, inline=inline)
+
+    def add_description_rows(self, rows: Iterable[str]):
+        for chunk in pack_rows(rows, DESCRIPTION_LIMIT):
+            embed = self.embeds[-1]
+            if embed.description or embed.fields or len(embed) + len(chunk) > EMBED_TOTAL_LIMIT:
+                embed = self._new()
+            embed.description = chunk
+
+    def build(self) -> List[discord.Embed]:
+        return self.embeds
+
+
+def split_messages(embeds: Sequence[discord.Embed]) -> List[List[discord.Embed]]:
+    """메시지 하나에 embed 10개, 전체 6000자를 넘지 않도록 나눔"""
+    messages = []
+    current = []
+    size = 0
+    for embed in embeds:
+        if current and (len(current) >= EMBEDS_PER_MESSAGE or size + len(embed) > EMBED_TOTAL_LIMIT):
+            messages.append(current)
+            current = []
+            size = 0
+        current.append(embed)
+        size += len(embed)
+    if current:
+        messages.append(current)
+    return messages
+
+
+class Pager:
+    """순서가 있는 목록을 페이지 단위로 바로 잘라서 보여줌 (음수 페이지는 뒤에서부터)"""
+    def __init__(self, items: Sequence, per_page: int = 10):
+        self.items = items
+        self.per_page = per_page
+
+    @property
+    def max_page(self) -> int:
+        return (len(self.items) - 1) // self.per_page + 1
+
+    def resolve(self, page: int) -> int:
+        if page >= 0:
+            return page if 0 < page <= self.max_page else 1
+        page = self.max_page + 1 + page
+        return 1 if page <= 0 else page
+
+    def page(self, page: int) -> Sequence:
+        start = (page - 1) * self.per_page
+        return self.items[start:start + self.per_page]
@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Tuple
+
+import pydest
+
+import breaker
+import metrics
+
+
+logger = logging.getLogger("fetcher")
+
+THROTTLE_ERROR_CODES = breaker.THROTTLE_ERROR_CODES
+
+
+def response_result(resp: dict) -> str:
+    # metrics 에 기록할 응답 결과
+    code = resp.get("ErrorCode")
+    if code == 1:
+        return "ok"
+    return "throttled" if code in THROTTLE_ERROR_CODES else "error"
+
+
+class TokenBucket:
+    """초당 rate 개의 요청만 허용, 최대 capacity 개까지 몰아서 사용 가능"""
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    async def acquire(self):
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= 1
+
+
+class ProfileFetcher:
+    """GetProfile 요청 공용 풀
+
+    동시 요청 수(concurrency)와 초당 요청 수(rate)를 제한하고, 요청 제한이나 오류가 발생하면
+    ThrottleSeconds 또는 지수 백오프만큼 기다린 다음 재시도한다. 재시도를 포함해서 요청 하나에 timeout 초 이상 걸리지 않는다.
+    성공한 응답은 cache_ttl 초 동안 재사용하고, 번지 API 장애로 차단 중일 때는 stale_ttl 초 이내의 응답을 대신 사용한다.
+    """
+    def __init__(self, destiny: pydest.Pydest, concurrency: int = 8, rate: float = 10, retries: int = 2, cache_ttl: float = 60,
+                 stale_ttl: float = 3600):
+        self.destiny = destiny
+        self.retries = retries
+        self.cache_ttl = cache_ttl
+        self.stale_ttl = max(stale_ttl, cache_ttl)
+        self._sem = asyncio.Semaphore(concurrency)
+        self._bucket = TokenBucket(rate)
+        self._cache: Dict[Tuple[int, str, tuple], Tuple[float, dict]] = {}
+
+    def _cache_get(self, key, max_age: float) -> Optional[dict]:
+        cached = self._cache.get(key)
+        if cached is None or cached[0] < time.time() - max_age:
+            return None
+        return cached[1]
+
+    def _cache_set(self, key, resp: dict):
+        if len(self._cache) > 1024:
+            # 장애 중에도 쓸 수 없을 만큼 오래된 항목 정리
+            cut = time.time() - self.stale_ttl
+            self._cache = {k: v for k, v in self._cache.items() if v[0] >= cut}
+        self._cache[key] = (time.time(), resp)
+
+    async def get_profile(self, membership_type: int, membership_id, components: list, timeout: float = 10) -> dict:
+        key = (int(membership_type), str(membership_id), tuple(components))
+        cached = self._cache_get(key, self.cache_ttl)
+        metrics.cache("profile", cached is not None)
+        if cached is not None:
+            return cached
+
+        resp = {}
+        # 요청 제한 대기, 모든 재시도와 백오프를 포함한 전체 시간 제한 (한 번의 요청은 그 절반까지만 기다림)
+        async with asyncio.timeout(timeout) as deadline:
+            for attempt in range(self.retries + 1):
+                delay = 0.5 * 2 ** attempt
+                try:
+                    # 차단 중이면 요청 제한 대기열에 들어가지 않고 바로 처리
+                    circuit = getattr(self.destiny.api, "breaker", None)
+                    if circuit is not None and circuit.blocked:
+                        raise breaker.CircuitOpenError(circuit.retry_after)
+                    await self._bucket.acquire()
+                    async with self._sem:
+                        with metrics.timer("bungie_request", endpoint="GetProfile") as t:
+                            resp = await asyncio.wait_for(self.destiny.api.get_profile(membership_type, membership_id, components), timeout=timeout / 2)
+                            t.result = response_result(resp)
+                except asyncio.TimeoutError:
+                    if attempt == self.retries:
+                        raise
+                    logger.debug(f"{membership_id} / Request Timeout, retry {attempt + 1}")
+                except breaker.CircuitOpenError:
+                    # 재시도하지 않고 마지막으로 받은 응답 사용
+                    stale = self._cache_get(key, self.stale_ttl)
+                    metrics.cache("profile_stale", stale is not None)
+                    return stale if stale is not None else {}
+                except pydest.PydestException as e:
+                    if attempt == self.retries:
+                        return {}
+                    logger.debug(f"{membership_id} / {e}, retry {attempt + 1}")
+                else:
+                    if resp.get("ErrorCode") == 1:
+                        self._cache_set(key, resp)
+                        return resp
+                    if resp.get("ErrorCode") not in THROTTLE_ERROR_CODES or attempt == self.retries:
+                        return resp
+                    # 번지 서버에서 알려준 대기 시간 준수
+                    delay = max(delay, resp.get("ThrottleSeconds", 0))
+                    if asyncio.get_running_loop().time() + delay >= deadline.when():
+                        # 시간 안에 재시도할 수 없으면 마지막 응답 사용
+                        return resp
+                    logger.info(f"{membership_id} / Throttled ({resp.get('ErrorCode')}), wait {delay}s")
+                await asyncio.sleep(delay)
+            return resp
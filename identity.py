@@ -0,0 +1,108 @@
+import logging
+import time
+from typing import Dict, Iterable, Optional
+
+import persist
+import roster
+import storage
+
+
+logger = logging.getLogger("identity")
+
+
+class IdentityCache:
+    """번지 이름, SteamID64, membershipId 사이의 대응 관계를 DB(data/bot.db)에 저장
+
+    클랜원 목록을 받을 때마다, 그리고 번지 API 로 유저를 찾을 때마다 갱신하며
+    ttl 초보다 오래된 항목은 사용하지 않는다 (이름이 바뀌었을 수 있으므로 다시 조회).
+    """
+    def __init__(self, store: storage.Storage, writer: persist.WriteBehind, ttl: float = 7 * 86400):
+        self.ttl = ttl
+        # membership_id -> {"membership_type", "bungie_name", "steam_id", "updated"}
+        self.entries: Dict[str, dict] = store.load_identity()
+        self.by_name: Dict[str, str] = {}
+        self.by_steam: Dict[str, str] = {}
+        self._sync = persist.DictSync(writer, "identity", lambda: self.entries, store.upsert_identity, store.delete_identity)
+        # 오래된 항목은 메모리에서만 먼저 지우고, DB 에서는 루프가 시작된 다음 persist_dropped 로 지움
+        self._dropped = [k for k, v in self.entries.items() if v["updated"] < time.time() - ttl]
+        for k in self._dropped:
+            self.entries.pop(k)
+        for k, v in self.entries.items():
+            self._index(k, v)
+
+    def persist_dropped(self):
+        dropped, self._dropped = self._dropped, []
+        self._sync.touch(*dropped)
+
+    def _index(self, membership_id: str, entry: dict):
+        if entry["bungie_name"]:
+            self.by_name[roster.normalize_bungie_name(entry["bungie_name"])] = membership_id
+        if entry["steam_id"]:
+            self.by_steam[entry["steam_id"]] = membership_id
+
+    def _fresh(self, membership_id: Optional[str]) -> Optional[dict]:
+        entry = self.entries.get(membership_id) if membership_id else None
+        if entry is None or entry["updated"] < time.time() - self.ttl:
+            return None
+        return entry
+
+    def _update(self, membership_id: str, membership_type: int, bungie_name: str, steam_id: str = "") -> bool:
+        old = self.entries.get(membership_id)
+        steam_id = steam_id or (old["steam_id"] if old else "")
+        now = int(time.time())
+        if (old is not None and old["membership_type"] == membership_type and old["bungie_name"] == bungie_name
+                and old["steam_id"] == steam_id and old["updated"] > now - self.ttl / 2):
+            # 바뀐 내용이 없으면 ttl 의 절반이 지났을 때만 다시 기록
+            return False
+        entry = self.entries[membership_id] = {"membership_type": membership_type, "bungie_name": bungie_name,
+                                               "steam_id": steam_id, "updated": now}
+        self._index(membership_id, entry)
+        return True
+
+    def observe(self, user_info: dict, steam_id: str = ""):
+        """SearchDestinyPlayer, GetMembershipsById 결과 기록"""
+        if not user_info or not user_info.get("membershipId"):
+            return
+        bungie_name = ""
+        if user_info.get("bungieGlobalDisplayName") and user_info.get("bungieGlobalDisplayNameCode") is not None:
+            bungie_name = "{bungieGlobalDisplayName}#{bungieGlobalDisplayNameCode:04d}".format(**user_info)
+        membership_id = str(user_info["membershipId"])
+        if self._update(membership_id, int(user_info.get("membershipType", 0)), bungie_name, steam_id):
+            self._sync.touch(membership_id)
+
+    def observe_members(self, members: Iterable[roster.Member]):
+        """클랜원 목록 갱신 결과 기록 (바뀐 클랜원만 DB 에 기록)"""
+        changed = [n.membership_id for n in members if self._update(n.membership_id, n.membership_type, n.bungie_name)]
+        if changed:
+            logger.debug(f"Identity cache updated ({len(changed)} members)")
+            self._sync.touch(*changed)
+
+    def lookup(self, bungie_name: str = "", steam_id: str = "", membership_id: str = "") -> Optional[dict]:
+        """search_player 와 같은 형식의 유저 정보, 없거나 오래되었으면 None"""
+        if steam_id:
+            membership_id = self.by_steam.get(steam_id, "")
+        elif bungie_name:
+            key = roster.normalize_bungie_name(bungie_name)
+            membership_id = self.by_name.get(key, "")
+            entry = self._fresh(membership_id)
+            # 다른 유저가 이전에 쓰던 이름일 수 있으므로 현재 이름과 같은지 확인
+            if entry is None or roster.normalize_bungie_name(entry["bungie_name"]) != key:
+                return None
+        entry = self._fresh(membership_id)
+        if entry is None:
+            return None
+        return user_info(membership_id, entry["membership_type"], entry["bungie_name"])
+
+
+def user_info(membership_id: str, membership_type: int, bungie_name: str) -> dict:
+    # SearchDestinyPlayer 응답의 UserInfoCard 형식
+    info = {"membershipId": membership_id, "membershipType": membership_type}
+    name, sep, code = bungie_name.rpartition("#")
+    if sep and code.isdigit():
+        info["bungieGlobalDisplayName"] = name
+        info["bungieGlobalDisplayNameCode"] = int(code)
+    return info
+
+
+def member_info(member: roster.Member) -> dict:
+    return user_info(member.membership_id, member.membership_type, member.bungie_name)
@@ -0,0 +1,112 @@
+import asyncio
+import datetime as dt
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+import destiny2
+import metrics
+import persist
+import roster
+import storage
+
+
+logger = logging.getLogger("inactivity")
+
+
+def parse_date(s: str) -> int:
+    return int(dt.datetime.fromisoformat(s.replace("Z", "+00:00")).timestamp())
+
+
+class InactivityScanner:
+    """프로필(component 100)의 dateLastPlayed 로 클랜원의 실제 마지막 플레이 시각을 확인
+
+    클랜 목록의 lastOnlineStatusChange 가 바뀌었거나 확인한 지 ttl 초가 지난 클랜원만 다시 요청하고,
+    결과는 DB 에 저장해서 `$미접 (일수) 정확` 명령어가 API 호출 없이 바로 사용한다.
+    요청은 클랜의 ProfileFetcher 를 거치므로 동시 요청 수와 초당 요청 수 제한을 따른다.
+    """
+    def __init__(self, store: storage.Storage, writer: persist.WriteBehind, ttl: float = 86400, batch: int = 200):
+        self.ttl = ttl
+        self.batch = batch
+        # membership_id -> {"last_played", "status_change", "checked"}
+        self.entries: Dict[str, dict] = store.load_last_played()
+        self.version = 0
+        self._sync = persist.DictSync(writer, "last_played", lambda: self.entries, store.upsert_last_played, store.delete_last_played)
+        self._scans: Dict[int, asyncio.Task] = {}
+
+    def is_stale(self, member: roster.Member, now: float) -> bool:
+        entry = self.entries.get(member.membership_id)
+        return entry is None or entry["status_change"] != member.last_online or entry["checked"] < now - self.ttl
+
+    async def scan(self, d2util: destiny2.ClanUtil) -> int:
+        """오래된 클랜원을 최대 batch 명까지 확인하고, 확인한 인원 수 반환"""
+        snapshot = await d2util.roster.get(max_age=3600)
+        now = time.time()
+        targets = [n for n in snapshot.members if self.is_stale(n, now)]
+        # 한 번도 확인하지 않은 클랜원, 오래전에 확인한 클랜원부터
+        targets.sort(key=lambda n: self.entries.get(n.membership_id, {}).get("checked", 0))
+        targets = targets[:self.batch]
+        if not targets:
+            return 0
+        with metrics.timer("task", task="inactivity_scan"):
+            results = await asyncio.gather(*[self._check(d2util, n) for n in targets])
+        updated = [k for k in results if k]
+        if updated:
+            self.version += 1
+            self._sync.touch(*updated)
+        logger.info(f"Inactivity scan ({d2util.group_id}): {len(updated)}/{len(targets)} updated")
+        return len(updated)
+
+    async def _check(self, d2util: destiny2.ClanUtil, member: roster.Member) -> Optional[str]:
+        try:
+            resp = await d2util.profile_fetcher.get_profile(member.membership_type, member.membership_id, [100], timeout=10)
+        except asyncio.TimeoutError:
+            return None
+        try:
+            last_played = parse_date(resp["Response"]["profile"]["data"]["dateLastPlayed"])
+        except (KeyError, TypeError, ValueError):
+            logger.debug(f"{member.membership_id} / {resp.get('ErrorCode', 'Wrong response form')}")
+            return None
+        self.entries[member.membership_id] = {
+            "last_played": last_played,
+            "status_change": member.last_online,
+            "checked": int(time.time()),
+        }
+        return member.membership_id
+
+    def scan_background(self, d2util: destiny2.ClanUtil) -> asyncio.Task:
+        # 클랜마다 한 번에 하나의 확인 작업만 실행
+        task = self._scans.get(d2util.group_id)
+        if task is None or task.done():
+            task = self._scans[d2util.group_id] = asyncio.ensure_future(self._scan_safe(d2util))
+        return task
+
+    async def _scan_safe(self, d2util: destiny2.ClanUtil):
+        try:
+            await self.scan(d2util)
+        except Exception as e:
+            logger.error(f"Error occurred while scanning inactivity ({d2util.group_id}): {e}")
+
+    def last_played(self, member: roster.Member) -> Tuple[int, bool]:
+        """(마지막 플레이 시각, 프로필로 확인한 값인지)"""
+        entry = self.entries.get(member.membership_id)
+        if entry is not None:
+            return entry["last_played"], True
+        return member.last_online, False
+
+    def offline_before(self, snapshot: roster.RosterSnapshot, timestamp: float) -> List[Tuple[roster.Member, int, bool]]:
+        """timestamp 이전에 마지막으로 플레이한 클랜원 (오래된 순)"""
+        result = []
+        for n in snapshot.members:
+            if n.is_online:
+                continue
+            last, accurate = self.last_played(n)
+            if last < timestamp:
+                result.append((n, last, accurate))
+        result.sort(key=lambda x: x[1])
+        return result
+
+    async def close(self):
+        for task in self._scans.values():
+            task.cancel()
+        await asyncio.gather(*self._scans.values(), return_exceptions=True)
@@ -8,7 +8,9 @@ import str2bool
 import discord
 import dotenv
 
+import blocklist
 import bot
+import router
 
 __version__ = "0.5.0"
 
@@ -18,9 +20,37 @@ options = {
     "discord_token": os.getenv("DISCORD_TOKEN", ""),
     "group_id": int(os.getenv("GROUP_ID", 0)),
     "offline_cut": int(os.getenv("OFFLINE_CUT", 14)),
-    "online_command_preview": str2bool.str2bool_exc(os.getenv("ONLINE_COMMAND_PREVIEW", "false"))
+    "online_command_preview": str2bool.str2bool_exc(os.getenv("ONLINE_COMMAND_PREVIEW", "false")),
+    "online_command_stream": str2bool.str2bool_exc(os.getenv("ONLINE_COMMAND_STREAM") or "false"),
+    "online_poll": str2bool.str2bool_exc(os.getenv("ONLINE_POLL") or "false"),
+    "clan_poll_spread": int(os.getenv("CLAN_POLL_SPREAD") or 600),
+    "clan_poll_concurrency": int(os.getenv("CLAN_POLL_CONCURRENCY") or 4),
+    "roster_ttl": int(os.getenv("ROSTER_TTL") or 60),
+    "profile_concurrency": int(os.getenv("PROFILE_CONCURRENCY") or 8),
+    "profile_rate": float(os.getenv("PROFILE_RATE") or 10),
+    "profile_cache_ttl": int(os.getenv("PROFILE_CACHE_TTL") or 60),
+    "identity_ttl": int(os.getenv("IDENTITY_TTL") or 604800),
+    "breaker_threshold": int(os.getenv("BREAKER_THRESHOLD") or 5),
+    "breaker_cooldown": int(os.getenv("BREAKER_COOLDOWN") or 30),
+    "metrics_host": os.getenv("METRICS_HOST") or "127.0.0.1",
+    "metrics_port": int(os.getenv("METRICS_PORT") or 0),
+    "timeseries_interval": int(os.getenv("TIMESERIES_INTERVAL") or 0),
+    "inactivity_scan_interval": int(os.getenv("INACTIVITY_SCAN_INTERVAL") or 0),
+    "inactivity_ttl": int(os.getenv("INACTIVITY_TTL") or 86400)
 }
 
+# 명령어 인자 형식 (시작할 때 한 번만 컴파일)
+HISTORY_PATTERN = re.compile(r".+#\d{3,4}$")
+DATE_PATTERN = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+REST_PATTERN = re.compile(r"[$]휴가 (등록|조회|해제)?\s?((.+#\d{3,4})|(\d{19}))?\s?(\d{4}-[01]?\d-[ 0123]\d)?\s?(https?://[/.\w\d]+)?\s?(.+)?")
+STATS_PATTERN = re.compile(r"[$]통계\s*(.+#\d{3,4})?\s*(\d+)?\s*$")
+BLOCK_IMPORT_LIMIT = 1000
+BLOCK_IMPORT_FILE_LIMIT = 1024 * 1024
+BLOCK_IMPORT_COOLDOWN = 60
+BLOCK_PATTERN = re.compile(r"[$]차단 (등록|조회|해제)?\s?((.+#\d{3,4})|(\d{17})|([-]?\d))?\s?(https?://[\w\d.@?^=%&/~+#]+)?\s?([\s\S]+)?", re.MULTILINE)
+
+commands = router.CommandRouter("$")
+
 intents = discord.Intents.default()
 intents.message_content = True
 
@@ -47,8 +77,7 @@ async def on_ready():
     await client.change_presence(status=discord.Status.online, activity=client_activity_init)
     logger.info("Start initializing...")
     client_activity = discord.Activity(name="DESTINY 2", type=discord.ActivityType.watching)
-    await client.d2util.destiny.update_manifest("ko")
-    logger.info("Updated Destiny 2 manifest!")
+    # manifest 는 setup_hook 에서 한 번만 불러오고, 새 버전 확인은 백그라운드에서 진행
     await client.change_presence(status=discord.Status.online, activity=client_activity)
     logger.info(f"Updated bot status!")
 
@@ -57,139 +86,259 @@ async def on_ready():
 async def on_message(message):
     if message.author.bot or not message.content.startswith("$"):
         return
+    command = commands.resolve(message.content)
+    if command is None:
+        return
+    # 서버에 등록된 클랜 (없으면 기본 클랜)
+    d2util = client.get_clan(message.guild.id if message.guild else 0)
+    if d2util is None and command.requires_clan:
+        await message.channel.send("이 서버에 등록된 클랜이 없습니다. `$클랜 등록 (클랜 ID)` 명령어로 등록해주세요.")
+        return
+    await commands.dispatch(command, message, d2util)
 
-    if message.content.startswith("$정보"):
-        uptime = await client.get_uptime()
-        msg_embed = discord.Embed(title="BIG DRIFTER 2", description="by bdh0404(Tensor#5772)", timestamp=datetime.datetime.now(), color=0x00ac00)
-        msg_embed.add_field(name="Version", value=__version__)
-        msg_embed.add_field(name="PID", value=str(os.getpid()))
-        msg_embed.add_field(name="Uptime", value=str(uptime), inline=False)
-        msg_embed.add_field(name="Last Clan info update", value=f"<t:{int(client.last_tasks_run)}:T>", inline=False)
-        await message.channel.send(embed=msg_embed)
-
-    elif message.content.startswith("$미접"):
-        args: list = message.content.split()
-        if len(args) < 2:
-            msg_embed = await client.get_long_offline()
-            msg = {"embed": msg_embed}
-        elif args[1].isdigit():
-            msg_embed = await client.get_long_offline(int(args[1]))
-            msg = {"embed": msg_embed}
-        else:
-            msg = {"content": "올바른 미접 커트라인(일 단위)을 입력해주세요."}
-        await message.channel.send(**msg)
 
-    elif message.content.startswith("$온라인"):
-        if client.online_command_preview:
-            msg_embed = await client.get_clan_online()
-            resp_msg: discord.Message = await message.channel.send(embed=msg_embed)
-            msg_embed = await client.get_clan_online_detail()
-            await resp_msg.edit(embed=msg_embed)
-        else:
-            msg_embed = await client.get_clan_online_detail()
-            await message.channel.send(embed=msg_embed)
-
-    elif message.content.startswith("$등록"):
-        if message.author.guild_permissions.administrator:
-            ret = await client.toggle_alert_target(message.channel.id)
-            if ret == 1:
-                await message.channel.send(f"<#{message.channel.id}> 채널이 알림 수신 목록에 추가되었습니다.")
-            elif ret == 0:
-                await message.channel.send(f"<#{message.channel.id}> 채널이 알림 수신 목록에서 제거되었습니다.")
-        else:
-            await message.channel.send("서버 관리자 권한이 필요합니다!")
-
-    elif message.content.startswith("$휴가"):
-        if message.author.guild_permissions.administrator:
-            cmd = message.content.strip()
-            pattern = re.compile(r"[$]휴가 (등록|조회|해제)?\s?((.+#\d{3,4})|(\d{19}))?\s?(\d{4}-[01]?\d-[ 0123]\d)?\s?(https?://[/.\w\d]+)?\s?(.+)?")
-            regex_result = pattern.match(cmd)
-
-            if regex_result:
-                arg_mode = regex_result.group(1) if regex_result.group(1) else "등록"
-                arg_id = regex_result.group(2)
-                arg_name = regex_result.group(3)
-                arg_mem_id = regex_result.group(4)
-                arg_date = regex_result.group(5)
-                arg_url = regex_result.group(6)
-                arg_desc = regex_result.group(7)
-
-                if arg_url is None:
-                    arg_url = ""
-                if arg_desc is None:
-                    arg_desc = ""
-
-                if arg_mode == "등록":
-                    # 클랜에 해당 유저가 있는지 검색
-                    member_info: dict = await client.d2util.is_member_in_clan(bungie_name=arg_name, membership_id=arg_mem_id)
-                    if not (arg_id and arg_date):
-                        msg = {"content": "양식에 따라 입력해주세요.\n> `$휴가 [등록|조회|해제] (번지 이름|멤버쉽 ID) (휴가종료일) [URL] [설명]`\n휴가종료일의 경우 `YYYY-MM-DD` 또는 `YYYY.MM.DD` 형식으로 입력해주세요."}
-                    elif member_info:
-                        y, m, d = map(int, re.match(r"(\d{4})-(\d{2})-(\d{2})", arg_date).groups())
-                        end_date = datetime.datetime(year=y, month=m, day=d)
-                        await client.register_rest(member_info, end_date, arg_url, arg_desc)
-                        msg = {"content": f"{end_date.strftime('%Y-%m-%d')} 까지 휴가로 등록되었습니다."}
-                    else:
-                        msg = {"content": "해당 유저를 찾을 수 없습니다."}
-                elif arg_mode == "해제":
-                    msg = {"content": "지원 예정 기능"}
-                elif arg_mode == "조회":
-                    msg_embed = await client.msg_rest_list()
-                    msg = {"embed": msg_embed}
-                else:
-                    msg = {"content": "알 수 없는 모드 이름"}
-            else:
-                # 제대로 입력하지 않은 경우
-                msg = {"content": "양식에 따라 입력해주세요.\n> `$휴가 [등록|조회|해제] (번지 이름|멤버쉽 ID) (휴가종료일) [URL] [설명]`\n휴가종료일의 경우 `YYYY-MM-DD` 또는 `YYYY.MM.DD` 형식으로 입력해주세요."}
-            await message.channel.send(**msg)
-        else:
-            await message.channel.send("서버 관리자 권한이 필요합니다!")
+@commands.command("$정보", dedup=True, requires_clan=False)
+async def cmd_info(message, d2util):
+    uptime = await client.get_uptime()
+    msg_embed = discord.Embed(title="BIG DRIFTER 2", description="by bdh0404(Tensor#5772)", timestamp=datetime.datetime.now(), color=0x00ac00)
+    msg_embed.add_field(name="Version", value=__version__)
+    msg_embed.add_field(name="PID", value=str(os.getpid()))
+    msg_embed.add_field(name="Uptime", value=str(uptime), inline=False)
+    msg_embed.add_field(name="Last Clan info update", value=f"<t:{int(client.last_tasks_run)}:T>" if client.last_tasks_run else "-", inline=False)
+    await client.send_embeds(message.channel, [msg_embed, *client.msg_metrics()])
 
-    elif message.content.startswith("$차단"):
-        if not message.author.guild_permissions.administrator:
-            await message.channel.send("서버 관리자 권한이 필요합니다!")
-            return
 
+@commands.command("$미접", concurrency=4, guild_cooldown=3, user_cooldown=3, dedup=True)
+async def cmd_offline(message, d2util):
+    args: list = message.content.split()
+    # 마지막 인자가 "정확" 이면 프로필의 마지막 플레이 시각 기준
+    accurate = len(args) > 1 and args[-1] == "정확"
+    if accurate:
+        args.pop()
+    if len(args) < 2:
+        msg_embeds = await client.get_long_offline(d2util, accurate=accurate)
+    elif args[1].isdigit():
+        msg_embeds = await client.get_long_offline(d2util, int(args[1]), accurate=accurate)
+    else:
+        await message.channel.send("올바른 미접 커트라인(일 단위)을 입력해주세요.")
+        return
+    await client.send_embeds(message.channel, msg_embeds)
+
+
+@commands.command("$온라인", concurrency=2, guild_cooldown=5, user_cooldown=10, dedup=True)
+async def cmd_online(message, d2util):
+    state = client.get_online_state(d2util)
+    if state is not None:
+        # 백그라운드에서 갱신중인 접속 상태로 바로 응답
+        notice = ":warning: 번지 서버 응답이 없어 마지막으로 확인한 접속 상태를 표시합니다." if d2util.outage else ""
+        msg_embeds = client.render_online_detail(state.data(), updated_at=state.updated_at, notice=notice)
+        await client.send_embeds(message.channel, msg_embeds)
+    elif client.online_command_stream:
+        msg_embeds = await client.get_clan_online(d2util)
+        resp_msg: discord.Message = await message.channel.send(embeds=msg_embeds)
+        await client.stream_clan_online_detail(d2util, resp_msg)
+    elif client.online_command_preview:
+        msg_embeds = await client.get_clan_online(d2util)
+        resp_msg: discord.Message = await message.channel.send(embeds=msg_embeds)
+        msg_embeds = await client.get_clan_online_detail(d2util)
+        await client.edit_embeds(resp_msg, msg_embeds)
+    else:
+        msg_embeds = await client.get_clan_online_detail(d2util)
+        await client.send_embeds(message.channel, msg_embeds)
+
+
+@commands.command("$등록", concurrency=1, requires_clan=False)
+async def cmd_alert_target(message, d2util):
+    if message.author.guild_permissions.administrator:
+        ret = await client.toggle_alert_target(message.channel.id)
+        if ret == 1:
+            await message.channel.send(f"<#{message.channel.id}> 채널이 알림 수신 목록에 추가되었습니다.")
+        elif ret == 0:
+            await message.channel.send(f"<#{message.channel.id}> 채널이 알림 수신 목록에서 제거되었습니다.")
+    else:
+        await message.channel.send("서버 관리자 권한이 필요합니다!")
+
+
+@commands.command("$기록", user_cooldown=2, dedup=True)
+async def cmd_history(message, d2util):
+    arg_name = message.content[len("$기록"):].strip()
+    if not HISTORY_PATTERN.match(arg_name):
+        await message.channel.send("양식에 따라 입력해주세요.\n> `$기록 (번지 이름)`")
+        return
+    msg_embed = await client.msg_member_history(d2util, arg_name)
+    await message.channel.send(embed=msg_embed)
+
+
+@commands.command("$통계", user_cooldown=2, dedup=True)
+async def cmd_stats(message, d2util):
+    regex_result = STATS_PATTERN.match(message.content.strip())
+    if not regex_result:
+        await message.channel.send("양식에 따라 입력해주세요.\n> `$통계 [번지 이름] [일수]`")
+        return
+    arg_name = regex_result.group(1)
+    days = min(int(regex_result.group(2)), 365) if regex_result.group(2) else 7
+    if arg_name:
+        msg_embeds = await client.msg_member_stats(d2util, arg_name.strip(), days)
+    else:
+        msg_embeds = await client.msg_clan_stats(d2util, days)
+    await client.send_embeds(message.channel, msg_embeds)
+
+
+@commands.command("$클랜", concurrency=1, requires_clan=False)
+async def cmd_clan(message, d2util):
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("서버 관리자 권한이 필요합니다!")
+        return
+
+    args: list = message.content.split()
+    arg_mode = args[1] if len(args) > 1 else "조회"
+    if arg_mode == "등록" and len(args) > 2 and args[2].isdigit():
+        client.clans.register(message.guild.id, int(args[2]))
+        msg = {"content": f"이 서버에 클랜 `{args[2]}` 이(가) 등록되었습니다."}
+    elif arg_mode == "해제":
+        ret = client.clans.unregister(message.guild.id)
+        msg = {"content": "이 서버의 클랜 등록이 해제되었습니다."} if ret else {"content": "이 서버에 따로 등록된 클랜이 없습니다."}
+    elif arg_mode == "조회":
+        msg = {"content": f"이 서버의 클랜: `{d2util.group_id}`"} if d2util else {"content": "이 서버에 등록된 클랜이 없습니다."}
+    else:
+        msg = {"content": "양식에 따라 입력해주세요.\n> `$클랜 [등록|해제|조회] (클랜 ID)`"}
+    await message.channel.send(**msg)
+
+
+@commands.command("$휴가", concurrency=1, user_cooldown=1)
+async def cmd_rest(message, d2util):
+    if message.author.guild_permissions.administrator:
         cmd = message.content.strip()
-        pattern = re.compile(r"[$]차단 (등록|조회|해제)?\s?((.+#\d{3,4})|(\d{17})|([-]?\d))?\s?(https?://[\w\d.@?^=%&/~+#]+)?\s?([\s\S]+)?", re.MULTILINE)
-        regex_result = pattern.match(cmd)
-        if not regex_result:
-            await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 [등록|조회|해제] (번지 이름|SteamID64) [URL] [설명]`")
-            return
+        regex_result = REST_PATTERN.match(cmd)
 
-        arg_mode = regex_result.group(1) if regex_result.group(1) else "등록"
-        arg_name = regex_result.group(3)
-        arg_steam_id = regex_result.group(4)
-        arg_page = regex_result.group(5)
-        arg_url = regex_result.group(6)
-        arg_desc = regex_result.group(7)
-
-        if arg_url is None:
-            arg_url = ""
-        if arg_desc is None:
-            arg_desc = "(사유 없음)"
-        else:
-            arg_desc = arg_desc.strip()
+        if regex_result:
+            arg_mode = regex_result.group(1) if regex_result.group(1) else "등록"
+            arg_id = regex_result.group(2)
+            arg_name = regex_result.group(3)
+            arg_mem_id = regex_result.group(4)
+            arg_date = regex_result.group(5)
+            arg_url = regex_result.group(6)
+            arg_desc = regex_result.group(7)
 
-        if arg_mode == "등록":
-            if not (arg_name or arg_steam_id):
-                await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`")
-                return
-            ret = await client.register_block(arg_name, arg_steam_id, arg_url, arg_desc)
-            msg = {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 등록 성공"} if ret else {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 등록 실패"}
-        elif arg_mode == "해제":
-            if not arg_name:
-                await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`")
+            if arg_url is None:
+                arg_url = ""
+            if arg_desc is None:
+                arg_desc = ""
+
+            if arg_mode == "등록":
+                # 클랜에 해당 유저가 있는지 검색
+                member_info = await d2util.is_member_in_clan(bungie_name=arg_name, membership_id=arg_mem_id)
+                if not (arg_id and arg_date):
+                    msg = {"content": "양식에 따라 입력해주세요.\n> `$휴가 [등록|조회|해제] (번지 이름|멤버쉽 ID) (휴가종료일) [URL] [설명]`\n휴가종료일의 경우 `YYYY-MM-DD` 또는 `YYYY.MM.DD` 형식으로 입력해주세요."}
+                elif member_info:
+                    y, m, d = map(int, DATE_PATTERN.match(arg_date).groups())
+                    end_date = datetime.datetime(year=y, month=m, day=d)
+                    await client.register_rest(d2util, member_info, end_date, arg_url, arg_desc)
+                    msg = {"content": f"{end_date.strftime('%Y-%m-%d')} 까지 휴가로 등록되었습니다."}
+                else:
+                    msg = {"content": "해당 유저를 찾을 수 없습니다."}
+            elif arg_mode == "해제":
+                msg = {"content": "지원 예정 기능"}
+            elif arg_mode == "조회":
+                msg_embeds = await client.msg_rest_list(d2util)
+                await client.send_embeds(message.channel, msg_embeds)
                 return
-            ret = await client.deregister_block(arg_name, arg_steam_id)
-            msg = {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 해제 성공"} if ret else {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 해제 실패"}
-        elif arg_mode == "조회":
-            page = int(arg_page) if arg_page else 1
-            msg_embed = await client.msg_block_list(page)
-            msg = {"embed": msg_embed}
+            else:
+                msg = {"content": "알 수 없는 모드 이름"}
         else:
-            msg = {"content": "양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`"}
+            # 제대로 입력하지 않은 경우
+            msg = {"content": "양식에 따라 입력해주세요.\n> `$휴가 [등록|조회|해제] (번지 이름|멤버쉽 ID) (휴가종료일) [URL] [설명]`\n휴가종료일의 경우 `YYYY-MM-DD` 또는 `YYYY.MM.DD` 형식으로 입력해주세요."}
         await message.channel.send(**msg)
+    else:
+        await message.channel.send("서버 관리자 권한이 필요합니다!")
+
+
+@commands.command("$차단", concurrency=1, user_cooldown=1)
+async def cmd_block(message, d2util):
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("서버 관리자 권한이 필요합니다!")
+        return
+
+    cmd = message.content.strip()
+    arg_mode = cmd.split(maxsplit=2)[1] if len(cmd.split(maxsplit=2)) > 1 else ""
+    if arg_mode == "내보내기":
+        await message.channel.send(f"차단 목록 {len(client.block)}명", file=client.export_block())
+        return
+
+    regex_result = BLOCK_PATTERN.match(cmd)
+    if not regex_result:
+        await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 [등록|조회|해제] (번지 이름|SteamID64) [URL] [설명]`\n> `$차단 [가져오기|내보내기]`")
+        return
+
+    arg_mode = regex_result.group(1) if regex_result.group(1) else "등록"
+    arg_name = regex_result.group(3)
+    arg_steam_id = regex_result.group(4)
+    arg_page = regex_result.group(5)
+    arg_url = regex_result.group(6)
+    arg_desc = regex_result.group(7)
+
+    if arg_url is None:
+        arg_url = ""
+    if arg_desc is None:
+        arg_desc = "(사유 없음)"
+    else:
+        arg_desc = arg_desc.strip()
+
+    if arg_mode == "등록":
+        if not (arg_name or arg_steam_id):
+            await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`")
+            return
+        ret = await client.register_block(d2util, arg_name, arg_steam_id, arg_url, arg_desc)
+        msg = {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 등록 성공"} if ret else {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 등록 실패"}
+    elif arg_mode == "해제":
+        if not arg_name:
+            await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`")
+            return
+        ret = await client.deregister_block(d2util, arg_name, arg_steam_id)
+        msg = {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 해제 성공"} if ret else {"content": f"`{arg_name if arg_name else arg_steam_id}` 차단 해제 실패"}
+    elif arg_mode == "조회":
+        page = int(arg_page) if arg_page else 1
+        msg_embeds = await client.msg_block_list(page)
+        msg = {"embeds": msg_embeds}
+    else:
+        msg = {"content": "양식에 따라 입력해주세요.\n> `$차단 등록 (번지 이름|SteamID64) [URL] [설명]`"}
+    await message.channel.send(**msg)
+
+
+# 번지 API 요청이 많은 차단 목록 가져오기는 서버당 하나씩, 60초에 한 번만 처리 ($차단 과 따로 제한)
+@commands.command("$차단 가져오기", concurrency=1, guild_cooldown=BLOCK_IMPORT_COOLDOWN)
+async def cmd_block_import(message, d2util):
+    if not message.author.guild_permissions.administrator:
+        await message.channel.send("서버 관리자 권한이 필요합니다!")
+        return
+    # 첫 줄 다음부터 한 줄에 한 명씩, 또는 첨부 파일(내보내기 파일, 텍스트 파일)
+    entries, failed = blocklist.parse_lines(message.content.strip().partition("\n")[2])
+    for attachment in message.attachments:
+        if attachment.size > BLOCK_IMPORT_FILE_LIMIT:
+            failed.append((attachment.filename, "파일이 너무 큼"))
+            continue
+        try:
+            file_entries, file_failed = blocklist.parse_file(await attachment.read())
+        except (ValueError, TypeError, discord.HTTPException):
+            failed.append((attachment.filename, "파일을 읽을 수 없음"))
+            continue
+        entries.extend(file_entries)
+        failed.extend(file_failed)
+    if not entries and not failed:
+        await message.channel.send("양식에 따라 입력해주세요.\n> `$차단 가져오기` 다음 줄부터 한 줄에 한 명씩 `(번지 이름|SteamID64) [URL] [설명]`, 또는 `$차단 내보내기` 파일 첨부")
+        return
+    if len(entries) > BLOCK_IMPORT_LIMIT:
+        await message.channel.send(f"한 번에 {BLOCK_IMPORT_LIMIT}명까지 가져올 수 있습니다. ({len(entries)}명)")
+        return
+    resp_msg = await message.channel.send(f"{len(entries)}명 조회 중...")
+    try:
+        added, resolve_failed = await client.import_block(d2util, entries, msg_url=message.jump_url)
+    except Exception:
+        # 진행 안내 메시지가 그대로 남지 않도록 오류 안내로 바꾼 다음 오류는 그대로 기록
+        await resp_msg.edit(content=f"{len(entries)}명 조회 중 오류가 발생했습니다. 잠시 후 다시 시도해주세요.")
+        raise
+    await resp_msg.delete()
+    await client.send_embeds(message.channel, client.msg_block_import(added, failed + resolve_failed))
 
 
 if __name__ == '__main__':
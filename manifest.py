@@ -0,0 +1,174 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import time
+import zipfile
+from typing import Dict, Optional, Tuple
+
+import pydest
+
+import persist
+import transport
+
+
+logger = logging.getLogger("manifest")
+
+
+def _load_names(cur: sqlite3.Cursor, definition: str) -> Dict[int, dict]:
+    # manifest DB 의 id 는 부호 있는 32비트 정수로 저장되어 있으므로 원래 hash 값으로 변환
+    cur.execute(f"SELECT id, json FROM {definition}")
+    return {row[0] & 0xFFFFFFFF: json.loads(row[1]) for row in cur.fetchall()}
+
+
+class ActivityTable:
+    """활동 hash -> (모드 이름, 활동 이름) 표
+
+    manifest 버전이 바뀔 때만 새로 만들고, user_activity 에서는 dict 조회만 한다.
+    """
+    def __init__(self):
+        self.version: Optional[str] = None
+        self.activities: Dict[int, Tuple[str, str]] = {}     # 활동 hash -> (활동 유형 이름, 활동 이름)
+        self.modes: Dict[int, str] = {}                      # 모드 hash -> 모드 이름
+
+    def __bool__(self):
+        return self.version is not None
+
+    def build(self, db_path: str):
+        conn = sqlite3.connect(db_path)
+        try:
+            cur = conn.cursor()
+            types = {k: v["displayProperties"]["name"] for k, v in _load_names(cur, "DestinyActivityTypeDefinition").items()}
+            modes = {k: v["displayProperties"]["name"] for k, v in _load_names(cur, "DestinyActivityModeDefinition").items()}
+            # 모드 정보가 없는 활동은 활동 유형 이름을 대신 사용하도록 미리 연결
+            activities = {k: (types.get(v.get("activityTypeHash"), ""), v["displayProperties"]["name"])
+                          for k, v in _load_names(cur, "DestinyActivityDefinition").items()}
+        finally:
+            conn.close()
+        self.activities = activities
+        self.modes = modes
+        self.version = db_path
+        logger.info(f"Activity table built ({len(activities)} activities, {len(modes)} modes)")
+
+    async def update(self, destiny: pydest.Pydest, language: str = "ko"):
+        db_path = destiny._manifest.manifest_files.get(language)
+        if not db_path or db_path == self.version:
+            return
+        await asyncio.to_thread(self.build, db_path)
+
+    def decode(self, activity_hash: int, mode_hash: int) -> Optional[tuple]:
+        """user_activity 와 같은 형식의 tuple 반환, 표에 없는 활동이면 None"""
+        activity = self.activities.get(activity_hash)
+        if activity is None:
+            return None
+        type_name, name = activity
+        if not name:
+            # 궤도상에 있는 경우
+            return "궤도",
+        return self.modes.get(mode_hash, type_name), name
+
+
+class ManifestManager:
+    """manifest 파일을 data 폴더에 버전별로 저장하고 프로세스당 한 번만 불러옴
+
+    저장된 manifest 가 있으면 네트워크 요청 없이 바로 사용하고, 새 버전 확인은 백그라운드에서 진행한다.
+    """
+    def __init__(self, destiny: pydest.Pydest, dir_manifest: str, activity_table: ActivityTable = None):
+        self.destiny = destiny
+        self.dir_manifest = dir_manifest
+        self.activity_table = activity_table
+        self._path_version = os.path.join(dir_manifest, "version.json")
+        self._lock = asyncio.Lock()
+        self._loaded = set()
+        self._refresh_task: Optional[asyncio.Task] = None
+        if not os.path.exists(dir_manifest):
+            os.makedirs(dir_manifest)
+
+    def _read_versions(self) -> dict:
+        if not os.path.exists(self._path_version):
+            return {}
+        with open(self._path_version, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_versions(self, versions: dict):
+        persist.atomic_write_json(self._path_version, versions, indent=2)
+
+    async def _use(self, language: str, db_path: str):
+        self.destiny._manifest.manifest_files[language] = db_path
+        if self.activity_table is not None:
+            st = time.perf_counter()
+            await self.activity_table.update(self.destiny, language)
+            logger.info(f"Manifest ({language}) activity table ready in {time.perf_counter() - st:.2f}s")
+
+    async def load(self, language: str = "ko"):
+        """저장된 manifest 로 바로 시작하고, 새 버전 확인은 백그라운드에서 진행"""
+        async with self._lock:
+            if language in self._loaded:
+                return
+            st = time.perf_counter()
+            saved = self._read_versions().get(language)
+            if saved and os.path.isfile(saved["path"]):
+                await self._use(language, saved["path"])
+                self._loaded.add(language)
+                logger.info(f"Manifest ({language}) loaded from local cache in {time.perf_counter() - st:.2f}s (version {saved['version']})")
+                self.refresh_background(language)
+                return
+        await self.refresh(language)
+        self._loaded.add(language)
+        logger.info(f"Manifest ({language}) loaded in {time.perf_counter() - st:.2f}s")
+
+    def refresh_background(self, language: str = "ko"):
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh_safe(language))
+
+    async def _refresh_safe(self, language: str):
+        try:
+            await self.refresh(language)
+        except Exception as e:
+            logger.error(f"Error occurred while refreshing manifest: {e}")
+
+    async def refresh(self, language: str = "ko"):
+        """번지 서버의 manifest 버전을 확인하고 바뀐 경우에만 새로 다운로드"""
+        async with self._lock:
+            st = time.perf_counter()
+            resp = await self.destiny.api.get_destiny_manifest()
+            if resp.get("ErrorCode") != 1:
+                raise pydest.PydestException("Could not retrieve Manifest from Bungie.net")
+            version = resp["Response"]["version"]
+            url = "https://www.bungie.net" + resp["Response"]["mobileWorldContentPaths"][language]
+            db_path = os.path.join(self.dir_manifest, url.split("/")[-1])
+            logger.info(f"Manifest ({language}) version checked in {time.perf_counter() - st:.2f}s")
+
+            versions = self._read_versions()
+            old = versions.get(language)
+            if not os.path.isfile(db_path):
+                st = time.perf_counter()
+                await self._download(url, db_path)
+                logger.info(f"Manifest ({language}) version {version} downloaded in {time.perf_counter() - st:.2f}s")
+            versions[language] = {"version": version, "path": db_path}
+            await asyncio.to_thread(self._write_versions, versions)
+            await self._use(language, db_path)
+            # 새 파일로 바꾼 다음 이전 버전 파일 삭제 (삭제된 경로를 열면 sqlite3 가 빈 DB 를 만듦)
+            if old and old["path"] != db_path and os.path.isfile(old["path"]):
+                os.remove(old["path"])
+
+    async def _download(self, url: str, db_path: str):
+        path_zip = db_path + ".zip"
+        async with self.destiny.api.session.get(url, timeout=transport.DOWNLOAD_TIMEOUT) as r:
+            r.raise_for_status()
+            with open(path_zip, "wb") as f:
+                async for chunk in r.content.iter_chunked(1 << 16):
+                    f.write(chunk)
+        await asyncio.to_thread(self._extract, path_zip, db_path)
+
+    @staticmethod
+    def _extract(path_zip: str, db_path: str):
+        # 압축 해제가 끝난 다음 이름을 바꿔서, 중간에 종료되더라도 깨진 파일이 남지 않도록 함
+        with zipfile.ZipFile(path_zip, "r") as zip_ref:
+            name = zip_ref.namelist()[0]
+            with zip_ref.open(name) as src, open(db_path + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        os.replace(db_path + ".tmp", db_path)
+        os.remove(path_zip)
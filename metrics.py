@@ -0,0 +1,193 @@
+import asyncio
+import bisect
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+logger = logging.getLogger("metrics")
+
+PREFIX = "drifter_"
+# 초 단위 latency 구간 (마지막 구간은 +Inf)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: dict) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = key + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Histogram:
+    """구간별 개수만 세는 고정 구간 histogram (관측 한 번에 bisect 한 번)"""
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        # 해당 구간의 상한값으로 근사
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        acc = 0
+        for i, n in enumerate(self.counts):
+            acc += n
+            if acc >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+class Registry:
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def gauge(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        hist = series.get(key)
+        if hist is None:
+            hist = series[key] = Histogram()
+        hist.observe(value)
+
+    def timer(self, name: str, **labels) -> "Timer":
+        return Timer(self, name, labels)
+
+    def cache(self, name: str, hit: bool):
+        self.inc("cache_requests_total", cache=name, result="hit" if hit else "miss")
+
+    def cache_ratio(self, name: str) -> Optional[float]:
+        series = self.counters.get("cache_requests_total", {})
+        hit = series.get(_label_key({"cache": name, "result": "hit"}), 0)
+        miss = series.get(_label_key({"cache": name, "result": "miss"}), 0)
+        return hit / (hit + miss) if hit + miss else None
+
+    def render(self) -> str:
+        """Prometheus text format"""
+        lines = []
+        for name, series in sorted(self.counters.items()):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for key, v in series.items():
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {v:g}")
+        for name, series in sorted(self.gauges.items()):
+            lines.append(f"# TYPE {PREFIX}{name} gauge")
+            for key, v in series.items():
+                lines.append(f"{PREFIX}{name}{_format_labels(key)} {v:g}")
+        for name, series in sorted(self.histograms.items()):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for key, hist in series.items():
+                acc = 0
+                for i, n in enumerate(hist.counts):
+                    acc += n
+                    le = f"{BUCKETS[i]:g}" if i < len(BUCKETS) else "+Inf"
+                    lines.append(f"{PREFIX}{name}_bucket{_format_labels(key, (('le', le),))} {acc}")
+                lines.append(f"{PREFIX}{name}_sum{_format_labels(key)} {hist.sum:g}")
+                lines.append(f"{PREFIX}{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self, name: str, label: str) -> List[str]:
+        """$정보 에 표시할 label 별 요약 (요청 수, 실패 수, 평균, p95)"""
+        results = self.counters.get(f"{name}_total", {})
+        failed: Dict[str, float] = {}
+        for key, v in results.items():
+            d = dict(key)
+            if d.get("result", "ok") != "ok":
+                failed[d.get(label, "")] = failed.get(d.get(label, ""), 0) + v
+        rows = []
+        for key, hist in sorted(self.histograms.get(f"{name}_seconds", {}).items(), key=lambda x: -x[1].count):
+            value = dict(key).get(label, "")
+            avg = hist.sum / hist.count if hist.count else 0
+            rows.append(f"`{value}` {hist.count}회 / 실패 {int(failed.get(value, 0))} / 평균 {avg * 1000:.0f}ms / p95 ≤{hist.quantile(0.95) * 1000:.0f}ms")
+        return rows
+
+
+class Timer:
+    """with 블록의 실행 시간을 {name}_seconds 에, 결과를 {name}_total 에 기록
+
+    예외가 없으면 result="ok" (블록 안에서 t.result 로 바꿀 수 있음), 시간 초과는 "timeout", 그 외 예외는 "error"
+    """
+    __slots__ = ("registry", "name", "labels", "result", "_start")
+
+    def __init__(self, registry: Registry, name: str, labels: dict):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.result = "ok"
+
+    def __enter__(self) -> "Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._start
+        if exc_type is not None:
+            if issubclass(exc_type, asyncio.CancelledError):
+                self.result = "cancelled"
+            elif issubclass(exc_type, asyncio.TimeoutError):
+                self.result = "timeout"
+            else:
+                self.result = "error"
+        self.registry.observe(f"{self.name}_seconds", elapsed, **self.labels)
+        self.registry.inc(f"{self.name}_total", result=self.result, **self.labels)
+        return False
+
+
+# 프로세스 전체에서 공유
+REGISTRY = Registry()
+inc = REGISTRY.inc
+gauge = REGISTRY.gauge
+observe = REGISTRY.observe
+timer = REGISTRY.timer
+cache = REGISTRY.cache
+
+
+class MetricsServer:
+    """/metrics 에서 Prometheus text format 으로 응답하는 로컬 HTTP 서버"""
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108, registry: Registry = REGISTRY):
+        self.host = host
+        self.port = port
+        self.registry = registry
+        self._runner: Optional[web.AppRunner] = None
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.registry.render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Metrics endpoint listening on http://{self.host}:{self.port}/metrics")
+
+    async def close(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List
+
+import destiny2
+
+
+logger = logging.getLogger("online")
+
+
+class OnlineState:
+    """클랜의 접속 상태를 메모리에 유지하는 모델
+
+    refresh 할 때마다 접속중인 클랜원 목록을 받아오고, 새로 접속했거나 접속 상태가 바뀐 클랜원,
+    활동 정보가 activity_ttl 초보다 오래된 클랜원의 활동 정보만 다시 요청한다.
+    접속자가 많을수록 min_interval, 적을수록 max_interval 에 가까운 간격으로 갱신한다.
+    """
+    def __init__(self, d2util: destiny2.ClanUtil, activity_ttl: float = 300,
+                 min_interval: float = 60, max_interval: float = 600, busy_count: int = 20):
+        self.d2util = d2util
+        self.activity_ttl = activity_ttl
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.busy_count = busy_count
+        self.members: Dict[str, dict] = {}
+        self.updated_at = 0.0
+        self.next_run = 0.0
+
+    @property
+    def interval(self) -> float:
+        ratio = min(1.0, len(self.members) / self.busy_count)
+        return self.max_interval - (self.max_interval - self.min_interval) * ratio
+
+    def is_due(self) -> bool:
+        return time.time() >= self.next_run
+
+    def is_warm(self) -> bool:
+        # 갱신이 한두 번 밀린 정도까지는 그대로 사용
+        return self.updated_at > 0 and time.time() - self.updated_at < self.interval * 2
+
+    def data(self) -> List[dict]:
+        return list(self.members.values())
+
+    async def refresh(self):
+        if self.d2util.outage and self.updated_at:
+            # 번지 API 장애 중에는 마지막으로 확인한 상태를 유지하고 나중에 다시 확인
+            self.next_run = time.time() + self.min_interval
+            return
+        online = await self.d2util.online_members()
+        now = time.time()
+        members = {}
+        targets = []
+        for n in online:
+            membership_id = n.membership_id
+            old = self.members.get(membership_id)
+            member = {'dp_name': n.display_name,
+                      'membership_type': n.membership_type,
+                      'membership_id': membership_id,
+                      'status_change': n.last_online,
+                      'activity': old["activity"] if old else None,
+                      'activity_at': old["activity_at"] if old else 0}
+            if old is None or old["status_change"] != member["status_change"] or now - member["activity_at"] > self.activity_ttl:
+                targets.append(member)
+            members[membership_id] = member
+
+        res = await asyncio.gather(*[self.d2util.user_activity(m["membership_type"], m["membership_id"]) for m in targets])
+        for member, act in zip(targets, res):
+            member["activity"] = act
+            member["activity_at"] = now
+
+        self.members = members
+        self.updated_at = time.time()
+        self.next_run = self.updated_at + self.interval
+        logger.debug(f"Online state updated ({self.d2util.group_id}): {len(members)} online, {len(targets)} refreshed")
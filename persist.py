@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from typing import Callable, Dict, Iterable, Optional, Set
+
+
+logger = logging.getLogger("persist")
+
+# 이벤트 루프에서 호출되어 현재 상태를 복사한 다음, worker thread 에서 실행할 기록 함수를 반환
+Snapshot = Callable[[], Callable[[], None]]
+
+_written: Dict[str, str] = {}
+
+
+def atomic_write_bytes(path: str, content: bytes) -> bool:
+    """임시 파일에 쓴 다음 이름을 바꿔서 기록, 내용이 그대로면 기록하지 않음"""
+    digest = hashlib.sha1(content).hexdigest()
+    if _written.get(path) == digest and os.path.exists(path):
+        return False
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    _written[path] = digest
+    return True
+
+
+def atomic_write_json(path: str, data, **kwargs) -> bool:
+    return atomic_write_bytes(path, json.dumps(data, ensure_ascii=False, **kwargs).encode("utf-8"))
+
+
+class WriteBehind:
+    """변경된 상태를 debounce 초 동안 모았다가 worker thread 에서 한 번에 기록
+
+    같은 key 로 여러 번 표시하면 마지막 것만 기록한다. 종료할 때 close 로 남은 기록을 모두 처리한다.
+    이벤트 루프가 시작되기 전에 표시된 항목은 루프가 시작된 다음 start 나 첫 mark, flush 에서 기록한다.
+    """
+    def __init__(self, debounce: float = 2.0):
+        self.debounce = debounce
+        self._pending: Dict[str, Snapshot] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._sleeping = False
+
+    def mark(self, key: str, snapshot: Snapshot):
+        self._pending[key] = snapshot
+        self.start()
+
+    def start(self):
+        if not self._pending or (self._task is not None and not self._task.done()):
+            return
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # 봇 생성 중처럼 아직 루프가 없으면 기록 대기만 함
+            return
+        self._task = asyncio.ensure_future(self._delayed_flush())
+
+    async def _delayed_flush(self):
+        # 기록하는 동안 새로 표시된 항목이 있으면 한 번 더 기록
+        while self._pending:
+            self._sleeping = True
+            try:
+                await asyncio.sleep(self.debounce)
+            except asyncio.CancelledError:
+                # 종료 요청: 기다리지 않고 바로 기록
+                pass
+            finally:
+                self._sleeping = False
+            await self.flush()
+
+    async def flush(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            for key, snapshot in pending.items():
+                try:
+                    await asyncio.to_thread(snapshot())
+                except Exception as e:
+                    logger.error(f"Error occurred while writing {key}: {e}")
+
+    async def close(self):
+        if self._task is not None and not self._task.done():
+            if self._sleeping:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        await self.flush()
+
+
+class DictSync:
+    """dict 에서 바뀐 key 만 모아서 WriteBehind 로 upsert / delete"""
+    def __init__(self, writer: WriteBehind, key: str, get_data: Callable[[], dict],
+                 upsert: Callable[[dict], None], delete: Callable[[Iterable], None]):
+        self.writer = writer
+        self.key = key
+        self._get_data = get_data
+        self._upsert = upsert
+        self._delete = delete
+        self._dirty: Set = set()
+
+    def touch(self, *keys):
+        if not keys:
+            return
+        self._dirty.update(keys)
+        self.writer.mark(self.key, self._snapshot)
+
+    def _snapshot(self) -> Callable[[], None]:
+        data = self._get_data()
+        dirty, self._dirty = self._dirty, set()
+        upsert = {k: dict(data[k]) for k in dirty if k in data}
+        delete = [k for k in dirty if k not in data]
+
+        def write():
+            if upsert:
+                self._upsert(upsert)
+            if delete:
+                self._delete(delete)
+        return write
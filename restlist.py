@@ -0,0 +1,149 @@
+import asyncio
+import bisect
+import datetime as dt
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import persist
+import storage
+
+
+logger = logging.getLogger("restlist")
+
+
+def end_timestamp(end_time: str) -> float:
+    # 휴가 종료일 0시가 되면 만료 ("YYYY-MM-DD")
+    return dt.datetime.strptime(end_time, "%Y-%m-%d").timestamp()
+
+
+class RestList:
+    """휴가 목록
+
+    항목은 membership_id 로 바로 찾고, 만료 시각 순으로 정렬된 (만료 시각, membership_id) list 를 같이 유지해서
+    조회할 때 날짜를 다시 읽거나 전체를 정렬하지 않는다.
+    만료된 항목은 run_purge 가 다음 만료 시각에 맞춰 제거하고, 클랜을 나간 클랜원은 클랜원 변동 확인 결과로 제거한다.
+    """
+    def __init__(self, store: storage.Storage, writer: persist.WriteBehind, default_group_id: int = 0):
+        self.default_group_id = default_group_id
+        self.items: Dict[str, dict] = store.load_rest()
+        self.version = 0
+        self._order: List[Tuple[float, str]] = []
+        self._expires: Dict[str, float] = {}
+        # 번지 이름이나 닉네임이 비어있는 예전 휴가 정보
+        self._unnamed = {k for k, v in self.items.items() if not (v.get("bungie_name") and v.get("display_name"))}
+        self._changed = asyncio.Event()
+        self._sync = persist.DictSync(writer, "rest", lambda: self.items, store.upsert_rest, store.delete_rest)
+        # 종료일을 읽을 수 없는 항목은 메모리에서만 먼저 지우고, DB 에서는 루프가 시작된 다음 persist_dropped 로 지움
+        self._dropped: List[str] = []
+        for k, v in list(self.items.items()):
+            try:
+                self._index(k, end_timestamp(v["end_time"]))
+            except (KeyError, ValueError):
+                logger.warning(f"Dropped rest entry with invalid end time: {k}")
+                self.items.pop(k)
+                self._unnamed.discard(k)
+                self._dropped.append(k)
+
+    def persist_dropped(self):
+        dropped, self._dropped = self._dropped, []
+        self._sync.touch(*dropped)
+
+    def __contains__(self, membership_id) -> bool:
+        return membership_id in self.items
+
+    def __len__(self):
+        return len(self.items)
+
+    def group_id_of(self, v: dict) -> int:
+        # group_id 가 없는 예전 휴가 정보는 기본 클랜 소속으로 취급
+        return v.get("group_id", self.default_group_id)
+
+    def _index(self, membership_id: str, expires: float):
+        self._expires[membership_id] = expires
+        bisect.insort(self._order, (expires, membership_id))
+
+    def _unindex(self, membership_id: str):
+        expires = self._expires.pop(membership_id, None)
+        if expires is None:
+            return
+        i = bisect.bisect_left(self._order, (expires, membership_id))
+        if i < len(self._order) and self._order[i] == (expires, membership_id):
+            del self._order[i]
+
+    @property
+    def next_expiry(self) -> Optional[float]:
+        return self._order[0][0] if self._order else None
+
+    def add(self, membership_id: str, entry: dict):
+        self._unindex(membership_id)
+        self.items[membership_id] = entry
+        self._index(membership_id, end_timestamp(entry["end_time"]))
+        self.version += 1
+        self._sync.touch(membership_id)
+        # 기존 다음 만료 시각보다 먼저 끝나는 휴가일 수 있으므로 대기 중인 정리 작업을 깨움
+        self._changed.set()
+
+    def remove(self, *membership_ids) -> List[str]:
+        removed = [k for k in membership_ids if k in self.items]
+        for k in removed:
+            self.items.pop(k)
+            self._unindex(k)
+            self._unnamed.discard(k)
+        if removed:
+            self.version += 1
+            self._sync.touch(*removed)
+        return removed
+
+    def purge(self, now: float = None) -> List[str]:
+        """만료된 휴가 제거 (앞에서부터 만료 시각이 지난 항목만 확인)"""
+        now = now if now is not None else time.time()
+        k = 0
+        while k < len(self._order) and self._order[k][0] <= now:
+            k += 1
+        if not k:
+            return []
+        removed = self.remove(*[membership_id for _, membership_id in self._order[:k]])
+        logger.info(f"Purged {len(removed)} expired rest entries")
+        return removed
+
+    def reconcile(self, group_id: int, member_ids: Iterable[str]) -> List[str]:
+        """지금 클랜원 목록에 없는 해당 클랜의 휴가 제거 (변동 기록이 없는 첫 확인에서만 사용)"""
+        member_ids = set(member_ids)
+        return self.remove(*[k for k, v in self.items.items() if self.group_id_of(v) == group_id and k not in member_ids])
+
+    def fill_names(self, group_id: int, members: dict) -> List[str]:
+        """번지 이름, 닉네임이 없는 예전 휴가 정보 채우기 (members: membership_id -> roster.Member)"""
+        filled = []
+        for k in list(self._unnamed):
+            v = self.items[k]
+            if self.group_id_of(v) != group_id or k not in members:
+                continue
+            # 번지 이름이 없는 예전 계정은 다시 확인하지 않음
+            self._unnamed.discard(k)
+            bungie_name = v.get("bungie_name") or members[k].bungie_name
+            display_name = v.get("display_name") or members[k].display_name
+            if (bungie_name, display_name) != (v.get("bungie_name"), v.get("display_name")):
+                v["bungie_name"] = bungie_name
+                v["display_name"] = display_name
+                filled.append(k)
+        if filled:
+            self.version += 1
+            self._sync.touch(*filled)
+        return filled
+
+    def group_items(self, group_id: int) -> List[Tuple[str, dict]]:
+        # 만료 시각 순
+        return [(k, self.items[k]) for _, k in self._order if self.group_id_of(self.items[k]) == group_id]
+
+    async def run_purge(self, max_wait: float = 3600):
+        """다음 만료 시각까지 기다렸다가 만료된 휴가 제거 (새 휴가가 추가되면 다시 계산)"""
+        while True:
+            self._changed.clear()
+            expiry = self.next_expiry
+            wait = max_wait if expiry is None else min(max_wait, max(0.0, expiry - time.time()))
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=wait)
+            except asyncio.TimeoutError:
+                pass
+            self.purge()
@@ -0,0 +1,218 @@
+import asyncio
+import bisect
+import logging
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import pydest
+
+import metrics
+
+
+logger = logging.getLogger("roster")
+
+
+def normalize_bungie_name(bungie_name: str) -> str:
+    # 대소문자, 코드 앞의 0 생략 여부와 관계없이 같은 키가 되도록 정규화 (ex. "Name#0123" -> "name#0123")
+    name, sep, code = bungie_name.strip().rpartition("#")
+    if not sep or not code.isdigit():
+        return bungie_name.strip().casefold()
+    return f"{name.casefold()}#{int(code):04d}"
+
+
+def escape_markdown(s: str) -> str:
+    return re.sub(r"([-_~`*])", "\\\\\\1", s)
+
+
+PROFILE_URL = "https://www.bungie.net/7/ko/User/Profile/{}/{}"
+
+
+class Member:
+    """GetMembersOfGroup 결과에서 봇이 사용하는 필드만 담은 클랜원 정보
+
+    클랜원 목록을 받을 때 한 번만 만들고, 번지 이름, 프로필 주소, 출력용 문자열(display)도 미리 만들어 둔다.
+    """
+    __slots__ = ("membership_id", "membership_type", "cross_save_override", "display_name", "global_name", "global_code",
+                 "member_type", "is_online", "last_online", "bnet_membership_id", "bnet_membership_type", "bnet_display_name",
+                 "bungie_name", "profile_url", "display")
+
+    def __init__(self, membership_id: str, membership_type: int = 0, cross_save_override: int = 0, display_name: str = "",
+                 global_name: str = "", global_code: Optional[int] = None, member_type: int = 0, is_online: bool = False,
+                 last_online: int = 0, bnet_membership_id: Optional[str] = None, bnet_membership_type: Optional[int] = None,
+                 bnet_display_name: str = ""):
+        self.membership_id = str(membership_id)
+        self.membership_type = membership_type
+        self.cross_save_override = cross_save_override
+        self.display_name = display_name
+        self.global_name = global_name
+        self.global_code = global_code
+        self.member_type = member_type
+        self.is_online = is_online
+        self.last_online = last_online
+        self.bnet_membership_id = bnet_membership_id
+        self.bnet_membership_type = bnet_membership_type
+        self.bnet_display_name = bnet_display_name
+        # "이름#0123", 번지 이름이 없는 예전 계정은 빈 문자열
+        self.bungie_name = f"{global_name}#{global_code:04d}" if global_name and global_code is not None else ""
+        self.profile_url = PROFILE_URL.format(bnet_membership_type, bnet_membership_id) if bnet_membership_id \
+            else PROFILE_URL.format(membership_type, self.membership_id)
+        self.display = self.format()
+
+    @classmethod
+    def from_dict(cls, n: dict) -> "Member":
+        info = n["destinyUserInfo"]
+        bnet = n.get("bungieNetUserInfo") or {}
+        return cls(
+            membership_id=info["membershipId"],
+            membership_type=info.get("membershipType", 0),
+            cross_save_override=info.get("crossSaveOverride", 0),
+            display_name=info.get("LastSeenDisplayName") or "",
+            global_name=info.get("bungieGlobalDisplayName") or "",
+            global_code=info.get("bungieGlobalDisplayNameCode"),
+            member_type=n.get("memberType", 0),
+            is_online=bool(n.get("isOnline")),
+            last_online=int(n.get("lastOnlineStatusChange", 0)),
+            bnet_membership_id=bnet.get("membershipId"),
+            bnet_membership_type=bnet.get("membershipType"),
+            bnet_display_name=bnet.get("displayName") or "",
+        )
+
+    def to_dict(self) -> dict:
+        """DB 에 저장할 GroupMember 형식 (from_dict 로 다시 읽을 수 있는 필드만)"""
+        n = {
+            "memberType": self.member_type,
+            "isOnline": self.is_online,
+            "lastOnlineStatusChange": str(self.last_online),
+            "destinyUserInfo": {
+                "membershipId": self.membership_id,
+                "membershipType": self.membership_type,
+                "crossSaveOverride": self.cross_save_override,
+                "LastSeenDisplayName": self.display_name,
+                "bungieGlobalDisplayName": self.global_name,
+                "bungieGlobalDisplayNameCode": self.global_code,
+            }
+        }
+        if self.bnet_membership_id:
+            n["bungieNetUserInfo"] = {
+                "membershipId": self.bnet_membership_id,
+                "membershipType": self.bnet_membership_type,
+                "displayName": self.bnet_display_name,
+            }
+        return n
+
+    def format(self, bold: bool = True, skip_bnet_name: bool = True) -> str:
+        """[**번지 이름**#코드](프로필 주소) (번지넷 이름) 형식"""
+        if self.bungie_name:
+            name = f"**{escape_markdown(self.global_name)}**#{self.global_code:04d}" if bold else f"{escape_markdown(self.global_name)}#{self.global_code:04d}"
+        else:
+            name = f"**{self.display_name}**" if bold else self.display_name
+
+        if not self.bnet_display_name:
+            bnet_name = ""
+        elif skip_bnet_name and (self.global_name or self.display_name) == self.bnet_display_name:
+            bnet_name = ""
+        else:
+            bnet_name = f" ({escape_markdown(self.bnet_display_name)})"
+        return f"[{name}]({self.profile_url}){bnet_name}"
+
+    def __repr__(self):
+        return f"Member({self.membership_id}, {self.bungie_name or self.display_name!r})"
+
+
+class RosterSnapshot:
+    """한 번의 GetMembersOfGroup 요청 결과. 같은 version 이면 같은 데이터
+
+    membershipId, 번지 이름, 표시 이름 색인과 마지막 접속 시간 순 정렬은 생성 시 한 번만 만들어 모든 명령어가 재사용한다.
+    """
+    def __init__(self, version: int, members: List[Member], fetched_at: float = None):
+        self.version = version
+        self.members = members
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.by_id: Dict[str, Member] = {}
+        self.by_bungie_name: Dict[str, Member] = {}
+        self.by_display_name: Dict[str, Member] = {}
+        for n in members:
+            self.by_id[n.membership_id] = n
+            if n.bungie_name:
+                self.by_bungie_name.setdefault(normalize_bungie_name(n.bungie_name), n)
+            if n.display_name:
+                self.by_display_name.setdefault(n.display_name.casefold(), n)
+        # 마지막 접속 상태 변경 시간 순 정렬 (미접 커트라인은 이분 탐색으로 처리)
+        self.by_last_online: List[Member] = sorted(members, key=lambda x: x.last_online)
+        self._last_online_keys: List[int] = [n.last_online for n in self.by_last_online]
+
+    def __len__(self):
+        return len(self.members)
+
+    def __contains__(self, membership_id) -> bool:
+        return str(membership_id) in self.by_id
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def offline_before(self, timestamp: float) -> List[Member]:
+        """timestamp 이전부터 접속 상태 변화가 없는 클랜원 (오래된 순)"""
+        return self.by_last_online[:bisect.bisect_left(self._last_online_keys, timestamp)]
+
+    def find(self, bungie_name: str = None, membership_id=None, display_name: str = None) -> Optional[Member]:
+        if membership_id and str(membership_id) in self.by_id:
+            return self.by_id[str(membership_id)]
+        if bungie_name:
+            found = self.by_bungie_name.get(normalize_bungie_name(bungie_name))
+            if found:
+                return found
+        if display_name:
+            return self.by_display_name.get(display_name.casefold())
+        return None
+
+
+class RosterCache:
+    """클랜원 목록 캐시
+
+    ttl 초 동안은 마지막으로 받은 목록을 재사용하고, 동시에 들어온 갱신 요청은
+    하나의 API 요청 결과를 같이 기다린다.
+    갱신에 실패하면 allow_stale 인 경우 마지막으로 받은 목록을 대신 반환하고 stale 로 표시한다.
+    """
+    def __init__(self, fetch: Callable[[], Awaitable[List[Member]]], ttl: float = 60):
+        self._fetch = fetch
+        self.ttl = ttl
+        self.snapshot: Optional[RosterSnapshot] = None
+        self.stale = False
+        self._version = 0
+        self._inflight: Optional[asyncio.Future] = None
+
+    def is_fresh(self, max_age: float = None) -> bool:
+        max_age = self.ttl if max_age is None else max_age
+        return self.snapshot is not None and self.snapshot.age < max_age
+
+    async def get(self, max_age: float = None, force: bool = False, allow_stale: bool = True) -> RosterSnapshot:
+        fresh = not force and self.is_fresh(max_age)
+        metrics.cache("roster", fresh)
+        if fresh:
+            return self.snapshot
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._refresh())
+        try:
+            # 요청한 쪽이 취소되더라도 다른 대기자들을 위해 요청 자체는 유지
+            return await asyncio.shield(self._inflight)
+        except (asyncio.TimeoutError, KeyError, pydest.PydestException) as e:
+            if not allow_stale or self.snapshot is None:
+                raise
+            if not self.stale:
+                logger.warning(f"Roster refresh failed, serving stale roster (v{self.snapshot.version}): {e}")
+            self.stale = True
+            metrics.inc("roster_stale_total")
+            return self.snapshot
+
+    async def _refresh(self) -> RosterSnapshot:
+        try:
+            members = await self._fetch()
+            self._version += 1
+            self.stale = False
+            self.snapshot = RosterSnapshot(self._version, members)
+            logger.debug(f"Roster updated (v{self._version}, {len(members)} members)")
+            return self.snapshot
+        finally:
+            self._inflight = None
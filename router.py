@@ -0,0 +1,139 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import discord
+
+import metrics
+
+
+logger = logging.getLogger("router")
+
+Handler = Callable[..., Awaitable]
+
+
+class Command:
+    """명령어 하나의 처리 함수와 실행 제한 설정
+
+    concurrency: 같은 서버(DM 은 채널)에서 동시에 처리할 수 있는 요청 수 (0 이면 제한 없음)
+    guild_cooldown, user_cooldown: 같은 서버, 같은 유저가 다시 사용할 수 있을 때까지의 시간 (초)
+    dedup: 같은 채널에서 같은 내용으로 처리중인 요청이 있으면 새로 처리하지 않고 끝날 때까지 기다림
+    """
+    def __init__(self, name: str, handler: Handler, concurrency: int = 0, guild_cooldown: float = 0,
+                 user_cooldown: float = 0, dedup: bool = False, requires_clan: bool = True):
+        self.name = name
+        self.handler = handler
+        self.guild_cooldown = guild_cooldown
+        self.user_cooldown = user_cooldown
+        self.dedup = dedup
+        self.requires_clan = requires_clan
+        self.concurrency = concurrency
+        # 서버별 [semaphore, 처리중이거나 기다리는 요청 수], 요청이 없는 서버는 제거
+        self._sems: Dict[Hashable, list] = {}
+        self._last_used: Dict[Hashable, float] = {}
+
+    def cooldown_left(self, message: discord.Message, now: float) -> float:
+        left = 0.0
+        if self.guild_cooldown and message.guild:
+            left = max(left, self._last_used.get(("guild", message.guild.id), 0) + self.guild_cooldown - now)
+        if self.user_cooldown:
+            left = max(left, self._last_used.get(("user", message.author.id), 0) + self.user_cooldown - now)
+        return left
+
+    def mark_used(self, message: discord.Message, now: float):
+        if len(self._last_used) > 1024:
+            # 쿨다운이 끝난 항목 정리
+            cut = now - max(self.guild_cooldown, self.user_cooldown)
+            self._last_used = {k: v for k, v in self._last_used.items() if v > cut}
+        if self.guild_cooldown and message.guild:
+            self._last_used[("guild", message.guild.id)] = now
+        if self.user_cooldown:
+            self._last_used[("user", message.author.id)] = now
+
+    async def run(self, message: discord.Message, *args):
+        if not self.concurrency:
+            return await self.handler(message, *args)
+        key = ("guild", message.guild.id) if message.guild else ("channel", message.channel.id)
+        entry = self._sems.get(key)
+        if entry is None:
+            entry = self._sems[key] = [asyncio.Semaphore(self.concurrency), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                return await self.handler(message, *args)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                self._sems.pop(key, None)
+
+
+class CommandRouter:
+    """prefix 로 시작하는 메시지를 명령어 이름으로 바로 찾아서 처리
+
+    명령어 이름은 앞의 두 단어("$차단 가져오기"), 첫 단어 순서로 dict 에서 찾고,
+    "$미접30" 처럼 붙여 쓴 경우에만 긴 이름부터 startswith 로 찾는다.
+    """
+    def __init__(self, prefix: str = "$"):
+        self.prefix = prefix
+        self.commands: Dict[str, Command] = {}
+        self._by_length: List[str] = []
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+
+    def command(self, name: str, **kwargs) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            self.commands[name] = Command(name, handler, **kwargs)
+            self._by_length = sorted(self.commands, key=len, reverse=True)
+            return handler
+        return decorator
+
+    def resolve(self, content: str) -> Optional[Command]:
+        if not content.startswith(self.prefix):
+            return None
+        words = content.split(maxsplit=2)
+        if len(words) > 1:
+            command = self.commands.get(f"{words[0]} {words[1]}")
+            if command is not None:
+                return command
+        command = self.commands.get(words[0]) if words else None
+        if command is not None:
+            return command
+        for name in self._by_length:
+            if content.startswith(name):
+                return self.commands[name]
+        return None
+
+    async def dispatch(self, command: Command, message: discord.Message, *args):
+        """중복 요청, 쿨다운, 동시 실행 수를 확인한 다음 처리 함수에 message, *args 전달"""
+        # 같은 채널에서 같은 명령어를 처리하는 중이면 그 결과(응답 메시지)를 같이 사용
+        key = (command.name, message.channel.id, message.content.strip()) if command.dedup else None
+        inflight = self._inflight.get(key) if key is not None else None
+        if inflight is not None:
+            metrics.inc("command_deduplicated_total", command=command.name)
+            try:
+                await asyncio.shield(inflight)
+            except Exception as e:
+                # 오류는 처음 요청한 쪽에서 한 번만 기록
+                logger.debug(f"Deduplicated {command.name} failed: {e}")
+            return
+
+        now = time.monotonic()
+        left = command.cooldown_left(message, now)
+        if left > 0:
+            metrics.inc("command_rejected_total", command=command.name, reason="cooldown")
+            await message.channel.send(f"잠시 후 다시 시도해주세요. ({left:.0f}초)")
+            return
+        command.mark_used(message, now)
+
+        if key is None:
+            await self._run_timed(command, message, *args)
+            return
+        future = asyncio.ensure_future(self._run_timed(command, message, *args))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        await asyncio.shield(future)
+
+    @staticmethod
+    async def _run_timed(command: Command, message: discord.Message, *args):
+        with metrics.timer("command", command=command.name):
+            await command.run(message, *args)
@@ -0,0 +1,249 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List
+
+import changes
+import roster
+
+
+logger = logging.getLogger("storage")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS roster (
+    group_id INTEGER NOT NULL,
+    membership_id TEXT NOT NULL,
+    last_online INTEGER NOT NULL DEFAULT 0,
+    updated INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (group_id, membership_id)
+);
+CREATE INDEX IF NOT EXISTS roster_last_online ON roster (group_id, last_online);
+CREATE TABLE IF NOT EXISTS rest (
+    membership_id TEXT PRIMARY KEY,
+    group_id INTEGER,
+    end_time TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rest_end_time ON rest (end_time);
+CREATE TABLE IF NOT EXISTS block (
+    membership_id TEXT PRIMARY KEY,
+    time INTEGER NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS block_time ON block (time);
+CREATE TABLE IF NOT EXISTS alert_target (
+    channel_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS last_played (
+    membership_id TEXT PRIMARY KEY,
+    last_played INTEGER NOT NULL,
+    status_change INTEGER NOT NULL,
+    checked INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS identity (
+    membership_id TEXT PRIMARY KEY,
+    membership_type INTEGER NOT NULL,
+    bungie_name TEXT NOT NULL,
+    steam_id TEXT NOT NULL,
+    updated INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS member_log (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id INTEGER NOT NULL,
+    membership_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    old TEXT NOT NULL,
+    new TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    old_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS member_log_member ON member_log (group_id, membership_id);
+CREATE INDEX IF NOT EXISTS member_log_name ON member_log (group_id, name_key);
+CREATE INDEX IF NOT EXISTS member_log_old_name ON member_log (group_id, old_key);
+"""
+
+
+class Storage:
+    """클랜원 목록, 클랜원 변동 기록, 휴가 목록, 차단 목록, 알림 채널을 저장하는 SQLite DB (WAL 모드)
+
+    변경된 행만 기록하므로 목록이 커져도 매번 파일 전체를 다시 쓰지 않고,
+    기록 도중 종료되더라도 DB 가 깨지지 않는다.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.RLock()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _execute(self, sql: str, params: Iterable = ()) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _executemany(self, sql: str, rows: Iterable):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(sql, rows)
+
+    # meta
+    def get_meta(self, key: str, default: str = None) -> str:
+        rows = self._execute("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key: str, value: str):
+        self._execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # 클랜원 목록
+    def load_roster(self, group_id: int) -> List[dict]:
+        rows = self._execute("SELECT data FROM roster WHERE group_id = ? ORDER BY last_online", (group_id,))
+        return [json.loads(n[0]) for n in rows]
+
+    def save_roster(self, group_id: int, members: List[dict]):
+        # 내용이 바뀐 클랜원만 갱신하고 클랜을 나간 클랜원은 삭제
+        old = dict(self._execute("SELECT membership_id, data FROM roster WHERE group_id = ?", (group_id,)))
+        now = int(time.time())
+        upsert = []
+        current = set()
+        for n in members:
+            membership_id = str(n["destinyUserInfo"]["membershipId"])
+            current.add(membership_id)
+            data = json.dumps(n, ensure_ascii=False, sort_keys=True)
+            if old.get(membership_id) != data:
+                upsert.append((group_id, membership_id, int(n.get("lastOnlineStatusChange", 0)), now, data))
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany("INSERT OR REPLACE INTO roster (group_id, membership_id, last_online, updated, data) VALUES (?, ?, ?, ?, ?)", upsert)
+                self._conn.executemany("DELETE FROM roster WHERE group_id = ? AND membership_id = ?",
+                                       [(group_id, k) for k in old.keys() - current])
+
+    # 휴가 목록
+    def load_rest(self) -> Dict[str, dict]:
+        return {k: json.loads(v) for k, v in self._execute("SELECT membership_id, data FROM rest ORDER BY end_time")}
+
+    def upsert_rest(self, items: Dict[str, dict]):
+        self._executemany("INSERT OR REPLACE INTO rest (membership_id, group_id, end_time, data) VALUES (?, ?, ?, ?)",
+                          [(str(k), v.get("group_id"), v["end_time"], json.dumps(v, ensure_ascii=False)) for k, v in items.items()])
+
+    def delete_rest(self, membership_ids: Iterable):
+        self._executemany("DELETE FROM rest WHERE membership_id = ?", [(str(k),) for k in membership_ids])
+
+    # 차단 목록
+    def load_block(self) -> Dict[str, dict]:
+        return {k: json.loads(v) for k, v in self._execute("SELECT membership_id, data FROM block ORDER BY time")}
+
+    def upsert_block(self, items: Dict[str, dict]):
+        self._executemany("INSERT OR REPLACE INTO block (membership_id, time, data) VALUES (?, ?, ?)",
+                          [(str(k), int(v.get("time", 0)), json.dumps(v, ensure_ascii=False)) for k, v in items.items()])
+
+    def delete_block(self, membership_ids: Iterable):
+        self._executemany("DELETE FROM block WHERE membership_id = ?", [(str(k),) for k in membership_ids])
+
+    # 프로필로 확인한 마지막 플레이 시각
+    def load_last_played(self) -> Dict[str, dict]:
+        return {k: {"last_played": a, "status_change": b, "checked": c}
+                for k, a, b, c in self._execute("SELECT membership_id, last_played, status_change, checked FROM last_played")}
+
+    def upsert_last_played(self, items: Dict[str, dict]):
+        self._executemany("INSERT OR REPLACE INTO last_played (membership_id, last_played, status_change, checked) VALUES (?, ?, ?, ?)",
+                          [(str(k), v["last_played"], v["status_change"], v["checked"]) for k, v in items.items()])
+
+    def delete_last_played(self, membership_ids: Iterable):
+        self._executemany("DELETE FROM last_played WHERE membership_id = ?", [(str(k),) for k in membership_ids])
+
+    # 번지 이름, SteamID, membershipId 대응 관계
+    def load_identity(self) -> Dict[str, dict]:
+        return {k: {"membership_type": a, "bungie_name": b, "steam_id": c, "updated": d}
+                for k, a, b, c, d in self._execute("SELECT membership_id, membership_type, bungie_name, steam_id, updated FROM identity")}
+
+    def upsert_identity(self, items: Dict[str, dict]):
+        self._executemany("INSERT OR REPLACE INTO identity (membership_id, membership_type, bungie_name, steam_id, updated) VALUES (?, ?, ?, ?, ?)",
+                          [(str(k), v["membership_type"], v["bungie_name"], v["steam_id"], v["updated"]) for k, v in items.items()])
+
+    def delete_identity(self, membership_ids: Iterable):
+        self._executemany("DELETE FROM identity WHERE membership_id = ?", [(str(k),) for k in membership_ids])
+
+    # 클랜원 변동 기록 (추가만 가능)
+    def append_changes(self, group_id: int, items: List[changes.MemberChange], t: int = None):
+        t = t if t is not None else int(time.time())
+        self._executemany(
+            "INSERT INTO member_log (group_id, membership_id, time, kind, old, new, name_key, old_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(group_id, n.membership_id, t, n.kind, n.old, n.new,
+              roster.normalize_bungie_name(n.new or n.old), roster.normalize_bungie_name(n.old)) for n in items]
+        )
+
+    def find_logged_members(self, group_id: int, bungie_name: str) -> List[str]:
+        # 지금 이름 또는 예전 이름으로 기록된 클랜원 찾기
+        key = roster.normalize_bungie_name(bungie_name)
+        rows = self._execute("SELECT DISTINCT membership_id FROM member_log WHERE group_id = ? AND (name_key = ? OR old_key = ?)",
+                             (group_id, key, key))
+        return [n[0] for n in rows]
+
+    def load_changes(self, group_id: int, membership_ids: Iterable) -> List[tuple]:
+        membership_ids = [str(n) for n in membership_ids]
+        if not membership_ids:
+            return []
+        return self._execute(
+            f"SELECT membership_id, time, kind, old, new FROM member_log WHERE group_id = ? AND membership_id IN ({','.join('?' * len(membership_ids))}) ORDER BY id",
+            (group_id, *membership_ids)
+        )
+
+    # 알림 채널
+    def load_alert_target(self) -> List[int]:
+        return [n[0] for n in self._execute("SELECT channel_id FROM alert_target")]
+
+    def add_alert_target(self, channel_id: int):
+        self._execute("INSERT OR IGNORE INTO alert_target (channel_id) VALUES (?)", (channel_id,))
+
+    def remove_alert_target(self, channel_id: int):
+        self._execute("DELETE FROM alert_target WHERE channel_id = ?", (channel_id,))
+
+    def replace_alert_target(self, channel_ids: List[int]):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.execute("DELETE FROM alert_target")
+                self._conn.executemany("INSERT OR IGNORE INTO alert_target (channel_id) VALUES (?)", [(n,) for n in channel_ids])
+
+    # 기존 json 파일에서 한 번만 옮겨오기
+    def migrate_lists(self, path_push_list: str, path_rest_list: str, path_block_list: str):
+        if self.get_meta("migrated_lists"):
+            return
+        if os.path.exists(path_push_list):
+            with open(path_push_list, "r", encoding="utf-8") as f:
+                for n in json.load(f).get("alert_target", []):
+                    self.add_alert_target(n)
+        if os.path.exists(path_rest_list):
+            with open(path_rest_list, "r", encoding="utf-8") as f:
+                self.upsert_rest(json.load(f))
+        if os.path.exists(path_block_list):
+            with open(path_block_list, "r", encoding="utf-8") as f:
+                self.upsert_block(json.load(f))
+        self.set_meta("migrated_lists", str(int(time.time())))
+        logger.info("Migrated alert target, rest list, block list from json files")
+
+    def migrate_roster(self, group_id: int, path_members: str):
+        key = f"migrated_roster_{group_id}"
+        if self.get_meta(key):
+            return
+        if os.path.exists(path_members):
+            with open(path_members, "r", encoding="utf-8") as f:
+                self.save_roster(group_id, json.load(f))
+            logger.info(f"Migrated clan members ({group_id}) from {path_members}")
+        self.set_meta(key, str(int(time.time())))
@@ -0,0 +1,240 @@
+import bisect
+import json
+import logging
+import os
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import persist
+
+
+logger = logging.getLogger("timeseries")
+
+FORMAT_VERSION = 2
+HOUR = 3600
+DAY = 86400
+
+
+class Tier:
+    """같은 간격(width 초)의 구간별 접속 기록
+
+    slots: 구간 시작 시각, samples: 구간 안에서 기록한 횟수, total: 구간 안에서 접속중이던 클랜원 수의 합,
+    counts: 클랜원별로 구간 안에서 접속중이던 횟수 (slots 보다 짧으면 나머지는 0)
+    """
+    __slots__ = ("width", "slots", "samples", "total", "counts")
+
+    def __init__(self, width: int):
+        self.width = width
+        self.slots = array("I")
+        self.samples = array("I")
+        self.total = array("I")
+        self.counts: Dict[str, array] = {}
+
+    def __len__(self):
+        return len(self.slots)
+
+    def _member(self, membership_id: str) -> array:
+        counts = self.counts.get(membership_id)
+        if counts is None:
+            counts = self.counts[membership_id] = array("I")
+        if len(counts) < len(self.slots):
+            counts.frombytes(bytes(counts.itemsize * (len(self.slots) - len(counts))))
+        return counts
+
+    def add(self, slot: int, samples: int, members: Dict[str, int]):
+        """slot 구간에 기록 추가 (마지막 구간과 같으면 합침)"""
+        if not self.slots or self.slots[-1] != slot:
+            self.slots.append(slot)
+            self.samples.append(0)
+            self.total.append(0)
+        self.samples[-1] += samples
+        for membership_id, n in members.items():
+            self._member(membership_id)[-1] += n
+            self.total[-1] += n
+
+    def pop_before(self, cut: int) -> List[Tuple[int, int, Dict[str, int]]]:
+        """cut 이전 구간들을 잘라내서 반환"""
+        k = bisect.bisect_left(self.slots, cut)
+        if not k:
+            return []
+        popped = []
+        for i in range(k):
+            popped.append((self.slots[i], self.samples[i],
+                           {m: c[i] for m, c in self.counts.items() if i < len(c) and c[i]}))
+        del self.slots[:k]
+        del self.samples[:k]
+        del self.total[:k]
+        for m in list(self.counts):
+            del self.counts[m][:k]
+            if not any(self.counts[m]):
+                del self.counts[m]
+        return popped
+
+    def start_index(self, since: float) -> int:
+        return bisect.bisect_left(self.slots, since - self.width + 1)
+
+    def playtime(self, membership_id: str, since: float) -> float:
+        counts = self.counts.get(membership_id)
+        if counts is None:
+            return 0.0
+        width = self.width
+        samples = self.samples
+        return sum(counts[i] * width / samples[i]
+                   for i in range(self.start_index(since), len(counts)) if counts[i])
+
+
+class ClanSeries:
+    """클랜 하나의 접속 기록 (원본 -> 1시간 -> 1일 단위로 오래된 기록을 합침)"""
+    def __init__(self, group_id: int, interval: int, raw_days: int = 7, hourly_days: int = 90, daily_days: int = 365):
+        self.group_id = group_id
+        self.retention = (raw_days * DAY, hourly_days * DAY, daily_days * DAY)
+        self.tiers = [Tier(interval), Tier(HOUR), Tier(DAY)]
+
+    def record(self, online_ids: Iterable[str], t: float = None):
+        t = int(t if t is not None else time.time())
+        raw = self.tiers[0]
+        raw.add(t - t % raw.width, 1, {str(n): 1 for n in online_ids})
+        self.compact(t)
+
+    def compact(self, now: float):
+        # 보관 기간이 지난 구간은 다음 단계로 합치고, 마지막 단계는 삭제
+        for i, tier in enumerate(self.tiers):
+            popped = tier.pop_before(now - self.retention[i])
+            if i + 1 < len(self.tiers):
+                upper = self.tiers[i + 1]
+                for slot, samples, members in popped:
+                    upper.add(slot - slot % upper.width, samples, members)
+
+    # 조회
+    def member_playtime(self, membership_id: str, since: float) -> float:
+        """since 이후 접속 시간 추정치 (초)"""
+        return sum(tier.playtime(str(membership_id), since) for tier in self.tiers)
+
+    def top_members(self, since: float, limit: int = 10) -> List[Tuple[str, float]]:
+        members = set()
+        for tier in self.tiers:
+            members.update(tier.counts)
+        ranking = sorted(((m, self.member_playtime(m, since)) for m in members), key=lambda x: -x[1])
+        return [n for n in ranking[:limit] if n[1] > 0]
+
+    def clan_playtime(self, since: float) -> float:
+        total = 0.0
+        for tier in self.tiers:
+            for i in range(tier.start_index(since), len(tier)):
+                total += tier.total[i] * tier.width / tier.samples[i]
+        return total
+
+    def peak_hours(self, since: float, membership_id: str = None) -> List[float]:
+        """시간대(0~23시)별 평균 접속 인원 (membership_id 가 있으면 해당 클랜원의 접속 확률)
+
+        1일 단위로 합친 기록에는 시간대 정보가 없으므로 원본과 1시간 단위 기록만 사용
+        """
+        online = [0.0] * 24
+        observed = [0] * 24
+        for tier in self.tiers[:2]:
+            counts = tier.total if membership_id is None else tier.counts.get(str(membership_id), array("I"))
+            for i in range(tier.start_index(since), len(tier)):
+                hour = time.localtime(tier.slots[i]).tm_hour
+                value = counts[i] if i < len(counts) else 0
+                online[hour] += value / tier.samples[i] * tier.width
+                observed[hour] += tier.width
+        return [online[h] / observed[h] if observed[h] else 0.0 for h in range(24)]
+
+    @property
+    def first_sample(self) -> Optional[int]:
+        for tier in reversed(self.tiers):
+            if len(tier):
+                return tier.slots[0]
+        return None
+
+    # 파일 형식: json 헤더 한 줄 + 배열 원본 바이트
+    def to_bytes(self) -> bytes:
+        header = {"version": FORMAT_VERSION, "group_id": self.group_id, "byteorder": sys.byteorder, "tiers": []}
+        body = []
+        for tier in self.tiers:
+            members = list(tier.counts)
+            header["tiers"].append({"width": tier.width, "length": len(tier),
+                                    "members": members, "lengths": [len(tier.counts[m]) for m in members]})
+            body += [tier.slots.tobytes(), tier.samples.tobytes(), tier.total.tobytes()]
+            body += [tier.counts[m].tobytes() for m in members]
+        return json.dumps(header).encode("utf-8") + b"\n" + b"".join(body)
+
+    def load_bytes(self, content: bytes):
+        head, _, body = content.partition(b"\n")
+        header = json.loads(head)
+        if header.get("version") not in (1, FORMAT_VERSION):
+            raise ValueError(f"Unknown time series format {header.get('version')}")
+        swap = header["byteorder"] != sys.byteorder
+        # 1 버전은 samples, counts 를 16 bit 로 저장
+        small = "H" if header["version"] == 1 else "I"
+        pos = 0
+
+        def read(typecode: str, n: int) -> array:
+            nonlocal pos
+            arr = array(typecode)
+            size = arr.itemsize * n
+            arr.frombytes(body[pos:pos + size])
+            pos += size
+            if swap:
+                arr.byteswap()
+            return arr if typecode == "I" else array("I", arr)
+
+        tiers = []
+        for meta in header["tiers"]:
+            tier = Tier(meta["width"])
+            tier.slots = read("I", meta["length"])
+            tier.samples = read(small, meta["length"])
+            tier.total = read("I", meta["length"])
+            for m, n in zip(meta["members"], meta["lengths"]):
+                tier.counts[m] = read(small, n)
+            tiers.append(tier)
+        # 기록 간격을 바꾼 경우 예전 원본 기록은 그대로 1시간 단위로 합침
+        if tiers[0].width != self.tiers[0].width:
+            for slot, samples, members in tiers[0].pop_before(2 ** 32 - 1):
+                tiers[1].add(slot - slot % HOUR, samples, members)
+            tiers[0] = Tier(self.tiers[0].width)
+        self.tiers = tiers
+
+
+class Recorder:
+    """클랜별 접속 기록을 data/timeseries/{group_id}.bin 파일에 저장
+
+    interval 초마다 접속중인 클랜원 목록을 기록하고, 파일 기록은 WriteBehind 로 모아서 처리한다.
+    파일 전체를 다시 쓰므로 다른 상태와 달리 긴 debounce 를 가진 writer 를 사용한다.
+    """
+    def __init__(self, dir_data: str, writer: persist.WriteBehind, interval: int = 600,
+                 raw_days: int = 7, hourly_days: int = 90, daily_days: int = 365):
+        self.dir = os.path.join(dir_data, "timeseries")
+        self.writer = writer
+        self.interval = interval
+        self._retention = (raw_days, hourly_days, daily_days)
+        self.series: Dict[int, ClanSeries] = {}
+        if not os.path.exists(self.dir):
+            os.makedirs(self.dir)
+
+    def _path(self, group_id: int) -> str:
+        return os.path.join(self.dir, f"{group_id}.bin")
+
+    def get(self, group_id: int) -> ClanSeries:
+        series = self.series.get(group_id)
+        if series is None:
+            series = self.series[group_id] = ClanSeries(group_id, self.interval, *self._retention)
+            path = self._path(group_id)
+            if os.path.exists(path):
+                try:
+                    with open(path, "rb") as f:
+                        series.load_bytes(f.read())
+                except (ValueError, KeyError) as e:
+                    logger.error(f"Failed to load time series {path}: {e}")
+        return series
+
+    def record(self, group_id: int, online_ids: Iterable[str], t: float = None):
+        series = self.get(group_id)
+        series.record(online_ids, t)
+
+        def snapshot():
+            content = series.to_bytes()
+            return lambda: persist.atomic_write_bytes(self._path(group_id), content)
+        self.writer.mark(f"timeseries_{group_id}", snapshot)
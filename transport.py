@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import time
+import urllib.parse
+from typing import Optional, Tuple
+
+import aiohttp
+import pydest
+from pydest.api import API
+from pydest.manifest import Manifest
+
+import breaker
+
+
+logger = logging.getLogger("transport")
+
+# 엔드포인트별 전체 요청 시간 제한 (URL 에 포함된 문자열, 초), 앞에서부터 먼저 맞는 값 사용
+ENDPOINT_TIMEOUTS: Tuple[Tuple[str, float], ...] = (
+    ("/Members/", 20),
+    ("/Profile/", 10),
+    ("SearchDestinyPlayer", 10),
+    ("GetMembership", 10),
+    ("/Manifest", 20),
+)
+DEFAULT_TIMEOUT = 15
+# manifest 파일처럼 큰 파일은 전체 시간 대신 연결, 읽기 간격만 제한
+DOWNLOAD_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+
+
+def endpoint_timeout(url: str) -> aiohttp.ClientTimeout:
+    for pattern, seconds in ENDPOINT_TIMEOUTS:
+        if pattern in url:
+            return aiohttp.ClientTimeout(total=seconds, sock_connect=5)
+    return aiohttp.ClientTimeout(total=DEFAULT_TIMEOUT, sock_connect=5)
+
+
+def create_session(pool_size: int = 32, dns_ttl: int = 300, keepalive: float = 30) -> aiohttp.ClientSession:
+    """번지 API 요청에 사용하는 공용 세션
+
+    연결을 재사용하고(keep-alive), DNS 조회 결과를 dns_ttl 초 동안 캐시하며 gzip 으로 압축된 응답을 받는다.
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size, ttl_dns_cache=dns_ttl,
+                                     use_dns_cache=True, keepalive_timeout=keepalive, enable_cleanup_closed=True)
+    return aiohttp.ClientSession(connector=connector, headers={"Accept-Encoding": "gzip, deflate"},
+                                 timeout=aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60),
+                                 auto_decompress=True)
+
+
+class BungieAPI(API):
+    """pydest API 에 엔드포인트별 시간 제한, 연결 오류 처리, 장애 차단(circuit breaker)을 추가"""
+    def __init__(self, api_key: str, session: aiohttp.ClientSession, circuit: Optional[breaker.CircuitBreaker] = None):
+        super().__init__(api_key, session)
+        self.breaker = circuit if circuit is not None else breaker.CircuitBreaker()
+
+    async def _get_request(self, url):
+        # 장애로 차단 중이면 기다리지 않고 바로 실패
+        self.breaker.check()
+        headers = {"X-API-KEY": self.api_key}
+        encoded_url = urllib.parse.quote(url, safe=":/?&=,.")
+        st = time.monotonic()
+        try:
+            async with self.session.get(encoded_url, headers=headers, timeout=endpoint_timeout(url)) as r:
+                resp = await r.json(content_type=None)
+        except asyncio.TimeoutError:
+            self.breaker.failure("timeout")
+            raise
+        except (aiohttp.ClientError, ValueError) as e:
+            # 연결 실패, 응답 형식 오류 모두 pydest 와 같은 예외로 전달
+            self.breaker.failure("connection")
+            raise pydest.PydestException(f"Could not connect to Bungie.net ({type(e).__name__})")
+        except BaseException:
+            # 호출한 쪽의 시간 제한(wait_for) 등으로 취소된 경우
+            self.breaker.release(time.monotonic() - st)
+            raise
+        self.breaker.record(resp)
+        return resp
+
+
+def create_destiny(api_key: str, session: aiohttp.ClientSession, circuit: Optional[breaker.CircuitBreaker] = None) -> pydest.Pydest:
+    """공용 세션을 사용하는 pydest 인스턴스 (pydest 가 따로 세션을 만들지 않도록 직접 구성)"""
+    destiny = pydest.Pydest.__new__(pydest.Pydest)
+    destiny._loop = asyncio.get_event_loop()
+    destiny._session = session
+    destiny.api = BungieAPI(api_key, session, circuit)
+    destiny._manifest = Manifest(destiny.api)
+    return destiny
+
+
+async def close_session(session: aiohttp.ClientSession):
+    if session.closed:
+        return
+    await session.close()
+    # SSL 연결이 정리될 시간을 잠깐 줌 (aiohttp 권장 방식)
+    await asyncio.sleep(0.25)